@@ -0,0 +1,391 @@
+import json
+import time
+import hashlib
+import secrets
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+logger = logging.getLogger(__name__)
+
+# Canvas returns 10 items per page unless per_page is given, and caps per_page at 100
+CANVAS_DEFAULT_PER_PAGE = 10
+CANVAS_MAX_PER_PAGE = 100
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` requests per second with bursts of up to `burst` requests.
+    """
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class LeakyBucket:
+    """
+    Canvas-style throttle: every request adds its cost to a bucket that drains at leak_rate
+    units per second; requests are refused while the bucket is over quota.
+    """
+    def __init__(self, quota: float = 700.0, leak_rate: float = 10.0):
+        self.quota = quota
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _drain(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated) * self.leak_rate)
+        self.updated = now
+
+    def exhausted(self) -> bool:
+        with self._lock:
+            self._drain()
+            return self.level >= self.quota
+
+    def charge(self, cost: float) -> float:
+        """
+        Adds a request's cost and returns the remaining quota.
+        """
+        with self._lock:
+            self._drain()
+            self.level += cost
+            return max(0.0, self.quota - self.level)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so client-side connection pooling behaves as it would against the real APIs
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment instead of stalling on Nagle + delayed ACK
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+    server_version = 'FakeAPI/1.0'
+    app = None
+
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, payload = self.app.dispatch(method, parsed.path, parse_qs(parsed.query), self.headers, body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer:
+    """
+    Local HTTP server standing in for a remote API, with a fixed per-request latency and an
+    optional rate limit. Subclasses implement route(); every request is counted per route.
+    """
+    rate_limit_status = 429
+
+    def __init__(self, latency: float = 0.0, rate_limit: float = None, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.request_counts = Counter()
+        self.rate_limited = 0
+        self._counts_lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'app': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counts(self):
+        with self._counts_lock:
+            self.request_counts = Counter()
+            self.rate_limited = 0
+
+    def dispatch(self, method: str, path: str, query: dict, headers, body: bytes):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.is_throttled():
+            with self._counts_lock:
+                self.rate_limited += 1
+            return self.throttled_response()
+        try:
+            route, status, response_headers, payload = self.route(method, path, query, headers, body)
+        except Exception as e:
+            logger.exception(f"Fake server error on {method} {path}")
+            return 500, {'Content-Type': 'text/plain'}, str(e).encode('utf-8')
+        response_headers.update(self.rate_limit_headers())
+        with self._counts_lock:
+            self.request_counts[route] += 1
+        return status, response_headers, payload
+
+    def is_throttled(self) -> bool:
+        return bool(self.limiter) and not self.limiter.allow()
+
+    def throttled_response(self):
+        return self.rate_limit_status, {'Retry-After': '1', 'Content-Type': 'text/plain'}, b'Rate Limit Exceeded'
+
+    def rate_limit_headers(self) -> dict:
+        return {}
+
+    def route(self, method: str, path: str, query: dict, headers, body: bytes):
+        raise NotImplementedError
+
+    @staticmethod
+    def json_response(route: str, data, status: int = 200, headers: dict = None):
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        response_headers = {'Content-Type': 'application/json; charset=utf-8'}
+        response_headers.update(headers or {})
+        return route, status, response_headers, payload
+
+    @staticmethod
+    def not_found(path: str):
+        return 'not_found', 404, {'Content-Type': 'text/plain'}, f"No route for {path}".encode('utf-8')
+
+
+class FakeCanvasServer(FakeServer):
+    """
+    Serves the Canvas REST endpoints the sync reads (courses and assignments, paginated with
+    Link headers and revalidated with ETags) plus the /api/graphql queries of GraphQLCanvasClient.
+    Canvas signals throttling with 403 Forbidden (Rate Limit Exceeded). With a `quota`, the server
+    also emulates Canvas' leaky-bucket throttle and its X-Request-Cost / X-Rate-Limit-Remaining headers.
+    """
+    rate_limit_status = 403
+
+    def __init__(self, account, quota: float = None, leak_rate: float = 10.0, request_cost: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.account = account
+        self.bucket = LeakyBucket(quota, leak_rate) if quota else None
+        self.request_cost = request_cost
+
+    def is_throttled(self) -> bool:
+        return super().is_throttled() or bool(self.bucket and self.bucket.exhausted())
+
+    def throttled_response(self):
+        headers = {'Content-Type': 'text/plain'}
+        if self.bucket:
+            headers['X-Rate-Limit-Remaining'] = '0.0'
+        return self.rate_limit_status, headers, b'403 Forbidden (Rate Limit Exceeded)'
+
+    def rate_limit_headers(self) -> dict:
+        if not self.bucket:
+            return {}
+        remaining = self.bucket.charge(self.request_cost)
+        return {'X-Request-Cost': f"{self.request_cost:.4f}", 'X-Rate-Limit-Remaining': f"{remaining:.4f}"}
+
+    def route(self, method, path, query, headers, body):
+        parts = path.strip('/').split('/')
+        if method == 'POST' and path == '/api/graphql':
+            return self._graphql(json.loads(body or b'{}'))
+        if method == 'GET' and path == '/api/v1/users/self':
+            return self.json_response('users', {'id': self.account.user_id, 'name': 'Synthetic Student'})
+        if method == 'GET' and parts[:3] == ['api', 'v1', 'courses']:
+            if len(parts) == 3:
+                return self._paginated('courses', path, query, headers, self.account.courses)
+            if len(parts) == 5 and parts[4] == 'assignments':
+                assignments = self.account.assignments.get(int(parts[3]))
+                if assignments is None:
+                    return self.json_response('assignments', {'errors': [{'message': 'The specified resource does not exist.'}]}, 404)
+                if 'submission' not in query.get('include[]', []):
+                    # Like Canvas, the student's own submission is only embedded on request
+                    assignments = [{key: value for key, value in assignment.items() if key != 'submission'} for assignment in assignments]
+                return self._paginated('assignments', path, query, headers, assignments)
+        return self.not_found(path)
+
+    def _paginated(self, route: str, path: str, query: dict, headers, items: list):
+        per_page = min(int(query.get('per_page', [CANVAS_DEFAULT_PER_PAGE])[0]), CANVAS_MAX_PER_PAGE)
+        page = int(query.get('page', ['1'])[0])
+        last_page = max(1, -(-len(items) // per_page))
+        page_items = items[(page - 1) * per_page:page * per_page]
+
+        base_query = {key: values for key, values in query.items() if key != 'page'}
+        base_query['per_page'] = [per_page]
+
+        def link(number, rel):
+            return f'<{self.url}{path}?{urlencode(dict(base_query, page=[number]), doseq=True)}>; rel="{rel}"'
+
+        links = [link(page, 'current'), link(1, 'first'), link(last_page, 'last')]
+        if page < last_page:
+            links.append(link(page + 1, 'next'))
+        if page > 1:
+            links.append(link(page - 1, 'prev'))
+
+        payload = json.dumps(page_items, separators=(',', ':')).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+        response_headers = {'Link': ', '.join(links), 'ETag': etag}
+        if headers.get('If-None-Match') == etag:
+            return route, 304, response_headers, b''
+        response_headers['Content-Type'] = 'application/json; charset=utf-8'
+        return route, 200, response_headers, payload
+
+    def _graphql(self, request: dict):
+        query = request.get('query', '')
+        variables = request.get('variables') or {}
+        first = int(variables.get('first', CANVAS_MAX_PER_PAGE))
+        if 'allCourses' in query:
+            courses = []
+            for course in self.account.courses:
+                node = {'_id': str(course['id']), 'name': course['name'], 'state': course['workflow_state']}
+                node['enrollmentsConnection'] = {'nodes': [
+                    {'type': enrollment['role'], 'state': enrollment['enrollment_state']}
+                    for enrollment in course.get('enrollments', []) if str(enrollment['user_id']) == str(variables.get('userId'))
+                ]}
+                node['assignmentsConnection'] = self._connection(course['id'], first, None)
+                courses.append(node)
+            return self.json_response('graphql', {'data': {'allCourses': courses}})
+        connection = self._connection(int(variables['courseId']), first, variables.get('after'))
+        return self.json_response('graphql', {'data': {'course': {'assignmentsConnection': connection}}})
+
+    def _connection(self, course_id: int, first: int, after: str):
+        assignments = self.account.assignments.get(course_id, [])
+        start = int(after) if after else 0
+        page = assignments[start:start + first]
+        end = start + len(page)
+        return {
+            'pageInfo': {'hasNextPage': end < len(assignments), 'endCursor': str(end)},
+            'nodes': [_graphql_assignment(assignment) for assignment in page],
+        }
+
+
+def _graphql_assignment(assignment: dict) -> dict:
+    submission = assignment.get('submission')
+    return {
+        '_id': str(assignment['id']),
+        'name': assignment['name'],
+        'dueAt': assignment['due_at'],
+        'updatedAt': assignment['updated_at'],
+        'htmlUrl': assignment['html_url'],
+        'description': assignment['description'],
+        'submissionTypes': [t.upper() for t in assignment['submission_types']],
+        'submissionsConnection': {'nodes': [{'state': submission['workflow_state'], 'submittedAt': submission['submitted_at']}] if submission else []},
+    }
+
+
+class FakeTickTickServer(FakeServer):
+    """
+    Serves the TickTick v2 endpoints used by ticktick-py and TickTickClient: sign-in, settings,
+    the batch/check state download and the batch/task, batch/project and batch/projectGroup writes.
+    batch/check/{checkpoint} with a non-zero checkpoint returns only the tasks changed since then.
+    """
+    def __init__(self, lists: list = None, **kwargs):
+        super().__init__(**kwargs)
+        self.inbox_id = 'inbox' + secrets.token_hex(8)
+        self.projects = {}
+        self.project_groups = {}
+        self.tasks = {}
+        # Checkpoint bookkeeping: a version counter and the version each task last changed at
+        self.version = 1
+        self.task_versions = {}
+        self.deleted_tasks = {}
+        self._state_lock = threading.Lock()
+        for name in lists or []:
+            project_id = secrets.token_hex(12)
+            self.projects[project_id] = {'id': project_id, 'name': name, 'groupId': None, 'closed': None}
+
+    def route(self, method, path, query, headers, body):
+        if not path.startswith('/api/v2/'):
+            return self.not_found(path)
+        endpoint = path[len('/api/v2/'):]
+        if method == 'POST' and endpoint == 'user/signin':
+            return self.json_response('signin', {'token': secrets.token_hex(16), 'inboxId': self.inbox_id})
+        if method == 'GET' and endpoint == 'user/preferences/settings':
+            return self.json_response('settings', {'id': 'benchmark-user', 'timeZone': 'UTC'})
+        if method == 'GET' and endpoint.startswith('batch/check/'):
+            return self.json_response('batch_check', self._state(int(endpoint[len('batch/check/'):] or 0)))
+        if method == 'POST' and endpoint == 'batch/task':
+            return self.json_response('batch_task', self._apply(self.tasks, json.loads(body)))
+        if method == 'POST' and endpoint == 'batch/project':
+            return self.json_response('batch_project', self._apply(self.projects, json.loads(body)))
+        if method == 'POST' and endpoint == 'batch/projectGroup':
+            return self.json_response('batch_project_group', self._apply(self.project_groups, json.loads(body)))
+        return self.not_found(path)
+
+    def _state(self, checkpoint: int = 0) -> dict:
+        with self._state_lock:
+            if checkpoint:
+                task_bean = {
+                    'update': [task for task_id, task in self.tasks.items() if self.task_versions.get(task_id, 0) > checkpoint],
+                    'delete': [{'taskId': task_id} for task_id, version in self.deleted_tasks.items() if version > checkpoint],
+                }
+            else:
+                task_bean = {'update': [task for task in self.tasks.values() if not task.get('status')]}
+            return {
+                'checkPoint': self.version,
+                'inboxId': self.inbox_id,
+                'projectGroups': list(self.project_groups.values()),
+                'projectProfiles': list(self.projects.values()),
+                'syncTaskBean': task_bean,
+                'tags': [],
+            }
+
+    def _apply(self, store: dict, payload: dict) -> dict:
+        id2etag = {}
+        id2error = {}
+        with self._state_lock:
+            self.version += 1
+            versions = self.task_versions if store is self.tasks else {}
+            deleted = self.deleted_tasks if store is self.tasks else {}
+            for item in payload.get('add') or []:
+                item_id = item.get('id') or secrets.token_hex(12)
+                item['id'] = item_id
+                store[item_id] = item
+                versions[item_id] = self.version
+                id2etag[item_id] = secrets.token_hex(4)
+            for item in payload.get('update') or []:
+                if item.get('id') not in store:
+                    id2error[item.get('id')] = 'NOT_EXISTED'
+                    continue
+                store[item['id']] = item
+                versions[item['id']] = self.version
+                id2etag[item['id']] = secrets.token_hex(4)
+            for item in payload.get('delete') or []:
+                item_id = (item.get('taskId') or item.get('id')) if isinstance(item, dict) else item
+                if store.pop(item_id, None) is not None:
+                    deleted[item_id] = self.version
+        return {'id2etag': id2etag, 'id2error': id2error}
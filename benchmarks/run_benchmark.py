@@ -0,0 +1,304 @@
+"""
+Offline sync benchmark. Starts local fake Canvas and TickTick servers, generates a synthetic
+account and times SyncManager.run_sync end to end and per phase over three scenarios:
+
+  cold     empty TickTick account and sync index, every assignment is created
+  warm     nothing changed since the previous run
+  changed  a fraction of the assignments was edited on Canvas and a few were submitted or deleted
+
+Usage:
+    python -m benchmarks.run_benchmark --courses 50 --assignments 5000 --latency-ms 20
+    python -m benchmarks.run_benchmark --baseline benchmarks/results/previous.json
+"""
+import os
+import sys
+import json
+import time
+import yaml
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import warnings
+import subprocess
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import requests
+
+from config_manager import DEFAULT_CONFIG, ConfigManager
+from sync_index import SyncIndex
+from metrics import Metrics
+from clients.http_cache import HTTPCache
+from clients.request_scheduler import RequestScheduler, host_key
+from clients.canvas_probe import CanvasChangeProbe
+from sync_manager import SyncManager, is_canvas_unchanged
+from sync_plan import SyncPlan
+from sync_journal import SyncJournal
+from benchmarks.synthetic import SyntheticAccount
+from benchmarks.fake_servers import FakeCanvasServer, FakeTickTickServer
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_LIST = 'Benchmark Coursework'
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def build_scheduler(config_manager, canvas_url: str, ticktick_url: str) -> RequestScheduler:
+    """
+    Same per-host pacing as main.py, keyed to the fake servers' addresses.
+    """
+    scheduler = RequestScheduler(max_retries=config_manager.get_max_request_retries(), default_max_concurrency=config_manager.get_canvas_max_concurrency())
+    scheduler.configure_host(host_key(canvas_url), rate=config_manager.get_canvas_rate_limit(), max_concurrency=config_manager.get_canvas_max_concurrency())
+    scheduler.configure_host(host_key(ticktick_url), rate=config_manager.get_ticktick_rate_limit(), max_concurrency=2)
+    return scheduler
+
+
+def build_ticktick_client(base_url: str, metrics: Metrics, scheduler: RequestScheduler, session_path: str = None):
+    """
+    Logs a TickTickClient in against the fake TickTick server. ticktick-py hard-codes its API
+    URLs as class attributes, so they are overridden on a subclass; the OAuth manager is only
+    needed for its requests session. With session_path, the cached session and delta sync are used.
+    """
+    from clients.ticktick_client import TickTickClient
+    from clients.ticktick_session import CachedTickTickClient, TickTickSessionStore
+
+    class LocalTickTickClient(CachedTickTickClient):
+        BASE_URL = base_url + '/api/v2/'
+        OPEN_API_BASE_URL = base_url
+        INITIAL_BATCH_URL = BASE_URL + 'batch/check/0'
+
+    oauth = SimpleNamespace(session=requests.Session(), access_token_info=None)
+    client = TickTickClient.__new__(TickTickClient)
+    client.metrics = metrics
+    client.scheduler = scheduler
+    client._state_lock = threading.Lock()
+    client._instrument_session(oauth.session)
+    with metrics.phase('ticktick_login'):
+        session_store = TickTickSessionStore(session_path) if session_path else None
+        client.client = LocalTickTickClient('benchmark', 'benchmark', oauth, session_store)
+    return client
+
+
+def build_canvas_client(backend: str, base_url: str, config_manager, metrics: Metrics, scheduler: RequestScheduler, http_cache_path: str = None):
+    if backend == 'async':
+        from clients.async_canvas_client import AsyncCanvasClient
+        return AsyncCanvasClient(base_url, 'benchmark-token', max_concurrency=config_manager.get_canvas_max_concurrency(), metrics=metrics, scheduler=scheduler)
+    if backend == 'graphql':
+        from clients.graphql_canvas_client import GraphQLCanvasClient
+        return GraphQLCanvasClient(base_url, 'benchmark-token', metrics=metrics, scheduler=scheduler)
+    from clients.canvas_client import CanvasClient
+    http_cache = HTTPCache(http_cache_path) if http_cache_path else None
+    return CanvasClient(base_url, 'benchmark-token', http_cache=http_cache, metrics=metrics, scheduler=scheduler)
+
+
+def write_config(path: str, overrides: dict = None):
+    config = dict(DEFAULT_CONFIG)
+    config['courses_to_monitor'] = []
+    config['ticktick_list_mappings'] = {'default': BENCHMARK_LIST}
+    config.update(overrides or {})
+    with open(path, 'w') as f:
+        yaml.dump(config, f, default_flow_style=False)
+
+
+def run_scenario(name: str, args, canvas_server, ticktick_server, workdir: str) -> dict:
+    canvas_server.reset_counts()
+    ticktick_server.reset_counts()
+    metrics = Metrics()
+
+    start = time.perf_counter()
+    config_manager = ConfigManager(os.path.join(workdir, 'config.yaml'))
+    scheduler = build_scheduler(config_manager, canvas_server.url, ticktick_server.url)
+    sync_index = SyncIndex(os.path.join(workdir, 'sync_index.db'))
+    change_fingerprint = None
+    if args.precheck:
+        probe = CanvasChangeProbe(canvas_server.url, 'benchmark-token', metrics=metrics, scheduler=scheduler)
+        change_fingerprint = probe.fingerprint(config_manager.is_course_monitored, salt=config_manager.get_fingerprint())
+        if is_canvas_unchanged(sync_index, change_fingerprint):
+            sync_index.close()
+            return scenario_result(name, time.perf_counter() - start, metrics, canvas_server, ticktick_server, None)
+    ticktick_client = build_ticktick_client(
+        ticktick_server.url, metrics, scheduler,
+        os.path.join(workdir, 'ticktick_session.json') if args.ticktick_session else None
+    )
+    canvas_client = build_canvas_client(
+        args.backend, canvas_server.url, config_manager, metrics, scheduler,
+        os.path.join(workdir, 'http_cache.db') if args.http_cache else None
+    )
+    manager = SyncManager(canvas_client, ticktick_client, config_manager, sync_index=sync_index, metrics=metrics,
+                          journal=SyncJournal(os.path.join(workdir, 'sync_journal.jsonl')))
+    try:
+        if args.plan_apply:
+            # Plan, save, reload and apply, as --plan and --apply would in two runs
+            plan_path = os.path.join(workdir, 'sync_plan.json')
+            manager.plan_sync(incremental=args.incremental).save(plan_path)
+            stats = manager.apply_plan(SyncPlan.load(plan_path), plan_path=plan_path)
+        else:
+            stats = manager.run_sync(incremental=args.incremental, change_fingerprint=change_fingerprint)
+    finally:
+        sync_index.close()
+    return scenario_result(name, time.perf_counter() - start, metrics, canvas_server, ticktick_server, stats)
+
+
+def scenario_result(name: str, total: float, metrics: Metrics, canvas_server, ticktick_server, stats: dict) -> dict:
+    """
+    stats is None for a run that stopped at the --precheck probe.
+    """
+    report = metrics.as_dict()
+    phases = report['phases']
+    if 'run_sync' in phases:
+        measured = sum(phase['seconds'] for name, phase in phases.items() if name not in ('run_sync', 'ticktick_login', 'canvas_probe'))
+        phases['other'] = {'seconds': round(phases['run_sync']['seconds'] - measured, 4), 'calls': 1}
+
+    result = {
+        'name': name,
+        'total_seconds': round(total, 4),
+        'phases': phases,
+        'requests': {
+            'canvas': dict(canvas_server.request_counts),
+            'ticktick': dict(ticktick_server.request_counts),
+        },
+        'rate_limited': {'canvas': canvas_server.rate_limited, 'ticktick': ticktick_server.rate_limited},
+        'endpoints': report['endpoints'],
+        'retries': report['retries'],
+        'sync_stats': stats,
+    }
+    logger.warning(
+        f"{name}: {total:.2f}s, {sum(canvas_server.request_counts.values())} Canvas / "
+        f"{sum(ticktick_server.request_counts.values())} TickTick requests, stats {stats}"
+    )
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """
+    Returns a description of every scenario that got slower than the baseline by more than
+    max_regression (a fraction), or now sends more requests than the baseline did.
+    """
+    regressions = []
+    baseline_scenarios = {scenario['name']: scenario for scenario in baseline.get('scenarios', [])}
+    for scenario in results['scenarios']:
+        previous = baseline_scenarios.get(scenario['name'])
+        if not previous:
+            continue
+        ratio = scenario['total_seconds'] / previous['total_seconds'] if previous['total_seconds'] else 1.0
+        print(f"{scenario['name']:>8}: {previous['total_seconds']:.3f}s -> {scenario['total_seconds']:.3f}s ({ratio:.2f}x)")
+        if ratio > 1 + max_regression:
+            regressions.append(f"{scenario['name']} is {ratio:.2f}x slower than the baseline")
+        for service in ('canvas', 'ticktick'):
+            before = sum(previous['requests'][service].values())
+            after = sum(scenario['requests'][service].values())
+            if after > before:
+                regressions.append(f"{scenario['name']} sends {after} {service} requests (baseline: {before})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark run_sync against local fake Canvas and TickTick servers.")
+    parser.add_argument('--courses', type=int, default=20, help="Number of synthetic courses (up to ~1,000).")
+    parser.add_argument('--assignments', type=int, default=1000, help="Total number of synthetic assignments (up to ~100k).")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic account.")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Added latency per request on both fake servers.")
+    parser.add_argument('--canvas-rate-limit', type=float, default=None, help="Canvas requests per second before 403 throttling.")
+    parser.add_argument('--canvas-quota', type=float, default=None, help="Emulate Canvas' leaky-bucket throttle with this quota (Canvas uses 700).")
+    parser.add_argument('--canvas-request-cost', type=float, default=1.0, help="Quota units charged per Canvas request.")
+    parser.add_argument('--canvas-leak-rate', type=float, default=10.0, help="Quota units the Canvas bucket drains per second.")
+    parser.add_argument('--ticktick-rate-limit', type=float, default=None, help="TickTick requests per second before 429 throttling.")
+    parser.add_argument('--backend', choices=['rest', 'async', 'graphql'], default='rest', help="Canvas fetch backend to benchmark.")
+    parser.add_argument('--http-cache', action='store_true', help="Enable the conditional-request cache (rest backend).")
+    parser.add_argument('--incremental', action='store_true', help="Run the syncs with incremental=True.")
+    parser.add_argument('--precheck', action='store_true', help="Probe Canvas first and skip the sync when nothing changed since the last clean run.")
+    parser.add_argument('--plan-apply', action='store_true', help="Run each sync as a saved plan (plan_sync) followed by apply_plan.")
+    parser.add_argument('--ticktick-session', action='store_true', help="Reuse the cached TickTick session and download only state changes.")
+    parser.add_argument('--change-fraction', type=float, default=0.05, help="Fraction of assignments edited before the 'changed' scenario.")
+    parser.add_argument('--remove-fraction', type=float, default=0.01, help="Fraction of assignments deleted before the 'changed' scenario.")
+    parser.add_argument('--submit-fraction', type=float, default=0.02, help="Fraction of open assignments submitted before the 'changed' scenario.")
+    parser.add_argument('--output', help="Path of the JSON results file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument('--baseline', help="Previous results file to compare against.")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Allowed slowdown against the baseline before failing (fraction).")
+    parser.add_argument('--log-level', default='WARNING', help="Log level for the sync itself.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # The fake servers are plain HTTP on localhost
+    warnings.filterwarnings('ignore', message='Canvas may respond unexpectedly')
+
+    account = SyntheticAccount(args.courses, args.assignments, seed=args.seed)
+    logger.warning(f"Generated {len(account.courses)} courses with {account.assignment_count} assignments.")
+
+    latency = args.latency_ms / 1000.0
+    canvas_server = FakeCanvasServer(
+        account, quota=args.canvas_quota, leak_rate=args.canvas_leak_rate, request_cost=args.canvas_request_cost,
+        latency=latency, rate_limit=args.canvas_rate_limit
+    )
+    ticktick_server = FakeTickTickServer(lists=[BENCHMARK_LIST], latency=latency, rate_limit=args.ticktick_rate_limit)
+
+    results = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {
+            'courses': args.courses,
+            'assignments': account.assignment_count,
+            'seed': args.seed,
+            'latency_ms': args.latency_ms,
+            'canvas_rate_limit': args.canvas_rate_limit,
+            'canvas_quota': args.canvas_quota,
+            'ticktick_rate_limit': args.ticktick_rate_limit,
+            'backend': args.backend,
+            'http_cache': args.http_cache,
+            'incremental': args.incremental,
+            'ticktick_session': args.ticktick_session,
+            'precheck': args.precheck,
+            'plan_apply': args.plan_apply,
+            'change_fraction': args.change_fraction,
+            'submit_fraction': args.submit_fraction,
+            'remove_fraction': args.remove_fraction,
+        },
+        'scenarios': [],
+    }
+
+    with canvas_server, ticktick_server, tempfile.TemporaryDirectory() as workdir:
+        write_config(os.path.join(workdir, 'config.yaml'))
+        results['scenarios'].append(run_scenario('cold', args, canvas_server, ticktick_server, workdir))
+        results['scenarios'].append(run_scenario('warm', args, canvas_server, ticktick_server, workdir))
+        account.mutate(args.change_fraction)
+        account.submit(args.submit_fraction)
+        account.remove(args.remove_fraction)
+        results['scenarios'].append(run_scenario('changed', args, canvas_server, ticktick_server, workdir))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+# Mix of titles that exercise the default priority and tag keywords
+TITLE_TEMPLATES = [
+    'Homework {n}',
+    'Quiz {n}',
+    'Reading Response {n}',
+    'Lab {n} Report',
+    'Problem Set {n}',
+    'Project Milestone {n}',
+    'Discussion Post {n}',
+    'Optional Extra Credit {n}',
+    'Midterm Exam {n}',
+    'Paper Draft {n}',
+]
+
+DESCRIPTION_PARAGRAPHS = [
+    '<p>Complete the exercises from <b>chapter {n}</b> and show all of your work.</p>',
+    '<p>Read the assigned sections and answer the questions in the <a href="https://example.edu/files/{n}">handout</a>.</p>',
+    '<ul><li>Submit a single PDF</li><li>Include your name and section</li><li>Late work loses 10% per day</li></ul>',
+    '<p>Refer to the rubric&nbsp;for grading details. Questions go on the course forum&mdash;not by email.</p>',
+    '<table><tr><td>Part A</td><td>40 pts</td></tr><tr><td>Part B</td><td>60 pts</td></tr></table>',
+    '<pre>def solve(n):\n    return n * {n}\n</pre>',
+]
+
+SUBMISSION_TYPES = [['online_upload'], ['online_text_entry'], ['online_quiz'], ['online_upload', 'online_text_entry']]
+
+
+def _iso(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class SyntheticAccount:
+    """
+    A generated Canvas student account: `courses` (REST course objects) and `assignments`
+    (course ID -> list of REST assignment objects), deterministic for a given seed.
+    """
+    def __init__(self, num_courses: int, num_assignments: int, seed: int = 0, base_url: str = 'https://canvas.example.edu'):
+        self.random = random.Random(seed)
+        self.base_url = base_url
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.user_id = 1
+        self.courses = []
+        self.assignments = {}
+        self._next_assignment_id = 1
+
+        for index in range(num_courses):
+            course_id = 1000 + index
+            self.courses.append({
+                'id': course_id,
+                'name': f"BENCH{100 + index}: Synthetic Course {index}",
+                'course_code': f"BENCH{100 + index}",
+                'workflow_state': 'available',
+                'enrollment_term_id': 1,
+                'enrollments': [{'type': 'student', 'role': 'StudentEnrollment', 'enrollment_state': 'active', 'user_id': self.user_id}],
+            })
+            self.assignments[course_id] = []
+
+        # Spread the assignments over the courses, leaving some courses with far more than others
+        course_ids = list(self.assignments)
+        weights = [self.random.uniform(0.2, 1.8) for _ in course_ids]
+        for course_id in self.random.choices(course_ids, weights=weights, k=num_assignments) if course_ids else []:
+            self.assignments[course_id].append(self._new_assignment(course_id))
+
+    @property
+    def assignment_count(self) -> int:
+        return sum(len(assignments) for assignments in self.assignments.values())
+
+    def _description(self, n: int) -> str:
+        count = self.random.randint(1, 4)
+        return ''.join(self.random.choice(DESCRIPTION_PARAGRAPHS).format(n=n) for _ in range(count))
+
+    def _new_assignment(self, course_id: int) -> dict:
+        assignment_id = self._next_assignment_id
+        self._next_assignment_id += 1
+        n = len(self.assignments[course_id]) + 1
+
+        roll = self.random.random()
+        due_at = _iso(self.now + timedelta(days=self.random.randint(-20, 120), hours=self.random.randint(0, 23)))
+        submission = None
+        if roll < 0.05:
+            # Ungraded or undated items are skipped by the sync
+            due_at = None
+        elif roll < 0.15:
+            submission = {'workflow_state': 'submitted', 'submitted_at': _iso(self.now - timedelta(days=1))}
+
+        return {
+            'id': assignment_id,
+            'course_id': course_id,
+            'name': self.random.choice(TITLE_TEMPLATES).format(n=n),
+            'description': self._description(n),
+            'due_at': due_at,
+            'updated_at': _iso(self.now - timedelta(days=self.random.randint(1, 60))),
+            'html_url': f"{self.base_url}/courses/{course_id}/assignments/{assignment_id}",
+            'submission_types': self.random.choice(SUBMISSION_TYPES),
+            'has_submitted_submissions': submission is not None,
+            'submission': submission,
+            'published': True,
+        }
+
+    def submit(self, fraction: float) -> int:
+        """
+        Turns in a random fraction of the open assignments, as the student does between syncs.
+        Submitting does not change an assignment's updated_at. Returns the number submitted.
+        """
+        open_assignments = [
+            assignment for assignments in self.assignments.values() for assignment in assignments
+            if assignment['due_at'] and not assignment['submission']
+        ]
+        submitted = self.random.sample(open_assignments, int(len(open_assignments) * fraction))
+        submitted_at = _iso(datetime.now(timezone.utc).replace(microsecond=0))
+        for assignment in submitted:
+            assignment['submission'] = {'workflow_state': 'submitted', 'submitted_at': submitted_at}
+        return len(submitted)
+
+    def mutate(self, fraction: float) -> int:
+        """
+        Edits the due date or description of a random fraction of the assignments, as
+        instructors do between syncs, and bumps their updated_at. Returns the number changed.
+        """
+        all_assignments = [assignment for assignments in self.assignments.values() for assignment in assignments]
+        changed = self.random.sample(all_assignments, int(len(all_assignments) * fraction))
+        updated_at = _iso(datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=1))
+        for assignment in changed:
+            if assignment['due_at'] and self.random.random() < 0.5:
+                due = datetime.fromisoformat(assignment['due_at'].replace('Z', '+00:00'))
+                assignment['due_at'] = _iso(due + timedelta(days=1))
+            else:
+                assignment['description'] += '<p><em>Updated:</em> see the revised instructions.</p>'
+            assignment['updated_at'] = updated_at
+        return len(changed)
+
+    def remove(self, fraction: float) -> int:
+        """
+        Deletes a random fraction of the assignments, as instructors do when they delete or
+        unpublish one. Returns the number removed.
+        """
+        all_assignments = [assignment for assignments in self.assignments.values() for assignment in assignments]
+        removed = {id(assignment) for assignment in self.random.sample(all_assignments, int(len(all_assignments) * fraction))}
+        for course_id, assignments in self.assignments.items():
+            self.assignments[course_id] = [assignment for assignment in assignments if id(assignment) not in removed]
+        return len(removed)
@@ -0,0 +1,247 @@
+import re
+import json
+import time
+import queue
+import asyncio
+import threading
+import logging
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+import aiohttp
+
+from metrics import Metrics
+from clients.request_scheduler import RequestScheduler, is_throttled
+from clients.canvas_client import (
+    ASSIGNMENT_INCLUDES,
+    ASSIGNMENTS_PER_PAGE,
+    build_cookie_headers,
+    to_assignment_records,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+# Keep idle connections around between pages instead of reconnecting (and re-handshaking TLS)
+KEEPALIVE_TIMEOUT = 30
+
+
+class AsyncCanvasClient:
+    """
+    asyncio/aiohttp Canvas client that fetches the assignments of all courses concurrently.
+    Exposes the same blocking interface as CanvasClient so SyncManager can use either one.
+    """
+    def __init__(self, api_url: str, api_token: str, session_cookie: str = None, state_file: str = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 metrics: Metrics = None, scheduler: RequestScheduler = None):
+        self.base_url = api_url.rstrip('/') + '/api/v1/'
+        self.max_concurrency = max(1, max_concurrency)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler(default_max_concurrency=self.max_concurrency)
+        # Courses whose assignments could not be fetched completely since get_active_courses()
+        self.failed_courses = set()
+
+        self.headers = build_cookie_headers(session_cookie, state_file)
+        if self.headers:
+            logger.info("Injected browser cookies for async Canvas authentication.")
+        else:
+            self.headers = {'Authorization': f"Bearer {api_token}"}
+            logger.info("Initialized async Canvas client with API token.")
+
+    def _new_session(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=KEEPALIVE_TIMEOUT)
+        return aiohttp.ClientSession(headers=self.headers, connector=connector)
+
+    async def _get_page(self, session, semaphore, url: str, params: dict = None):
+        """
+        Fetches one page through the request scheduler, which paces requests to the host
+        and retries throttled or failed ones with backoff.
+        """
+        host = self.scheduler.host(url)
+        attempt = 0
+        async with semaphore:
+            while True:
+                await host.acquire_async()
+                start = time.perf_counter()
+                try:
+                    async with session.get(url, params=params) as response:
+                        body = await response.read()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    host.release()
+                    delay = self.scheduler.retry_delay('GET', attempt, error=True)
+                    if delay is None:
+                        raise
+                    reason = f"failed ({e.__class__.__name__})"
+                except BaseException:
+                    # Payload errors and cancellation must not keep the slot taken
+                    host.release()
+                    raise
+                else:
+                    self.metrics.record_request('canvas', 'GET', str(response.url), response.status, time.perf_counter() - start, bytes_received=len(body))
+                    throttled = is_throttled(response.status, body)
+                    host.release(response.status, response.headers, throttled)
+                    delay = self.scheduler.retry_delay('GET', attempt, response.status, response.headers, throttled)
+                    if delay is None:
+                        response.raise_for_status()
+                        return json.loads(body), response.links
+                    reason = 'throttled' if throttled else f"returned {response.status}"
+                logger.warning(f"GET {url} {reason}; retrying in {delay:.1f}s (attempt {attempt + 1}/{self.scheduler.max_retries})")
+                self.metrics.record_retry('canvas', reason)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _get_items(self, session, semaphore, url: str, params: dict = None, transform=None):
+        items, links = await self._get_page(session, semaphore, url, params)
+        return (transform(items) if transform is not None else items), links
+
+    async def _get_paginated(self, session, semaphore, path: str, params: dict, transform=None) -> list:
+        """
+        Fetches every page of a Canvas list endpoint. When the first page advertises a numbered
+        `last` link, the remaining pages are requested concurrently instead of one after another.
+        transform, if given, turns each page's JSON into the items to keep, so the raw pages
+        are not held until the last one arrives.
+        """
+        params = dict(params, per_page=ASSIGNMENTS_PER_PAGE)
+        items, links = await self._get_items(session, semaphore, self.base_url + path, params, transform)
+
+        last_page = _page_number(links.get('last'))
+        if last_page and last_page > 1:
+            pages = await asyncio.gather(*[
+                self._get_items(session, semaphore, self.base_url + path, dict(params, page=page), transform)
+                for page in range(2, last_page + 1)
+            ])
+            for page_items, _ in pages:
+                items.extend(page_items)
+            return items
+
+        # No page count available (e.g. bookmark-style pagination): follow the next links
+        next_link = links.get('next')
+        while next_link:
+            page_items, links = await self._get_items(session, semaphore, str(next_link['url']), transform=transform)
+            items.extend(page_items)
+            next_link = links.get('next')
+        return items
+
+    async def _fetch_active_courses(self, session, semaphore) -> list:
+        courses = await self._get_paginated(session, semaphore, 'courses', {
+            'enrollment_type': 'student',
+            'enrollment_state': 'active',
+        })
+        # Sometimes courses are returned without names or properties
+        return [SimpleNamespace(**course) for course in courses if 'name' in course]
+
+    async def _fetch_assignments(self, session, semaphore, course, updated_since: str = None) -> list:
+        try:
+            return await self._get_paginated(
+                session, semaphore, f"courses/{course.id}/assignments", {'include[]': ASSIGNMENT_INCLUDES[0]},
+                transform=lambda page: to_assignment_records(page, updated_since)
+            )
+        except Exception as e:
+            logger.error(f"Error fetching assignments for course {course.name}: {e}")
+            self.failed_courses.add(course.id)
+            return []
+
+    async def _stream_assignments_by_course(self, courses, updated_since: dict, results: queue.Queue, stop: threading.Event):
+        """
+        Fetches the courses with max_concurrency workers and hands each (course, assignments)
+        pair to the bounded results queue as soon as that course is complete. A worker only
+        starts its next course once the queue took the last one, so a slow consumer holds
+        the fetch back instead of letting finished courses pile up.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pending = asyncio.Queue()
+        for course in courses:
+            pending.put_nowait(course)
+        async with self._new_session() as session:
+            async def worker():
+                while not stop.is_set():
+                    try:
+                        course = pending.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    assignments = await self._fetch_assignments(session, semaphore, course, updated_since.get(course.id))
+                    if not await asyncio.to_thread(_put_until, results, ((course, assignments), None), stop):
+                        return
+
+            await asyncio.gather(*[worker() for _ in range(min(self.max_concurrency, len(courses)))])
+
+    async def _run_with_session(self, method, *args):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._new_session() as session:
+            return await method(session, semaphore, *args)
+
+    def get_active_courses(self):
+        """
+        Retrieves a list of courses the user is currently enrolled in as a student
+        and that are available (published).
+        """
+        self.failed_courses = set()
+        try:
+            active_courses = asyncio.run(self._run_with_session(self._fetch_active_courses))
+            logger.info(f"Found {len(active_courses)} active courses.")
+            return active_courses
+        except Exception as e:
+            logger.error(f"Error fetching active courses: {e}")
+            return []
+
+    def get_assignments(self, course, updated_since: str = None):
+        """
+        Retrieves assignments for a given course.
+        """
+        return asyncio.run(self._run_with_session(self._fetch_assignments, course, updated_since))
+
+    def get_assignments_by_course(self, courses, updated_since: dict = None):
+        """
+        Fetches the assignments of all given courses concurrently (at most max_concurrency
+        requests in flight) on a background event loop and yields (course, assignments) pairs
+        in the order the courses finish. At most max_concurrency finished courses wait in the
+        queue, plus one per worker waiting to hand its course over.
+        """
+        courses = list(courses)
+        if not courses:
+            return
+        results = queue.Queue(maxsize=self.max_concurrency)
+        stop = threading.Event()
+
+        def run():
+            try:
+                asyncio.run(self._stream_assignments_by_course(courses, updated_since or {}, results, stop))
+            except Exception as e:
+                _put_until(results, (None, e), stop)
+
+        thread = threading.Thread(target=run, name='canvas-async', daemon=True)
+        thread.start()
+        try:
+            for _ in courses:
+                item, error = results.get()
+                if error is not None:
+                    raise error
+                yield item
+        finally:
+            # Unblocks the event loop if the consumer stopped early
+            stop.set()
+            thread.join()
+
+
+def _put_until(results: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Puts item on a bounded queue, giving up once stop is set. Returns whether it was put.
+    """
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _page_number(link):
+    """
+    Extracts the numeric `page` parameter from a pagination link, if it has one.
+    """
+    if not link:
+        return None
+    page = parse_qs(urlparse(str(link['url'])).query).get('page', [None])[0]
+    if page and re.fullmatch(r'\d+', page):
+        return int(page)
+    return None
@@ -1,23 +1,75 @@
 from playwright.sync_api import sync_playwright
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
-def login_and_save_state(url: str, username: str = None, password: str = None, state_file: str = 'canvas_state.json'):
+DEFAULT_PROFILE_DIR = 'canvas_browser_profile'
+# How long a silent refresh waits for CAS to redirect back to the dashboard
+REFRESH_TIMEOUT_MS = 20000
+
+
+def _open_context(p, headless: bool, profile_dir: str = None):
+    """
+    Returns (context, close). With a profile_dir, the browser profile (CAS single sign-on
+    and Duo "trusted browser" cookies included) is kept on disk between launches.
+    """
+    if profile_dir:
+        context = p.chromium.launch_persistent_context(profile_dir, headless=headless)
+        return context, context.close
+    browser = p.chromium.launch(headless=headless)
+    return browser.new_context(), browser.close
+
+
+def _first_page(context):
+    # A persistent context opens with a blank tab already
+    return context.pages[0] if context.pages else context.new_page()
+
+
+def refresh_state(url: str, state_file: str = 'canvas_state.json', profile_dir: str = DEFAULT_PROFILE_DIR,
+                  timeout_ms: int = REFRESH_TIMEOUT_MS) -> bool:
+    """
+    Re-creates the Canvas session headlessly from the persistent browser profile and saves it
+    to the state file. While the SSO and trusted-browser cookies are valid, CAS redirects
+    straight back to Canvas without a password or Duo push. Returns False if the dashboard
+    doesn't show up, i.e. a full login is needed.
+    """
+    if not os.path.isdir(profile_dir):
+        return False
+    logger.info("Refreshing Canvas session from the saved browser profile...")
+    with sync_playwright() as p:
+        context, close = _open_context(p, True, profile_dir)
+        try:
+            page = _first_page(context)
+            page.goto(url)
+            page.wait_for_selector('#global_nav_dashboard_link', timeout=timeout_ms)
+            context.storage_state(path=state_file)
+            logger.info(f"Canvas session refreshed and saved to {state_file}")
+            return True
+        except Exception as e:
+            logger.info(f"Silent Canvas session refresh failed, a full login is needed: {e}")
+            return False
+        finally:
+            close()
+
+
+def login_and_save_state(url: str, username: str = None, password: str = None, state_file: str = 'canvas_state.json',
+                         profile_dir: str = DEFAULT_PROFILE_DIR):
     """
     Launches a browser for the user to log in,
     then saves the session cookies to a state file.
     If username and password are provided, it runs headlessly and automates the login form,
     pausing for the user to accept a Duo push or other 2FA via their device.
+    The browser profile is kept in profile_dir (None for a throwaway one), so later
+    refreshes can reuse the trusted-browser state.
     """
     is_headless = bool(username and password)
     logger.info(f"Launching {'headless ' if is_headless else ''}browser for Canvas authentication...")
     
     with sync_playwright() as p:
         # Launch headed if no credentials, headless if we have them
-        browser = p.chromium.launch(headless=is_headless)
-        context = browser.new_context()
-        page = context.new_page()
+        context, close = _open_context(p, is_headless, profile_dir)
+        page = _first_page(context)
         
         logger.info(f"Navigating to {url}")
         page.goto(url)
@@ -116,4 +168,4 @@ def login_and_save_state(url: str, username: str = None, password: str = None, s
         except Exception as e:
             logger.error(f"Error during login or state save. You may have timed out or hit an unexpected page: {e}")
         finally:
-            browser.close()
+            close()
@@ -1,52 +1,227 @@
 import json
-from canvasapi import Canvas
+import time
 from datetime import datetime, timezone
 import logging
 
+from clients.http_cache import install_http_cache
+from clients.request_scheduler import RequestScheduler, install_request_scheduler
+from metrics import Metrics, install_request_metrics
+
 logger = logging.getLogger(__name__)
 
+# Canvas defaults to 10 items per page; ask for the maximum to cut the number of round trips
+ASSIGNMENTS_PER_PAGE = 100
+# include[]=submission embeds the student's own submission in the assignment listing,
+# instead of one submissions request per assignment
+ASSIGNMENT_INCLUDES = ['submission']
+
+
+def parse_canvas_datetime(value: str):
+    """
+    Parses a Canvas ISO 8601 timestamp (e.g. 2024-01-31T23:59:00Z) into an aware datetime.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def parse_canvas_epoch(value: str):
+    """
+    Parses a Canvas timestamp into Unix seconds, or None if it is empty.
+    """
+    parsed = parse_canvas_datetime(value)
+    return int(parsed.timestamp()) if parsed else None
+
+
+def format_canvas_epoch(ts: int):
+    """
+    Formats Unix seconds in the REST API's UTC form (2024-01-31T23:59:00Z).
+    """
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+AUTH_COOKIE_NAMES = ('canvas_session', '_csrf_token')
+
+
+def load_auth_cookies(state_file: str) -> list:
+    """
+    Returns the Canvas auth cookies saved in a Playwright state file, in Playwright's cookie format.
+    """
+    with open(state_file, 'r') as f:
+        state = json.load(f)
+    return [cookie for cookie in state.get('cookies', []) if cookie.get('name') in AUTH_COOKIE_NAMES]
+
+
+def is_cookie_expired(cookie: dict, now: float = None) -> bool:
+    # Playwright stores -1 for session cookies, which have no expiry of their own
+    expires = cookie.get('expires', -1)
+    return expires is not None and expires > 0 and expires <= (now if now is not None else time.time())
+
+
+def auth_cookie_expiry(state_file: str):
+    """
+    Returns when the first of the saved Canvas auth cookies expires as an aware datetime, or None
+    if they are all session cookies (or the file can't be read).
+    """
+    try:
+        cookies = load_auth_cookies(state_file)
+    except (OSError, ValueError):
+        return None
+    expiries = [cookie['expires'] for cookie in cookies if (cookie.get('expires') or -1) > 0]
+    if not expiries:
+        return None
+    return datetime.fromtimestamp(min(expiries), timezone.utc)
+
+
+def build_cookie_headers(session_cookie: str = None, state_file: str = None) -> dict:
+    """
+    Builds the Cookie (and X-CSRF-Token) headers for cookie-based Canvas auth, either from a
+    Playwright state file or a raw session cookie. Expired cookies from the state file are
+    skipped. Returns an empty dict if neither is usable.
+    """
+    cookie_parts = []
+    
+    if state_file:
+        try:
+            now = time.time()
+            for cookie in load_auth_cookies(state_file):
+                if is_cookie_expired(cookie, now):
+                    logger.warning(f"Canvas cookie {cookie['name']} in {state_file} has expired. Run with --login to refresh it.")
+                    continue
+                cookie_parts.append(f"{cookie['name']}={cookie['value']}")
+            logger.info(f"Loaded Canvas auth state from {state_file}.")
+        except Exception as e:
+            logger.error(f"Failed to load state file {state_file}: {e}")
+    elif session_cookie:
+        cookie_parts.append(f"canvas_session={session_cookie}")
+        logger.info("Using fallback session cookie from environment.")
+
+    if not cookie_parts:
+        return {}
+
+    # Inject the session cookies directly into the session headers
+    headers = {'Cookie': "; ".join(cookie_parts)}
+    
+    # Also set the X-CSRF-Token header if we have the cookie, since Canvas API 
+    # often requires it when using cookie-based auth.
+    for part in cookie_parts:
+        if part.startswith('_csrf_token='):
+            headers['X-CSRF-Token'] = part.split('=', 1)[1]
+            break
+    return headers
+
+
+def is_syncable_assignment(raw: dict) -> bool:
+    """
+    We only want assignments with a due date and that can be submitted.
+    """
+    if not raw.get('due_at'):
+        return False
+    if raw.get('submission_types', ['none']) == ['none']:
+        return False
+    return True
+
+
+def is_submitted(submission) -> bool:
+    """
+    Whether the student's own submission (from include[]=submission) was turned in or excused.
+    has_submitted_submissions is not used: it reflects any student's submissions, not the user's.
+    """
+    if not isinstance(submission, dict):
+        return False
+    if submission.get('excused'):
+        return True
+    # 'graded' without a submitted_at is e.g. a zero for a missed assignment
+    return bool(submission.get('submitted_at')) or submission.get('workflow_state') in ('submitted', 'pending_review')
+
+
+class AssignmentRecord:
+    """
+    The fields of a Canvas assignment the sync uses, with timestamps as Unix seconds. Every
+    backend builds these straight from the API's JSON, so a course's assignments are held
+    without canvasapi objects, their full attribute dicts or parsed datetimes.
+    """
+    __slots__ = ('id', 'name', 'due_ts', 'updated_ts', 'html_url', 'description', 'submitted')
+
+    def __init__(self, id: int, name: str, due_ts: int, updated_ts: int = None, html_url: str = None,
+                 description: str = None, submitted: bool = False):
+        self.id = id
+        self.name = name
+        self.due_ts = due_ts
+        self.updated_ts = updated_ts
+        self.html_url = html_url
+        self.description = description
+        self.submitted = submitted
+
+    @classmethod
+    def from_json(cls, raw: dict):
+        """
+        Builds a record from an assignment of the REST API (with include[]=submission).
+        """
+        return cls(
+            raw['id'],
+            raw.get('name'),
+            parse_canvas_epoch(raw.get('due_at')),
+            parse_canvas_epoch(raw.get('updated_at')),
+            raw.get('html_url'),
+            raw.get('description'),
+            is_submitted(raw.get('submission')),
+        )
+
+    def __repr__(self):
+        return f"AssignmentRecord(id={self.id!r}, name={self.name!r}, due_ts={self.due_ts!r})"
+
+
+def is_wanted(record: AssignmentRecord, since_ts: int = None) -> bool:
+    """
+    Whether an incremental fetch keeps the assignment: it was updated after since_ts, or it is
+    submitted (submitting does not change an assignment's updated_at).
+    """
+    return since_ts is None or record.updated_ts is None or record.updated_ts > since_ts or record.submitted
+
+
+def to_assignment_records(raw_assignments, updated_since: str = None) -> list:
+    """
+    Turns a page of REST assignment JSON into records of the syncable assignments to keep.
+    """
+    since_ts = parse_canvas_epoch(updated_since)
+    records = []
+    for raw in raw_assignments:
+        if is_syncable_assignment(raw):
+            record = AssignmentRecord.from_json(raw)
+            if is_wanted(record, since_ts):
+                records.append(record)
+    return records
+
+
 class CanvasClient:
-    def __init__(self, api_url: str, api_token: str, session_cookie: str = None, state_file: str = None):
+    def __init__(self, api_url: str, api_token: str, session_cookie: str = None, state_file: str = None, http_cache=None,
+                 metrics: Metrics = None, scheduler: RequestScheduler = None):
+        # Imported here so the helpers above (used by every backend) don't pull in canvasapi
+        from canvasapi import Canvas
         self.canvas = Canvas(api_url, api_token)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        # Courses whose assignments could not be fetched completely since get_active_courses()
+        self.failed_courses = set()
+        session = self.canvas._Canvas__requester._session
+        install_request_metrics(session, self.metrics, 'canvas')
+        # Rate limiting and retries sit below the cache, so revalidations are throttled too
+        install_request_scheduler(session, self.scheduler, self.metrics, 'canvas')
         
-        cookie_parts = []
+        if http_cache is not None:
+            # Revalidate list endpoints with ETags instead of re-downloading unchanged JSON
+            install_http_cache(session, http_cache)
         
-        if state_file:
-            try:
-                with open(state_file, 'r') as f:
-                    state = json.load(f)
-                    for cookie in state.get('cookies', []):
-                        if cookie['name'] in ['canvas_session', '_csrf_token']:
-                            cookie_parts.append(f"{cookie['name']}={cookie['value']}")
-                logger.info(f"Loaded Canvas auth state from {state_file}.")
-            except Exception as e:
-                logger.error(f"Failed to load state file {state_file}: {e}")
-        elif session_cookie:
-            cookie_parts.append(f"canvas_session={session_cookie}")
-            logger.info("Using fallback session cookie from environment.")
-
-        if cookie_parts:
+        cookie_headers = build_cookie_headers(session_cookie, state_file)
+
+        if cookie_headers:
             # Set access_token to None to prevent canvasapi from adding the Authorization header
             self.canvas._Canvas__requester.access_token = None
             # Ensure the session doesn't have an Authorization header
             self.canvas._Canvas__requester._session.headers.pop('Authorization', None)
-            
-            # Inject the session cookies directly into the session headers
-            cookie_string = "; ".join(cookie_parts)
-            self.canvas._Canvas__requester._session.headers.update({
-                'Cookie': cookie_string
-            })
-            
-            # Also set the X-CSRF-Token header if we have the cookie, since Canvas API 
-            # often requires it when using cookie-based auth.
-            for part in cookie_parts:
-                if part.startswith('_csrf_token='):
-                    csrf_val = part.split('=', 1)[1]
-                    self.canvas._Canvas__requester._session.headers.update({
-                        'X-CSRF-Token': csrf_val
-                    })
-                    break
-                    
+            self.canvas._Canvas__requester._session.headers.update(cookie_headers)
             logger.info("Injected browser cookies for Canvas authentication.")
         else:
             logger.info("Initialized Canvas client with API token.")
@@ -57,6 +232,7 @@ class CanvasClient:
         and that are available (published).
         """
         active_courses = []
+        self.failed_courses = set()
         try:
             # Only get courses where user is a student and the course is available
             courses = self.canvas.get_courses(enrollment_type='student', enrollment_state='active')
@@ -69,21 +245,44 @@ class CanvasClient:
             logger.error(f"Error fetching active courses: {e}")
         return active_courses
 
-    def get_assignments(self, course):
+    def _get_pages(self, endpoint: str, **params):
         """
-        Retrieves assignments for a given course.
+        Yields the JSON pages of a Canvas list endpoint, following the Link headers like
+        canvasapi's PaginatedList does, but without wrapping each item in a canvasapi object.
+        """
+        from canvasapi.util import combine_kwargs
+        requester = self.canvas._Canvas__requester
+        response = requester.request('GET', endpoint, _kwargs=combine_kwargs(**params))
+        while True:
+            yield response.json()
+            next_link = response.links.get('next')
+            if not next_link:
+                return
+            response = requester.request('GET', _url=next_link['url'])
+
+    def get_assignments(self, course, updated_since: str = None):
+        """
+        Retrieves the assignments of a given course as AssignmentRecords, each with the student's
+        own submission state.
+        If updated_since is given, only assignments updated after that timestamp are returned,
+        plus the submitted ones (submitting does not change an assignment's updated_at).
         """
         assignments = []
         try:
-            # We fetch all assignments for the course.
-            course_assignments = course.get_assignments()
-            for assignment in course_assignments:
-                # We only want assignments with a due date and that can be submitted
-                if hasattr(assignment, 'due_at') and assignment.due_at:
-                    if getattr(assignment, 'has_submitted_submissions', False) or getattr(assignment, 'submission_types', ['none']) == ['none']:
-                         continue
-                    assignments.append(assignment)
+            # We fetch all assignments for the course, page by page as plain JSON
+            for page in self._get_pages(f"courses/{course.id}/assignments", per_page=ASSIGNMENTS_PER_PAGE, include=ASSIGNMENT_INCLUDES):
+                assignments.extend(to_assignment_records(page, updated_since))
         except Exception as e:
             logger.error(f"Error fetching assignments for course {course.name}: {e}")
+            self.failed_courses.add(course.id)
             
         return assignments
+
+    def get_assignments_by_course(self, courses, updated_since: dict = None):
+        """
+        Yields (course, assignments) for each course, fetching one course at a time.
+        updated_since optionally maps course IDs to incremental fetch cursors.
+        """
+        updated_since = updated_since or {}
+        for course in courses:
+            yield course, self.get_assignments(course, updated_since=updated_since.get(course.id))
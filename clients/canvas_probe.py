@@ -0,0 +1,118 @@
+import hashlib
+import logging
+
+import requests
+
+from metrics import Metrics, install_request_metrics
+from clients.request_scheduler import RequestScheduler, install_request_scheduler
+from clients.canvas_client import build_cookie_headers
+from clients.graphql_canvas_client import STUDENT_ENROLLMENTS, fetch_user_id, is_student_course
+
+logger = logging.getLogger(__name__)
+
+PROBE_PAGE_SIZE = 100
+
+# Only IDs, modification times and the student's submission time: enough to tell whether
+# anything a sync would render or complete changed
+PROBE_FIELDS = """
+    pageInfo { hasNextPage endCursor }
+    nodes { _id updatedAt submissionsConnection(first: 1) { nodes { submittedAt } } }
+"""
+
+PROBE_COURSES_QUERY = """
+query ProbeAllCourses($first: Int!, $userId: ID!) {
+    allCourses {
+        _id
+        name
+        state
+        %s
+        assignmentsConnection(first: $first) { %s }
+    }
+}
+""" % (STUDENT_ENROLLMENTS, PROBE_FIELDS)
+
+PROBE_COURSE_QUERY = """
+query ProbeCourseAssignments($courseId: ID!, $first: Int!, $after: String) {
+    course(id: $courseId) {
+        assignmentsConnection(first: $first, after: $after) { %s }
+    }
+}
+""" % PROBE_FIELDS
+
+
+def _submitted_at(node: dict) -> str:
+    submissions = (node.get('submissionsConnection') or {}).get('nodes') or []
+    return (submissions[0].get('submittedAt') or '') if submissions else ''
+
+
+class CanvasChangeProbe:
+    """
+    Computes a fingerprint of the monitored courses' assignment sets (IDs, updatedAt and submission time)
+    with a single GraphQL query in the common case (after looking up the user's ID), so a run can tell that nothing changed
+    on Canvas before connecting to TickTick or fetching full assignments.
+    """
+    def __init__(self, api_url: str, api_token: str, session_cookie: str = None, state_file: str = None,
+                 metrics: Metrics = None, scheduler: RequestScheduler = None):
+        self.api_url = api_url
+        self.graphql_url = api_url.rstrip('/') + '/api/graphql'
+        self.session = requests.Session()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        install_request_metrics(self.session, self.metrics, 'canvas')
+        install_request_scheduler(self.session, self.scheduler, self.metrics, 'canvas')
+
+        cookie_headers = build_cookie_headers(session_cookie, state_file)
+        if cookie_headers:
+            self.session.headers.update(cookie_headers)
+        else:
+            self.session.headers.update({'Authorization': f"Bearer {api_token}"})
+
+    def _query(self, query: str, variables: dict) -> dict:
+        response = self.session.post(self.graphql_url, json={'query': query, 'variables': variables})
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errors'):
+            raise RuntimeError(f"Canvas GraphQL error: {result['errors']}")
+        return result['data']
+
+    def _iter_nodes(self, course_id: str, connection: dict):
+        while True:
+            yield from connection.get('nodes') or []
+            page_info = connection.get('pageInfo') or {}
+            if not page_info.get('hasNextPage'):
+                break
+            connection = self._query(PROBE_COURSE_QUERY, {
+                'courseId': course_id,
+                'first': PROBE_PAGE_SIZE,
+                'after': page_info.get('endCursor'),
+            })['course']['assignmentsConnection']
+
+    def fingerprint(self, is_monitored, salt: str = ''):
+        """
+        Returns a sha1 over the available monitored student courses (ID and name) and their assignments
+        (ID, updatedAt and the student's submittedAt), mixed with `salt` (e.g. the config fingerprint). Returns None if the
+        probe failed, in which case the caller should just run the full sync.
+        """
+        try:
+            with self.metrics.phase('canvas_probe'):
+                user_id = fetch_user_id(self.session, self.api_url)
+                data = self._query(PROBE_COURSES_QUERY, {'first': PROBE_PAGE_SIZE, 'userId': user_id})
+                entries = []
+                for node in data.get('allCourses') or []:
+                    if not is_student_course(node) or not is_monitored(node['name']):
+                        continue
+                    assignments = sorted(
+                        (assignment['_id'], assignment.get('updatedAt') or '', _submitted_at(assignment))
+                        for assignment in self._iter_nodes(node['_id'], node['assignmentsConnection'])
+                    )
+                    entries.append((node['_id'], node['name'], assignments))
+        except Exception as e:
+            logger.warning(f"Canvas change probe failed: {e}")
+            return None
+        entries.sort()
+        digest = hashlib.sha1(salt.encode('utf-8'))
+        for course_id, name, assignments in entries:
+            digest.update(f"\x1e{course_id}\x1f{name}".encode('utf-8'))
+            for assignment_id, updated_at, submitted_at in assignments:
+                digest.update(f"\x1d{assignment_id}\x1f{updated_at}\x1f{submitted_at}".encode('utf-8'))
+        return digest.hexdigest()
@@ -0,0 +1,112 @@
+import os
+import sys
+import logging
+from datetime import datetime, timezone, timedelta
+
+import requests
+
+from metrics import Metrics, install_request_metrics
+from clients.request_scheduler import RequestScheduler, install_request_scheduler
+from clients.canvas_client import auth_cookie_expiry, build_cookie_headers
+
+logger = logging.getLogger(__name__)
+
+# Refresh cookies this long before they expire, so they don't lapse in the middle of a sync
+DEFAULT_EXPIRY_MARGIN = timedelta(minutes=10)
+# The cheapest authenticated endpoint: a few hundred bytes describing the current user
+VALIDATE_PATH = '/api/v1/users/self'
+
+
+class CanvasSession:
+    """
+    Keeps the browser-derived Canvas auth state (canvas_state.json) usable before a sync.
+    ensure() tracks the saved cookies' expiry and checks the session with one API call.
+    If the session is no longer valid, it is refreshed headlessly from the persistent
+    browser profile. A full login (Duo push) is only started when that fails.
+    """
+    def __init__(self, api_url: str, state_file: str = 'canvas_state.json', profile_dir: str = 'canvas_browser_profile',
+                 username: str = None, password: str = None, expiry_margin: timedelta = DEFAULT_EXPIRY_MARGIN,
+                 metrics: Metrics = None, scheduler: RequestScheduler = None, interactive: bool = True):
+        self.api_url = api_url.rstrip('/')
+        self.state_file = state_file
+        self.profile_dir = profile_dir
+        self.username = username
+        self.password = password
+        self.expiry_margin = expiry_margin
+        # False for unattended runs (e.g. the service): only the silent refresh is attempted
+        self.interactive = interactive
+        self.session = requests.Session()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        install_request_metrics(self.session, self.metrics, 'canvas')
+        install_request_scheduler(self.session, self.scheduler, self.metrics, 'canvas')
+
+    def expires_at(self):
+        """
+        When the first saved auth cookie expires, or None for session cookies.
+        """
+        return auth_cookie_expiry(self.state_file)
+
+    def is_expiring(self, now: datetime = None) -> bool:
+        expires_at = self.expires_at()
+        now = now if now is not None else datetime.now(timezone.utc)
+        return expires_at is not None and expires_at - now <= self.expiry_margin
+
+    def validate(self):
+        """
+        Returns True if Canvas accepts the saved cookies and False if it rejects them. Returns None
+        if Canvas couldn't be reached, in which case the sync is left to report the error.
+        """
+        if not os.path.exists(self.state_file):
+            return False
+        headers = build_cookie_headers(state_file=self.state_file)
+        if not headers:
+            return False
+        try:
+            with self.metrics.phase('canvas_session_check'):
+                # Canvas answers an invalid session with 401, or a redirect to the login page
+                response = self.session.get(self.api_url + VALIDATE_PATH, headers=headers, allow_redirects=False)
+        except requests.RequestException as e:
+            logger.warning(f"Could not check the Canvas session: {e}")
+            return None
+        if response.status_code == 200:
+            return True
+        if response.status_code in (301, 302, 303, 401, 403):
+            return False
+        logger.warning(f"Unexpected status {response.status_code} while checking the Canvas session.")
+        return None
+
+    def _can_log_in(self) -> bool:
+        # A headed login needs someone at the keyboard; with credentials it runs headless
+        if not self.interactive:
+            return False
+        return bool(self.username and self.password) or sys.stdin.isatty()
+
+    def refresh(self) -> bool:
+        """
+        Re-creates the session: silently from the browser profile, then with a full login.
+        """
+        # Imported here so checking a still-valid session never loads Playwright
+        from clients.canvas_auth import login_and_save_state, refresh_state
+        with self.metrics.phase('canvas_session_refresh'):
+            if refresh_state(self.api_url, self.state_file, self.profile_dir) and self.validate() is not False:
+                return True
+            if not self._can_log_in():
+                logger.error("The Canvas session expired and no interactive login is possible. Run with --login.")
+                return False
+            logger.info("Falling back to a full Canvas login...")
+            login_and_save_state(self.api_url, self.username, self.password, self.state_file, self.profile_dir)
+            return self.validate() is not False
+
+    def ensure(self) -> bool:
+        """
+        Makes sure the saved session is usable. Returns False if it could not be restored.
+        """
+        if self.is_expiring():
+            logger.info(f"Canvas session cookies expire at {self.expires_at():%Y-%m-%d %H:%M} UTC, refreshing...")
+            return self.refresh()
+        valid = self.validate()
+        if valid is False:
+            logger.info("Canvas rejected the saved session, refreshing...")
+            return self.refresh()
+        return True
@@ -0,0 +1,298 @@
+import os
+import re
+import gzip
+import json
+import time
+import base64
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict, deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+REDACTED = 'REDACTED'
+
+# Header, query parameter and JSON keys whose values never go into a cassette
+SENSITIVE_HEADERS = {'authorization', 'cookie', 'set-cookie', 'x-csrf-token', 'x-api-key'}
+SENSITIVE_KEYS = {
+    'username', 'password', 'token', 'access_token', 'refresh_token', 'client_secret',
+    'authenticity_token', 'csrf_token', 'cookies', 'session_cookie',
+}
+# TickTick object IDs, which the client generates itself for new tasks, lists and folders
+OBJECT_ID = re.compile(r'\b[0-9a-f]{24}\b')
+LINK_URL = re.compile(r'<([^>]*)>')
+ERRORS = {'ConnectionError': requests.ConnectionError, 'Timeout': requests.Timeout}
+
+
+class CassetteMiss(requests.RequestException):
+    """
+    A replayed sync sent a request the cassette has no recorded response for.
+    """
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(key, REDACTED if key.lower() in SENSITIVE_KEYS else value) for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _redacted(value):
+    # Keeps the shape (e.g. a cookie dict stays a dict), so code reading it back still works
+    if isinstance(value, dict):
+        return {key: REDACTED for key in value}
+    return REDACTED if value else value
+
+
+def redact_json(value):
+    """
+    Returns a copy of a decoded JSON value with the values of SENSITIVE_KEYS replaced.
+    """
+    if isinstance(value, dict):
+        return {key: _redacted(item) if str(key).lower() in SENSITIVE_KEYS else redact_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_json(item) for item in value]
+    return value
+
+
+def redact_body(body) -> str:
+    """
+    A request body as text, with credentials in JSON or form-encoded bodies redacted.
+    """
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    try:
+        return json.dumps(redact_json(json.loads(body)), separators=(',', ':'), sort_keys=True)
+    except ValueError:
+        pass
+    if '=' in body and ' ' not in body:
+        pairs = parse_qsl(body, keep_blank_values=True)
+        if pairs:
+            return urlencode([(key, REDACTED if key.lower() in SENSITIVE_KEYS else value) for key, value in pairs])
+    return body
+
+
+def _redact_headers(headers) -> dict:
+    redacted = {}
+    for name, value in headers.items():
+        if name.lower() in SENSITIVE_HEADERS:
+            continue
+        if name.lower() == 'link':
+            value = LINK_URL.sub(lambda match: f"<{redact_url(match.group(1))}>", value)
+        redacted[name] = value
+    return redacted
+
+
+def _encode_content(content: bytes, headers: dict) -> dict:
+    if 'json' in headers.get('Content-Type', headers.get('content-type', '')):
+        try:
+            redacted = json.dumps(redact_json(json.loads(content)), separators=(',', ':')).encode('utf-8')
+        except ValueError:
+            redacted = content
+        if redacted != content:
+            content = redacted
+            for name in [name for name in headers if name.lower() == 'content-length']:
+                headers[name] = str(len(content))
+    try:
+        return {'content': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'content_b64': base64.b64encode(content).decode('ascii')}
+
+
+def _match_key(method: str, url: str) -> tuple:
+    return method.upper(), redact_url(url)
+
+
+class Cassette:
+    """
+    HTTP exchanges of one recorded sync, plus the local files (sync index, journal, TickTick
+    session, config) as they were when it started, stored as gzip-compressed JSON lines.
+    Credentials are redacted before anything is added.
+    """
+    def __init__(self, exchanges: list = None, files: dict = None, created_at: float = None):
+        self.exchanges = exchanges if exchanges is not None else []
+        # name -> file contents (bytes)
+        self.files = files if files is not None else OrderedDict()
+        self.created_at = created_at if created_at is not None else time.time()
+        self._lock = threading.Lock()
+
+    def add_exchange(self, exchange: dict):
+        with self._lock:
+            self.exchanges.append(exchange)
+
+    def add_file(self, name: str, path: str):
+        """
+        Snapshots a local file, if it exists. JSON files (e.g. the TickTick session) are redacted.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if name.endswith('.json'):
+            try:
+                data = json.dumps(redact_json(json.loads(data)), separators=(',', ':')).encode('utf-8')
+            except ValueError:
+                logger.warning(f"Not adding {path} to the cassette: it is not valid JSON and can't be redacted.")
+                return
+        self.files[name] = data
+
+    def restore_files(self, directory: str) -> dict:
+        """
+        Writes the snapshotted files to `directory`. Returns name -> path.
+        """
+        paths = {}
+        for name, data in self.files.items():
+            paths[name] = os.path.join(directory, name)
+            with open(paths[name], 'wb') as f:
+                f.write(data)
+        return paths
+
+    def save(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cassette.')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                header = {
+                    'version': CASSETTE_VERSION,
+                    'created_at': self.created_at,
+                    'files': {name: base64.b64encode(data).decode('ascii') for name, data in self.files.items()},
+                }
+                f.write((json.dumps(header, separators=(',', ':')) + '\n').encode('utf-8'))
+                with self._lock:
+                    for exchange in self.exchanges:
+                        f.write((json.dumps(exchange, separators=(',', ':')) + '\n').encode('utf-8'))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'Cassette':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version {header.get('version')} in {path}")
+            exchanges = [json.loads(line) for line in f if line.strip()]
+        files = OrderedDict((name, base64.b64decode(data)) for name, data in header.get('files', {}).items())
+        return cls(exchanges, files, header.get('created_at'))
+
+
+class RecordingTransport(HTTPAdapter):
+    """
+    Transport (see RequestScheduler) that sends requests over its own keep-alive pools and adds
+    every exchange to a Cassette, with the time the server took to answer. Failed requests
+    are recorded too, so retries replay the same way.
+    """
+    def __init__(self, cassette: Cassette = None, pool_maxsize: int = 32):
+        super().__init__(pool_connections=16, pool_maxsize=pool_maxsize)
+        self.cassette = cassette if cassette is not None else Cassette()
+
+    def send_as(self, tenant, request, **kwargs):
+        exchange = {'method': request.method, 'url': redact_url(request.url), 'body': redact_body(request.body)}
+        start = time.perf_counter()
+        try:
+            response = self.send(request, **kwargs)
+            content = response.content
+        except (requests.ConnectionError, requests.Timeout) as e:
+            exchange.update(error='Timeout' if isinstance(e, requests.Timeout) else 'ConnectionError', elapsed=time.perf_counter() - start)
+            self.cassette.add_exchange(exchange)
+            raise
+        headers = _redact_headers(response.headers)
+        exchange.update(status=response.status_code, reason=response.reason, headers=headers, elapsed=time.perf_counter() - start)
+        exchange.update(_encode_content(content, headers))
+        self.cassette.add_exchange(exchange)
+        return response
+
+
+class ReplayTransport:
+    """
+    Transport that answers requests from a Cassette instead of the network. Requests are
+    matched by method and URL; among several recordings of the same one, a recording with
+    the same body is preferred, then the oldest unused one. Object IDs the client generated
+    are swapped into the response when the bodies line up, and writes sent more often than
+    recorded (e.g. batched differently) get the last recorded response. With latency_scale,
+    each response waits that fraction of the time it originally took.
+    """
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.replayed = 0
+        self.reused = 0
+        self._pending = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        for exchange in cassette.exchanges:
+            self._pending[_match_key(exchange['method'], exchange['url'])].append(exchange)
+
+    def _take(self, request, body: str):
+        key = _match_key(request.method, request.url)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending:
+                exchange = next((exchange for exchange in pending if exchange['body'] == body), pending[0])
+                pending.remove(exchange)
+                self._last[key] = exchange
+                self.replayed += 1
+                return exchange
+            if key in self._last and key[0] not in ('GET', 'HEAD'):
+                self.reused += 1
+                return self._last[key]
+        raise CassetteMiss(f"No recorded response for {request.method} {redact_url(request.url)}")
+
+    def _build_response(self, request, exchange: dict, body: str) -> requests.Response:
+        if 'content_b64' in exchange:
+            content = base64.b64decode(exchange['content_b64'])
+        else:
+            content = exchange.get('content', '')
+            recorded_ids = OBJECT_ID.findall(exchange['body'] or '')
+            sent_ids = OBJECT_ID.findall(body or '')
+            if recorded_ids and len(recorded_ids) == len(sent_ids):
+                id_map = dict(zip(recorded_ids, sent_ids))
+                content = OBJECT_ID.sub(lambda match: id_map.get(match.group(0), match.group(0)), content)
+            content = content.encode('utf-8')
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange.get('reason')
+        response.headers = CaseInsensitiveDict(exchange.get('headers') or {})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def send_as(self, tenant, request, **kwargs):
+        body = redact_body(request.body)
+        exchange = self._take(request, body)
+        if self.latency_scale:
+            time.sleep(exchange.get('elapsed', 0.0) * self.latency_scale)
+        if exchange.get('error'):
+            raise ERRORS.get(exchange['error'], requests.ConnectionError)(f"Replayed {exchange['error']} for {request.method} {exchange['url']}", request=request)
+        return self._build_response(request, exchange, body)
+
+    def unused(self) -> int:
+        with self._lock:
+            return sum(len(pending) for pending in self._pending.values())
+
+    def close(self):
+        unused = self.unused()
+        if unused or self.reused:
+            logger.warning(f"Replay diverged from the recording: {unused} recorded responses were never requested, {self.reused} were reused.")
+        else:
+            logger.info(f"Replayed all {self.replayed} recorded responses.")
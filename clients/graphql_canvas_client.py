@@ -0,0 +1,205 @@
+import logging
+from types import SimpleNamespace
+
+import requests
+
+from metrics import Metrics, install_request_metrics
+from clients.request_scheduler import RequestScheduler, install_request_scheduler
+from clients.canvas_client import (
+    AssignmentRecord,
+    build_cookie_headers,
+    is_submitted,
+    is_wanted,
+    parse_canvas_epoch,
+)
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_PAGE_SIZE = 100
+
+# Only the fields run_sync reads are selected, which keeps the payload a fraction of the REST one
+ASSIGNMENT_FIELDS = """
+    pageInfo { hasNextPage endCursor }
+    nodes {
+        _id
+        name
+        dueAt
+        updatedAt
+        htmlUrl
+        description
+        submissionTypes
+        submissionsConnection(first: 1) { nodes { state submittedAt } }
+    }
+"""
+
+# allCourses also lists courses the user teaches or assists in, and a course's enrollments
+# include the classmates', so only the user's own enrollments are selected
+STUDENT_ENROLLMENTS = """
+    enrollmentsConnection(filter: {types: [StudentEnrollment], states: [active], userIds: [$userId]}) {
+        nodes { type state }
+    }
+"""
+
+ALL_COURSES_QUERY = """
+query SyncAllCourses($first: Int!, $userId: ID!) {
+    allCourses {
+        _id
+        name
+        state
+        %s
+        assignmentsConnection(first: $first) { %s }
+    }
+}
+""" % (STUDENT_ENROLLMENTS, ASSIGNMENT_FIELDS)
+
+COURSE_ASSIGNMENTS_QUERY = """
+query SyncCourseAssignments($courseId: ID!, $first: Int!, $after: String) {
+    course(id: $courseId) {
+        assignmentsConnection(first: $first, after: $after) { %s }
+    }
+}
+""" % ASSIGNMENT_FIELDS
+
+
+def fetch_user_id(session: requests.Session, api_url: str) -> str:
+    """
+    The Canvas ID of the user the session authenticates as, for the STUDENT_ENROLLMENTS filter.
+    """
+    response = session.get(api_url.rstrip('/') + '/api/v1/users/self')
+    response.raise_for_status()
+    return str(response.json()['id'])
+
+
+def is_student_course(node: dict) -> bool:
+    """
+    Whether an allCourses node is available and actively taken as a student, like the REST
+    backend's get_courses(enrollment_type='student', enrollment_state='active').
+    """
+    if node.get('state') != 'available' or not node.get('name'):
+        return False
+    enrollments = (node.get('enrollmentsConnection') or {}).get('nodes') or []
+    return any(enrollment.get('type') == 'StudentEnrollment' and enrollment.get('state') == 'active' for enrollment in enrollments)
+
+
+def _to_assignment(node: dict):
+    """
+    Builds the record of a GraphQL assignment node, or returns None if it isn't syncable
+    (no due date or no way to submit), like is_syncable_assignment() for REST.
+    """
+    if not node.get('dueAt') or [t.lower() for t in node.get('submissionTypes') or ['none']] == ['none']:
+        return None
+    # For a student, the only visible submission is their own
+    submissions = (node.get('submissionsConnection') or {}).get('nodes') or []
+    submission = submissions[0] if submissions else None
+    return AssignmentRecord(
+        int(node['_id']),
+        node.get('name'),
+        # GraphQL timestamps carry a local UTC offset, which the epoch conversion accounts for
+        parse_canvas_epoch(node.get('dueAt')),
+        parse_canvas_epoch(node.get('updatedAt')),
+        node.get('htmlUrl'),
+        node.get('description'),
+        is_submitted({'workflow_state': submission.get('state'), 'submitted_at': submission.get('submittedAt')} if submission else None),
+    )
+
+
+class GraphQLCanvasClient:
+    """
+    Canvas client that pulls all active courses and their assignments through /api/graphql,
+    selecting only the fields the sync uses. Exposes the same interface as CanvasClient.
+    """
+    def __init__(self, api_url: str, api_token: str, session_cookie: str = None, state_file: str = None,
+                 metrics: Metrics = None, scheduler: RequestScheduler = None):
+        self.api_url = api_url
+        self.graphql_url = api_url.rstrip('/') + '/api/graphql'
+        self.session = requests.Session()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        install_request_metrics(self.session, self.metrics, 'canvas')
+        install_request_scheduler(self.session, self.scheduler, self.metrics, 'canvas')
+        # Assignments returned together with the course list, keyed by course ID
+        self._prefetched = {}
+        # Courses whose assignments could not be fetched completely since get_active_courses()
+        self.failed_courses = set()
+        self._user_id = None
+
+        cookie_headers = build_cookie_headers(session_cookie, state_file)
+        if cookie_headers:
+            self.session.headers.update(cookie_headers)
+            logger.info("Injected browser cookies for Canvas GraphQL authentication.")
+        else:
+            self.session.headers.update({'Authorization': f"Bearer {api_token}"})
+            logger.info("Initialized Canvas GraphQL client with API token.")
+
+    def _query(self, query: str, variables: dict) -> dict:
+        response = self.session.post(self.graphql_url, json={'query': query, 'variables': variables})
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errors'):
+            raise RuntimeError(f"Canvas GraphQL error: {result['errors']}")
+        return result['data']
+
+    def get_active_courses(self):
+        """
+        Retrieves the available courses the user is actively enrolled in as a student, together
+        with the first page of their assignments in one query.
+        """
+        active_courses = []
+        self._prefetched = {}
+        self.failed_courses = set()
+        try:
+            if self._user_id is None:
+                self._user_id = fetch_user_id(self.session, self.api_url)
+            data = self._query(ALL_COURSES_QUERY, {'first': GRAPHQL_PAGE_SIZE, 'userId': self._user_id})
+            for node in data.get('allCourses') or []:
+                # Same as the REST backend: skip unpublished/concluded courses, unnamed ones and
+                # courses the user isn't a student in
+                if not is_student_course(node):
+                    continue
+                course = SimpleNamespace(id=int(node['_id']), name=node['name'])
+                active_courses.append(course)
+                self._prefetched[course.id] = node['assignmentsConnection']
+            logger.info(f"Found {len(active_courses)} active courses.")
+        except Exception as e:
+            logger.error(f"Error fetching active courses: {e}")
+        return active_courses
+
+    def _iter_assignment_nodes(self, course):
+        connection = self._prefetched.pop(course.id, None)
+        if connection is None:
+            connection = self._query(COURSE_ASSIGNMENTS_QUERY, {'courseId': str(course.id), 'first': GRAPHQL_PAGE_SIZE, 'after': None})['course']['assignmentsConnection']
+        while True:
+            yield from connection.get('nodes') or []
+            page_info = connection.get('pageInfo') or {}
+            if not page_info.get('hasNextPage'):
+                break
+            connection = self._query(COURSE_ASSIGNMENTS_QUERY, {
+                'courseId': str(course.id),
+                'first': GRAPHQL_PAGE_SIZE,
+                'after': page_info.get('endCursor'),
+            })['course']['assignmentsConnection']
+
+    def get_assignments(self, course, updated_since: str = None):
+        """
+        Retrieves assignments for a given course, following the GraphQL cursor for courses
+        with more assignments than fit in the first page.
+        """
+        assignments = []
+        since_ts = parse_canvas_epoch(updated_since)
+        try:
+            for node in self._iter_assignment_nodes(course):
+                assignment = _to_assignment(node)
+                if assignment is not None and is_wanted(assignment, since_ts):
+                    assignments.append(assignment)
+        except Exception as e:
+            logger.error(f"Error fetching assignments for course {course.name}: {e}")
+            self.failed_courses.add(course.id)
+        return assignments
+
+    def get_assignments_by_course(self, courses, updated_since: dict = None):
+        """
+        Yields (course, assignments) for each course, mostly served from the prefetched course query.
+        """
+        updated_since = updated_since or {}
+        for course in courses:
+            yield course, self.get_assignments(course, updated_since=updated_since.get(course.id))
@@ -0,0 +1,183 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+# Headers describing the wire encoding of the original body; the cache stores the decoded body.
+# Lowercase: header names are compared case-insensitively
+_DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+# Requests authenticated as different users must never share cache entries
+_AUTH_HEADERS = ('Authorization', 'Cookie')
+
+
+class HTTPCache:
+    """
+    On-disk store of GET response bodies with their ETag / Last-Modified validators.
+    Entries are evicted least-recently-used once the total size exceeds max_bytes,
+    and expire ttl_seconds after they were last validated.
+    """
+    def __init__(self, db_path: str = 'http_cache.db', max_bytes: int = 50 * 1024 * 1024, ttl_seconds: float = 72 * 3600):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._total_size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.evict()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+        if not row:
+            return None
+        if time.time() - row[4] > self.ttl_seconds:
+            return None
+        return {'headers': json.loads(row[0]), 'body': row[1], 'etag': row[2], 'last_modified': row[3]}
+
+    def put(self, key: str, url: str, headers: dict, body: bytes, etag: str = None, last_modified: str = None):
+        now = time.time()
+        with self._lock, self.conn:
+            previous = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if previous:
+                self._total_size -= previous[0]
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (key, url, headers, body, etag, last_modified, size, stored_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, json.dumps(headers), body, etag, last_modified, len(body), now, now)
+            )
+            self._total_size += len(body)
+        if self._total_size > self.max_bytes:
+            self.evict()
+
+    def touch(self, key: str):
+        """
+        Marks an entry as used and freshly validated by a 304 response.
+        """
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute('UPDATE responses SET accessed_at = ?, stored_at = ? WHERE key = ?', (now, now, key))
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used ones until the cache fits in max_bytes.
+        """
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM responses WHERE stored_at < ?', (time.time() - self.ttl_seconds,))
+            self._total_size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if self._total_size <= self.max_bytes:
+                return
+            rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+            for key, size in rows:
+                if self._total_size <= self.max_bytes:
+                    break
+                self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._total_size -= size
+
+    def close(self):
+        self.conn.close()
+
+
+def cache_key(request) -> str:
+    identity = '\n'.join(request.headers.get(name, '') for name in _AUTH_HEADERS)
+    return hashlib.sha256(f"{request.method} {request.url}\n{identity}".encode('utf-8')).hexdigest()
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """
+    Transport adapter that revalidates cached GET responses with If-None-Match / If-Modified-Since
+    and serves 304 Not Modified responses from the cache. Other requests pass straight through
+    to the wrapped adapter.
+    """
+    def __init__(self, cache: HTTPCache, adapter: HTTPAdapter = None):
+        super().__init__()
+        self.cache = cache
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return self.adapter.send(request, **kwargs)
+
+        key = cache_key(request)
+        entry = self.cache.get(key)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.adapter.send(request, **kwargs)
+
+        if response.status_code == 304 and entry:
+            self.cache.touch(key)
+            cached = self._build_cached_response(request, response, entry)
+            # Hand the 304's connection back to the keep-alive pool right away
+            response.close()
+            return cached
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 200 and (etag or last_modified):
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS}
+            self.cache.put(key, request.url, headers, response.content, etag, last_modified)
+        return response
+
+    @staticmethod
+    def _build_cached_response(request, not_modified, entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        headers = CaseInsensitiveDict(entry['headers'])
+        # A 304 may carry refreshed headers (e.g. pagination links); prefer them over the cached ones
+        for name, value in not_modified.headers.items():
+            if name.lower() not in _DROPPED_HEADERS:
+                headers[name] = value
+        response.headers = headers
+        response._content = entry['body']
+        response.encoding = requests.utils.get_encoding_from_headers(headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        response.from_cache = True
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def install_http_cache(session, cache: HTTPCache):
+    """
+    Mounts a ConditionalCacheAdapter for every URL on the given requests session,
+    wrapping the adapter that is currently mounted (e.g. a SchedulingAdapter).
+    """
+    adapter = ConditionalCacheAdapter(cache, session.get_adapter('https://'))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
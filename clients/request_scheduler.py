@@ -0,0 +1,328 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+
+# Canvas throttles with a leaky bucket of 700 units; below the low-water mark we back off
+# and wait for it to drain at roughly CANVAS_LEAK_RATE units per second
+CANVAS_LOW_WATER = 150.0
+CANVAS_LEAK_RATE = 10.0
+
+RETRY_STATUSES = {500, 502, 503, 504}
+# Server errors and dropped connections are only retried when repeating the request is harmless
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def is_throttled(status: int, body: bytes = b'') -> bool:
+    """
+    TickTick answers bursts with 429; Canvas uses 403 Forbidden (Rate Limit Exceeded).
+    """
+    if status == 429:
+        return True
+    return status == 403 and b'Rate Limit Exceeded' in (body or b'')
+
+
+def parse_retry_after(value: str):
+    """
+    Parses a Retry-After header (delay in seconds or HTTP date) into seconds to wait.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def host_key(url: str) -> str:
+    """
+    Key of a URL's host for the scheduler: host and port (e.g. 127.0.0.1:8001), without the
+    scheme's default port, so several servers on one machine are paced separately.
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    port = parsed.port
+    if port and (parsed.scheme, port) not in (('https', 443), ('http', 80)):
+        return f"{host}:{port}"
+    return host
+
+
+def _header_float(headers, name: str):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """
+    Admission control for one host: a token bucket (rate requests/second, bursts of `burst`)
+    and an adaptive concurrency limit. The limit grows by one per window of successful
+    responses and halves (at most once a second) on throttling, server errors or when
+    Canvas reports its rate-limit bucket is nearly exhausted.
+    """
+    def __init__(self, rate: float = None, burst: int = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self.tokens = float(self.capacity)
+        self.refilled_at = time.monotonic()
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        return max(1, int(self.limit))
+
+    def _try_acquire(self, now: float):
+        """
+        Takes a slot if one is free. Returns 0 on success, the seconds until a token or the end
+        of a pause otherwise, or None when waiting for an in-flight request to finish.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= self.concurrency:
+            return None
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._try_acquire(time.monotonic())
+                if wait == 0:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def acquire_async(self):
+        while True:
+            with self._cond:
+                wait = self._try_acquire(time.monotonic())
+            if wait == 0:
+                return
+            await asyncio.sleep(wait if wait is not None else 0.01)
+
+    def _decrease(self, now: float):
+        if now - self.decreased_at >= 1.0:
+            self.limit = max(1.0, self.limit / 2)
+            self.decreased_at = now
+
+    def _increase(self):
+        self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def release(self, status: int = None, headers=None, throttled: bool = False):
+        """
+        Frees the slot taken by acquire() and adapts the concurrency limit to the response.
+        status is None when the request failed without a response.
+        """
+        headers = headers or {}
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            remaining = _header_float(headers, 'X-Rate-Limit-Remaining')
+            if throttled:
+                self._decrease(now)
+                # Hold back every request to this host, not just the one that got throttled
+                self.paused_until = max(self.paused_until, now + (parse_retry_after(headers.get('Retry-After')) or 1.0))
+            elif status is None or status in RETRY_STATUSES:
+                self._decrease(now)
+            elif remaining is not None and remaining < CANVAS_LOW_WATER:
+                self._decrease(now)
+                cost = _header_float(headers, 'X-Request-Cost') or 1.0
+                if remaining < cost * self.concurrency * 2:
+                    # Let the bucket drain before spending more of it
+                    self.paused_until = max(self.paused_until, now + (CANVAS_LOW_WATER - remaining) / CANVAS_LEAK_RATE)
+            else:
+                self._increase()
+            self._cond.notify_all()
+
+
+class FairLimiter:
+    """
+    Caps the requests in flight across all tenants of a process. At the cap, each freed slot
+    goes to the next tenant (round-robin) that has requests waiting, so one large account
+    can't starve the others.
+    """
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        # tenant -> its waiting requests, in the order tenants get their next slot
+        self._waiters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, tenant):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return
+            ready = threading.Event()
+            self._waiters.setdefault(tenant, deque()).append(ready)
+        ready.wait()
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+            # Hand the slot over directly and send the tenant to the back of the rotation
+            tenant, waiting = self._waiters.popitem(last=False)
+            ready = waiting.popleft()
+            if waiting:
+                self._waiters[tenant] = waiting
+        ready.set()
+
+
+class SharedTransport(HTTPAdapter):
+    """
+    Keep-alive connection pools (one per host) shared by the sessions of many tenants, with a
+    global, per-tenant fair limit on the requests in flight. Connections carry no credentials,
+    so reusing them across accounts is safe; cookies and auth headers stay on each session.
+    """
+    def __init__(self, max_in_flight: int = 32, pool_maxsize: int = None):
+        super().__init__(pool_connections=16, pool_maxsize=pool_maxsize or max_in_flight)
+        self.limiter = FairLimiter(max_in_flight)
+
+    def send_as(self, tenant, request, **kwargs):
+        self.limiter.acquire(tenant)
+        try:
+            return self.send(request, **kwargs)
+        finally:
+            self.limiter.release()
+
+
+class RequestScheduler:
+    """
+    Request admission and retry policy shared by the Canvas and TickTick clients. Keeps one
+    HostState per host and computes jittered exponential backoff for retries on throttling,
+    server errors and dropped connections. With a SharedTransport, requests go out over its
+    connection pools under the tenant's share of its global limit.
+    """
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 default_max_concurrency: int = DEFAULT_MAX_CONCURRENCY, transport: SharedTransport = None, tenant: str = None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_max_concurrency = default_max_concurrency
+        self.transport = transport
+        self.tenant = tenant
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def configure_host(self, host: str, rate: float = None, burst: int = None, max_concurrency: int = None) -> HostState:
+        """
+        Sets the limits of a host, given as host_key() of its URLs (host, or host:port).
+        """
+        state = HostState(rate, burst, max_concurrency or self.default_max_concurrency)
+        with self._lock:
+            self._hosts[host] = state
+        return state
+
+    def host(self, url: str) -> HostState:
+        host = host_key(url)
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = HostState(max_concurrency=self.default_max_concurrency)
+            return state
+
+    def retry_delay(self, method: str, attempt: int, status: int = None, headers=None, throttled: bool = False, error: bool = False):
+        """
+        Returns how long to wait before retrying, or None if the request should not be retried.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if not throttled:
+            retryable = error or status in RETRY_STATUSES
+            if not retryable or method.upper() not in IDEMPOTENT_METHODS:
+                return None
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+        if retry_after:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+class SchedulingAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends every request through the RequestScheduler, retrying
+    throttled and failed requests, over a keep-alive pool sized to the concurrency limit.
+    """
+    def __init__(self, scheduler: RequestScheduler, metrics=None, service: str = None, pool_maxsize: int = DEFAULT_MAX_CONCURRENCY):
+        # With a shared transport, its pools are used and this adapter's stay empty
+        super().__init__(pool_connections=4, pool_maxsize=max(pool_maxsize, 1))
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.service = service
+
+    def _note_retry(self, request, reason: str, delay: float, attempt: int):
+        logger.warning(f"{request.method} {request.url} {reason}; retrying in {delay:.1f}s (attempt {attempt + 1}/{self.scheduler.max_retries})")
+        if self.metrics is not None:
+            self.metrics.record_retry(self.service or urlparse(request.url).hostname, reason)
+
+    def send(self, request, **kwargs):
+        host = self.scheduler.host(request.url)
+        attempt = 0
+        while True:
+            host.acquire()
+            try:
+                if self.scheduler.transport is not None:
+                    response = self.scheduler.transport.send_as(self.scheduler.tenant, request, **kwargs)
+                else:
+                    response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                host.release()
+                delay = self.scheduler.retry_delay(request.method, attempt, error=True)
+                if delay is None:
+                    raise
+                self._note_retry(request, f"failed ({e.__class__.__name__})", delay, attempt)
+            except BaseException:
+                # Any other failure (e.g. ChunkedEncodingError) must not keep the slot taken
+                host.release()
+                raise
+            else:
+                throttled = is_throttled(response.status_code, response.content if response.status_code == 403 else b'')
+                host.release(response.status_code, response.headers, throttled)
+                delay = self.scheduler.retry_delay(request.method, attempt, response.status_code, response.headers, throttled)
+                if delay is None:
+                    return response
+                self._note_retry(request, 'throttled' if throttled else f"returned {response.status_code}", delay, attempt)
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+def install_request_scheduler(session, scheduler: RequestScheduler, metrics=None, service: str = None, pool_maxsize: int = None):
+    """
+    Mounts a SchedulingAdapter for every URL on the given requests session.
+    """
+    adapter = SchedulingAdapter(scheduler, metrics, service, pool_maxsize or scheduler.default_max_concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
@@ -1,28 +1,86 @@
 from ticktick.oauth2 import OAuth2
 from ticktick.api import TickTickClient as BaseTickTickClient
-from datetime import datetime
+from datetime import datetime, timezone
+import time
+import secrets
+import threading
 import logging
 
+from metrics import Metrics, install_request_metrics
+from clients.request_scheduler import RequestScheduler, install_request_scheduler
+from clients.ticktick_session import CachedTickTickClient, TickTickSessionStore, DEFAULT_FULL_SYNC_INTERVAL
+
+TICKTICK_API_HOST = 'api.ticktick.com'
+# ticktick-py's default file for the cached OAuth token
+DEFAULT_OAUTH_CACHE_PATH = '.token-oauth'
+
 logger = logging.getLogger(__name__)
 
+
+def new_object_id() -> str:
+    """
+    Generates a TickTick-style object ID (24 hex chars, timestamp prefixed, like a MongoDB ObjectId).
+    Assigning IDs client-side lets batch results be matched back to the submitted tasks.
+    """
+    return f"{int(time.time()):08x}{secrets.token_hex(8)}"
+
+
 class TickTickClient:
-    def __init__(self, username, password, client_id=None, client_secret=None):
+    # Maximum number of tasks submitted in one batch/task request
+    BATCH_SIZE = 50
+
+    def __init__(self, username, password, client_id=None, client_secret=None, metrics: Metrics = None, scheduler: RequestScheduler = None,
+                 session_store: TickTickSessionStore = None, full_sync_interval: float = DEFAULT_FULL_SYNC_INTERVAL,
+                 oauth_cache_path: str = DEFAULT_OAUTH_CACHE_PATH):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        # Guards the local task state, which concurrent batch writes (apply_plan) update
+        self._state_lock = threading.Lock()
         try:
-            if client_id and client_secret:
-                auth_client = OAuth2(
-                    client_id=client_id,
-                    client_secret=client_secret,
-                    redirect_uri="http://127.0.0.1:8080"
-                )
-                self.client = BaseTickTickClient(username, password, auth_client)
-            else:
-                # Fallback to direct login if no OAuth client provided
-                self.client = BaseTickTickClient(username, password)
+            with self.metrics.phase('ticktick_login'):
+                if client_id and client_secret:
+                    auth_client = OAuth2(
+                        client_id=client_id,
+                        client_secret=client_secret,
+                        redirect_uri="http://127.0.0.1:8080",
+                        cache_path=oauth_cache_path
+                    )
+                    # Hook up metrics and the scheduler before the login and initial state download go out
+                    self._instrument_session(auth_client.session)
+                    self.client = self._connect(username, password, auth_client, session_store, full_sync_interval)
+                else:
+                    # Fallback to direct login if no OAuth client provided
+                    self.client = self._connect(username, password, None, session_store, full_sync_interval)
+                    self._instrument_session(self.client._session)
             logger.info("Successfully authenticated with TickTick.")
         except Exception as e:
             logger.error(f"Failed to authenticate with TickTick: {e}")
             raise
 
+    @staticmethod
+    def _connect(username, password, auth_client, session_store, full_sync_interval):
+        """
+        With a session store, reuse the cached token and state snapshot and only download
+        what changed since the last run; otherwise log in and download the full state.
+        """
+        if session_store is not None:
+            return CachedTickTickClient(username, password, auth_client, session_store, full_sync_interval)
+        if auth_client is not None:
+            return BaseTickTickClient(username, password, auth_client)
+        return BaseTickTickClient(username, password)
+
+    def _instrument_session(self, session):
+        install_request_metrics(session, self.metrics, 'ticktick')
+        install_request_scheduler(session, self.scheduler, self.metrics, 'ticktick')
+
+    def refresh(self):
+        """
+        Brings the local TickTick state up to date, e.g. between the cycles of --watch mode.
+        With a cached session only the changes since the last sync are downloaded.
+        """
+        with self.metrics.phase('ticktick_refresh'):
+            self.client.sync()
+
     def get_all_tasks(self):
         """
         Retrieve all tasks to build a deduplication set.
@@ -35,6 +93,12 @@ class TickTickClient:
             logger.error(f"Error fetching tasks from TickTick: {e}")
             return []
 
+    def get_open_task_ids(self) -> set:
+        """
+        Return the IDs of all uncompleted tasks in the current state.
+        """
+        return {task['id'] for task in self.get_all_tasks() if 'id' in task}
+
     def get_lists(self):
         """
         Retrieve all TickTick lists and folders to map Canvas courses accurately.
@@ -46,62 +110,271 @@ class TickTickClient:
             logger.error(f"Error fetching TickTick lists: {e}")
             return []
 
+    def get_folders(self):
+        """
+        Retrieve all TickTick folders (project groups).
+        """
+        return self.client.state.get('project_folders') or []
+
+    def _post_batch(self, endpoint: str, payload: dict) -> dict:
+        response = self.client.http_post(
+            self.client.BASE_URL + endpoint,
+            json=payload,
+            cookies=self.client.cookies,
+            headers=self.client.HEADERS
+        )
+        return response if isinstance(response, dict) else {}
+
+    def create_lists(self, names: list, folder_id: str = None) -> dict:
+        """
+        Create several lists, optionally inside a folder, with one batch/project request.
+        ticktick-py's project.create() re-downloads the whole account state after every call;
+        here the new lists are added to the local state instead. Returns the created lists by
+        name; lists TickTick rejected are left out.
+        """
+        projects = [{'id': new_object_id(), 'name': name, 'kind': 'TASK', 'groupId': folder_id} for name in names if name]
+        if not projects:
+            return {}
+        try:
+            id2error = self._post_batch('batch/project', {'add': projects}).get('id2error') or {}
+        except Exception as e:
+            logger.error(f"Failed to create TickTick lists {', '.join(names)}: {e}")
+            return {}
+        created = {}
+        with self._state_lock:
+            for project in projects:
+                if project['id'] in id2error:
+                    logger.error(f"Failed to create TickTick list {project['name']}: {id2error[project['id']]}")
+                    continue
+                self.client.state.setdefault('projects', []).append(project)
+                created[project['name']] = project
+                logger.info(f"Created new TickTick list: {project['name']}")
+        return created
+
     def create_list(self, name: str, folder_id: str = None) -> dict:
         """
         Create a new list with the given name, optionally under a specific folder.
         """
         if not name:
             return None
-        try:
-            new_list = self.client.project.create(name=name, folderId=folder_id)
-            logger.info(f"Created new TickTick list: {name}")
-            return new_list
-        except Exception as e:
-            logger.error(f"Failed to create TickTick list {name}: {e}")
-            return None
+        return self.create_lists([name], folder_id).get(name)
 
     def create_folder(self, name: str) -> dict:
         """
         Create a new TickTick folder.
         """
+        folder = {'id': new_object_id(), 'name': name, 'listType': 'group'}
         try:
-            new_folder = self.client.folder.create(name=name)
-            logger.info(f"Created new TickTick folder: {name}")
-            return new_folder
+            id2error = self._post_batch('batch/projectGroup', {'add': [folder]}).get('id2error') or {}
+            if folder['id'] in id2error:
+                raise RuntimeError(id2error[folder['id']])
         except Exception as e:
             logger.error(f"Failed to create TickTick folder {name}: {e}")
             return None
+        with self._state_lock:
+            self.client.state.setdefault('project_folders', []).append(folder)
+        logger.info(f"Created new TickTick folder: {name}")
+        return folder
+
+    def _build_task(self, title: str, description: str, due_date: datetime, project_id: str = None, tags: list = None, priority: int = 0) -> dict:
+        """
+        Build the TickTick task payload for the given fields.
+        """
+        # Build the task builder payload
+        task_data = {
+            'title': title,
+            'content': description,
+            'priority': priority,
+            'tags': tags if tags else []
+        }
+        if project_id:
+            task_data['projectId'] = project_id
+        
+        # Use TickTick client's built-in time generation where available, or map it manually.
+        # Convert due_date from datetime format to appropriate ticktick due date
+        # Ensure it is timezone aware
+        task_builder = self.client.task.builder(**task_data)
+        
+        # The builder supports setting dates. 
+        # We set the start Date to the same time
+        if due_date:
+            # ticktick-py builder dates should be aware
+            task_builder['dueDate'] = due_date.strftime('%Y-%m-%dT%H:%M:%S%z')
+            if not '%z' in due_date.strftime('%z'):
+                task_builder['dueDate'] = due_date.strftime('%Y-%m-%dT%H:%M:%S+0000') # fallback to UTC
+        return task_builder
 
     def create_task(self, title: str, description: str, due_date: datetime, project_id: str = None, tags: list = None, priority: int = 0) -> dict:
         """
         Create a task in TickTick.
         """
         try:
-            # Build the task builder payload
-            task_data = {
-                'title': title,
-                'content': description,
-                'priority': priority,
-                'tags': tags if tags else []
-            }
-            if project_id:
-                task_data['projectId'] = project_id
-            
-            # Use TickTick client's built-in time generation where available, or map it manually.
-            # Convert due_date from datetime format to appropriate ticktick due date
-            # Ensure it is timezone aware
-            task_builder = self.client.task.builder(**task_data)
-            
-            # The builder supports setting dates. 
-            # We set the start Date to the same time
-            if due_date:
-                # ticktick-py builder dates should be aware
-                task_builder['dueDate'] = due_date.strftime('%Y-%m-%dT%H:%M:%S%z')
-                if not '%z' in due_date.strftime('%z'):
-                    task_builder['dueDate'] = due_date.strftime('%Y-%m-%dT%H:%M:%S+0000') # fallback to UTC
-
+            task_builder = self._build_task(title, description, due_date, project_id, tags, priority)
             created_task = self.client.task.create(task_builder)
             return created_task
         except Exception as e:
             logger.error(f"Error creating task '{title}': {e}")
             return None
+
+    def create_tasks(self, specs: list, chunk_size: int = None) -> list:
+        """
+        Create many tasks through TickTick's batch task endpoint, chunk_size tasks per request.
+        Each spec is a dict of create_task keyword arguments, optionally with the task_id to
+        create the task under (e.g. one already journaled). Returns one entry per spec: the
+        created task dict, or None if that task failed.
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        results = []
+        for start in range(0, len(specs), chunk_size):
+            results.extend(self._create_task_chunk(specs[start:start + chunk_size]))
+        return results
+
+    def _create_task_chunk(self, specs: list) -> list:
+        tasks = []
+        for spec in specs:
+            try:
+                fields = dict(spec)
+                task_id = fields.pop('task_id', None)
+                task = self._build_task(**fields)
+                task['id'] = task_id or new_object_id()
+                task.setdefault('projectId', self.client.inbox_id)
+                tasks.append(task)
+            except Exception as e:
+                logger.error(f"Error building task '{spec.get('title')}': {e}")
+                tasks.append(None)
+
+        results = self._post_task_batch(tasks, 'add')
+        with self._state_lock:
+            for task in results:
+                if task:
+                    # Keep the local state current instead of re-downloading it after every batch
+                    self.client.state['tasks'].append(task)
+        return results
+
+    def _post_task_batch(self, tasks: list, action: str) -> list:
+        """
+        Post the given task payloads to the batch/task endpoint under `action` ('add', 'update'
+        or 'delete'). None entries are passed through. Returns the task payload for every item
+        TickTick accepted and None for the rest.
+        """
+        to_send = [task for task in tasks if task]
+        if not to_send:
+            return tasks
+
+        payload = {'add': [], 'update': []}
+        if action == 'delete':
+            payload['delete'] = [{'taskId': task['id'], 'projectId': task.get('projectId')} for task in to_send]
+        else:
+            payload[action] = to_send
+        try:
+            response = self._post_batch('batch/task', payload)
+        except Exception as e:
+            logger.error(f"Error sending batch of {len(to_send)} tasks ({action}): {e}")
+            return [None] * len(tasks)
+
+        id2error = response.get('id2error') or {}
+        results = []
+        for task in tasks:
+            if task and task['id'] in id2error:
+                logger.error(f"Error saving task '{task.get('title')}': {id2error[task['id']]}")
+                results.append(None)
+            else:
+                results.append(task)
+        return results
+
+    def complete_tasks(self, task_ids: list, chunk_size: int = None) -> list:
+        """
+        Marks many open tasks as completed through the batch task endpoint, chunk_size tasks per
+        request. Returns one entry per task ID: the completed task dict, or None if it failed.
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        existing = {task['id']: task for task in self.get_all_tasks() if 'id' in task}
+        completed_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+        results = []
+        for start in range(0, len(task_ids), chunk_size):
+            tasks = []
+            for task_id in task_ids[start:start + chunk_size]:
+                task = existing.get(task_id)
+                # status 2 is TickTick's "completed"
+                tasks.append(dict(task, status=2, completedTime=completed_time) if task else None)
+            results.extend(self._post_task_batch(tasks, 'update'))
+        done = {task['id'] for task in results if task}
+        if done:
+            # Completed tasks leave the open-task state, as after a full sync
+            with self._state_lock:
+                self.client.state['tasks'] = [task for task in self.client.state['tasks'] if task.get('id') not in done]
+        return results
+
+    def tag_tasks(self, task_ids: list, tag: str, chunk_size: int = None) -> list:
+        """
+        Adds a tag to many open tasks through the batch task endpoint, chunk_size tasks per request.
+        Returns one entry per task ID: the updated task dict, or None if it failed.
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        existing = {task['id']: task for task in self.get_all_tasks() if 'id' in task}
+        results = []
+        for start in range(0, len(task_ids), chunk_size):
+            tasks = []
+            for task_id in task_ids[start:start + chunk_size]:
+                task = existing.get(task_id)
+                if task:
+                    tags = list(task.get('tags') or [])
+                    tasks.append(dict(task, tags=tags if tag in tags else tags + [tag]))
+                else:
+                    tasks.append(None)
+            results.extend(self._post_task_batch(tasks, 'update'))
+        for task in results:
+            if task:
+                existing[task['id']].update(task)
+        return results
+
+    def delete_tasks(self, task_ids: list, chunk_size: int = None) -> list:
+        """
+        Deletes many open tasks through the batch task endpoint, chunk_size tasks per request.
+        Returns one entry per task ID: the deleted task dict, or None if it failed.
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        existing = {task['id']: task for task in self.get_all_tasks() if 'id' in task}
+        results = []
+        for start in range(0, len(task_ids), chunk_size):
+            results.extend(self._post_task_batch([existing.get(task_id) for task_id in task_ids[start:start + chunk_size]], 'delete'))
+        done = {task['id'] for task in results if task}
+        if done:
+            with self._state_lock:
+                self.client.state['tasks'] = [task for task in self.client.state['tasks'] if task.get('id') not in done]
+        return results
+
+    def update_tasks(self, updates: list, chunk_size: int = None) -> list:
+        """
+        Update many existing tasks through TickTick's batch task endpoint, chunk_size tasks per request.
+        Each update is a dict of create_task keyword arguments plus the task_id to update.
+        Returns one entry per update: the updated task dict, or None if that update failed.
+        """
+        chunk_size = chunk_size or self.BATCH_SIZE
+        # Merge into the existing task objects so fields we don't manage (status, reminders, ...) survive
+        existing = {task['id']: task for task in self.get_all_tasks() if 'id' in task}
+        results = []
+        for start in range(0, len(updates), chunk_size):
+            results.extend(self._update_task_chunk(updates[start:start + chunk_size], existing))
+        return results
+
+    def _update_task_chunk(self, updates: list, existing: dict) -> list:
+        tasks = []
+        for update in updates:
+            fields = dict(update)
+            task_id = fields.pop('task_id')
+            try:
+                task = dict(existing.get(task_id, {}))
+                task.update(self._build_task(**fields))
+                task['id'] = task_id
+                task.setdefault('projectId', self.client.inbox_id)
+                tasks.append(task)
+            except Exception as e:
+                logger.error(f"Error building update for task '{fields.get('title')}': {e}")
+                tasks.append(None)
+
+        results = self._post_task_batch(tasks, 'update')
+        for task in results:
+            if task and task['id'] in existing:
+                existing[task['id']].update(task)
+        return results
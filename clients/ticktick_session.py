@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+from ticktick.api import TickTickClient as BaseTickTickClient
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_VERSION = 1
+# Even with a valid checkpoint, download the full state this often to drop anything a delta missed
+DEFAULT_FULL_SYNC_INTERVAL = 24 * 3600
+
+
+def _user_key(username: str) -> str:
+    return hashlib.sha256((username or '').lower().encode('utf-8')).hexdigest()
+
+
+class TickTickSessionStore:
+    """
+    Persists the TickTick auth token, account settings and the last state snapshot with its
+    sync checkpoint in a JSON file readable only by the current user.
+    """
+    def __init__(self, path: str = 'ticktick_session.json'):
+        self.path = path
+
+    def load(self, username: str):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable TickTick session cache {self.path}: {e}")
+            return None
+        if data.get('version') != SESSION_CACHE_VERSION or data.get('user') != _user_key(username):
+            return None
+        return data
+
+    def save(self, username: str, data: dict):
+        data = dict(data, version=SESSION_CACHE_VERSION, user=_user_key(username), saved_at=time.time())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ticktick_session.')
+        try:
+            os.chmod(tmp_path, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save TickTick session cache {self.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _merge_by_id(items: list, changed: list) -> list:
+    merged = {item['id']: item for item in items if 'id' in item}
+    for item in changed:
+        if 'id' in item:
+            merged[item['id']] = item
+    return list(merged.values())
+
+
+class CachedTickTickClient(BaseTickTickClient):
+    """
+    ticktick-py client that reuses a cached auth token instead of logging in with the password,
+    and keeps its state current by applying only the changes since the last sync checkpoint
+    (batch/check/{checkpoint}) instead of downloading every project, task and tag.
+    Falls back to a normal login and full download when the cached token is rejected.
+    """
+    def __init__(self, username: str, password: str, oauth=None, session_store: TickTickSessionStore = None,
+                 full_sync_interval: float = DEFAULT_FULL_SYNC_INTERVAL):
+        self.username = username
+        self.session_store = session_store
+        self.full_sync_interval = full_sync_interval
+        self.checkpoint = 0
+        self.full_sync_at = 0.0
+        if oauth is not None:
+            super().__init__(username, password, oauth)
+        else:
+            super().__init__(username, password)
+
+    def _prepare_session(self, username, password):
+        cached = self.session_store.load(username) if self.session_store else None
+        if cached and cached.get('access_token'):
+            self._restore(cached)
+            try:
+                self.sync()
+                logger.info("Resumed cached TickTick session.")
+                return
+            except Exception as e:
+                logger.info(f"Cached TickTick session was rejected ({e}). Logging in again.")
+                self.reset_local_state()
+                self.checkpoint = 0
+        super()._prepare_session(username, password)
+
+    def _restore(self, cached: dict):
+        self.access_token = cached['access_token']
+        self.cookies = dict(cached.get('cookies') or {}, t=self.access_token)
+        self.time_zone = cached.get('time_zone', '')
+        self.profile_id = cached.get('profile_id', '')
+        self.inbox_id = cached.get('inbox_id', '')
+        self.checkpoint = cached.get('checkpoint') or 0
+        self.full_sync_at = cached.get('full_sync_at') or 0.0
+        state = cached.get('state') or {}
+        for key in ('projects', 'project_folders', 'tags', 'tasks'):
+            self.state[key] = state.get(key, [])
+        if time.time() - self.full_sync_at >= self.full_sync_interval:
+            # Keep the token, but rebuild the state from scratch
+            self.checkpoint = 0
+
+    def sync(self):
+        """
+        Brings the local state up to date: a full download at checkpoint 0, otherwise
+        only the projects and tasks that changed since the last checkpoint.
+        """
+        response = self.http_get(self.BASE_URL + f"batch/check/{self.checkpoint}", cookies=self.cookies, headers=self.HEADERS)
+        task_bean = response.get('syncTaskBean') or {}
+
+        if not self.checkpoint:
+            self.state['project_folders'] = response.get('projectGroups') or []
+            self.state['projects'] = response.get('projectProfiles') or []
+            self.state['tasks'] = task_bean.get('update') or []
+            self.state['tags'] = response.get('tags') or []
+            self.full_sync_at = time.time()
+        else:
+            if response.get('projectGroups') is not None:
+                self.state['project_folders'] = _merge_by_id(self.state['project_folders'], response['projectGroups'])
+            if response.get('projectProfiles') is not None:
+                self.state['projects'] = _merge_by_id(self.state['projects'], response['projectProfiles'])
+            if response.get('tags') is not None:
+                self.state['tags'] = response['tags']
+            self._apply_task_delta(task_bean)
+
+        if response.get('inboxId'):
+            self.inbox_id = response['inboxId']
+        self.checkpoint = response.get('checkPoint') or self.checkpoint
+        self.save_session()
+        return response
+
+    def _apply_task_delta(self, task_bean: dict):
+        # The state only holds uncompleted tasks; completed or deleted ones drop out
+        tasks = {task['id']: task for task in self.state['tasks'] if 'id' in task}
+        for task in task_bean.get('update') or []:
+            if task.get('status', 0) == 0 and not task.get('deleted'):
+                tasks[task['id']] = task
+            else:
+                tasks.pop(task['id'], None)
+        for deleted in task_bean.get('delete') or []:
+            tasks.pop(deleted.get('taskId') if isinstance(deleted, dict) else deleted, None)
+        self.state['tasks'] = list(tasks.values())
+
+    def save_session(self):
+        if not self.session_store:
+            return
+        self.session_store.save(self.username, {
+            'access_token': self.access_token,
+            'cookies': self.cookies,
+            'time_zone': self.time_zone,
+            'profile_id': self.profile_id,
+            'inbox_id': self.inbox_id,
+            'checkpoint': self.checkpoint,
+            'full_sync_at': self.full_sync_at,
+            'state': {key: self.state.get(key, []) for key in ('projects', 'project_folders', 'tags', 'tasks')},
+        })
@@ -1,5 +1,6 @@
 import yaml
 import os
+import hashlib
 from datetime import timedelta
 import logging
 
@@ -25,16 +26,43 @@ DEFAULT_CONFIG = {
         'exam_keywords': ['exam', 'quiz', 'midterm', 'final'],
         'default': ['Coursework']
     },
+    # Extra rules: 'match' is a keyword (or a regex with 'regex: true') checked against the
+    # 'title', 'description' or 'any'; 'courses' limits a rule to some courses. Example:
+    # - {match: 'lab \d+', regex: true, courses: ['Course Name 1'], priority: 5, tags: ['Lab'], list: 'Labs'}
+    'rules': [],
     'due_date_offset_hours': 0,
-    'ticktick_target_list': 'Coursework' # Parent list name
+    'full_fetch_interval_hours': 24, # Incremental runs still re-fetch every course in full this often
+    'ticktick_target_list': 'Coursework', # Parent list name
+    'canvas_max_concurrency': 4, # Max concurrent Canvas requests for the async backend
+    'canvas_requests_per_second': 10, # Request pacing per service; throttled requests are retried with backoff
+    'ticktick_requests_per_second': 5,
+    'ticktick_full_sync_hours': 24, # Between these, only TickTick changes since the last run are downloaded
+    'max_request_retries': 5,
+    'http_cache_max_mb': 50, # On-disk cache of Canvas responses, revalidated with ETags
+    'http_cache_ttl_hours': 72,
+    'html_render_workers': 0, # Worker processes for converting large batches of new descriptions (0 = in-process)
+    # --watch polls each course between these intervals: often when it has assignments due soon
+    # or just changed, backing off for dormant courses
+    'watch_min_interval_minutes': 5,
+    'watch_max_interval_minutes': 120,
+    'watch_due_soon_hours': 48,
+    # Tasks whose assignment was deleted, unpublished or lost its due date in Canvas:
+    # 'keep' them, 'tag' them with orphaned_task_tag, 'complete' them or 'delete' them
+    'orphaned_task_policy': 'tag',
+    'orphaned_task_tag': 'Removed from Canvas'
 }
 
+ORPHANED_TASK_POLICIES = ('keep', 'tag', 'complete', 'delete')
+
 from typing import List, Dict, Any
 
+from rule_engine import RuleEngine
+
 class ConfigManager:
     def __init__(self, config_path: str = 'config.yaml'):
         self.config_path = config_path
         self.config: Dict[str, Any] = {}
+        self.loaded_mtime = None
         self.load_or_create_config()
 
     def load_or_create_config(self):
@@ -46,6 +74,32 @@ class ConfigManager:
         else:
             with open(self.config_path, 'r') as f:
                 self.config = yaml.safe_load(f)
+        self.loaded_mtime = os.path.getmtime(self.config_path)
+
+        # Compile the priority/tag/list rules once instead of re-reading them per assignment
+        self.rule_engine = RuleEngine.from_config(self.config)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads the config when the file's mtime changed since it was loaded. Returns True if
+        it was reloaded; an unreadable or invalid file keeps the previous config.
+        """
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return False
+        if mtime == self.loaded_mtime:
+            return False
+        previous = (self.config, self.rule_engine)
+        try:
+            self.load_or_create_config()
+        except Exception as e:
+            logger.error(f"Failed to reload {self.config_path}, keeping the previous config: {e}")
+            self.config, self.rule_engine = previous
+            self.loaded_mtime = mtime
+            return False
+        logger.info(f"Reloaded {self.config_path}.")
+        return True
 
     def is_course_monitored(self, course_name: str) -> bool:
         monitored_courses = self.config.get('courses_to_monitor', [])
@@ -57,43 +111,85 @@ class ConfigManager:
         mappings = self.config.get('ticktick_list_mappings', {})
         return mappings.get(course_name, mappings.get('default', 'Coursework'))
 
-    def get_priority(self, assignment_title: str) -> int:
-        title_lower = assignment_title.lower()
-        priorities = self.config.get('priorities', {})
-        
-        for kw in priorities.get('high_keywords', []):
-            if kw.lower() in title_lower:
-                return 5
-                
-        for kw in priorities.get('low_keywords', []):
-            if kw.lower() in title_lower:
-                return 1
-                
-        return priorities.get('default', 3)
-
-    def get_tags(self, assignment_title: str) -> list:
-        title_lower = assignment_title.lower()
-        tags_config = self.config.get('tags', {})
-        
-        tags = []
-        for kw in tags_config.get('exam_keywords', []):
-            if kw.lower() in title_lower:
-                tags.append('Exam')
-                break
-                
-        for kw in tags_config.get('homework_keywords', []):
-            if kw.lower() in title_lower:
-                tags.append('Homework')
-                break
-                
-        if not tags:
-            tags = tags_config.get('default', [])
-            
-        return tags
+    def get_priority(self, assignment_title: str, description: str = '', course_name: str = None) -> int:
+        return self.rule_engine.classify(assignment_title, description, course_name).priority
+
+    def get_tags(self, assignment_title: str, description: str = '', course_name: str = None) -> list:
+        return self.rule_engine.classify(assignment_title, description, course_name).tags
+
+    def classify(self, assignment_title: str, description: str = '', course_name: str = None):
+        """
+        Returns the priority, tags and optional list override for an assignment.
+        """
+        return self.rule_engine.classify(assignment_title, description, course_name)
+
+    def classify_many(self, items) -> list:
+        """
+        Classifies a batch of (title, description, course_name) tuples with the compiled rules.
+        """
+        return self.rule_engine.classify_many(items)
 
     def get_date_offset(self) -> timedelta:
         offset_hours = self.config.get('due_date_offset_hours', 0)
         return timedelta(hours=offset_hours)
     
+    def get_full_fetch_interval(self) -> timedelta:
+        interval_hours = self.config.get('full_fetch_interval_hours', 24)
+        return timedelta(hours=interval_hours)
+
+    def get_fingerprint(self) -> str:
+        """
+        Hash of the loaded configuration, used to detect config edits between runs.
+        """
+        dumped = yaml.safe_dump(self.config, sort_keys=True)
+        return hashlib.sha1(dumped.encode('utf-8')).hexdigest()
+
+    def get_canvas_max_concurrency(self) -> int:
+        return self.config.get('canvas_max_concurrency', 4)
+
+    def get_canvas_rate_limit(self) -> float:
+        return self.config.get('canvas_requests_per_second', 10)
+
+    def get_ticktick_rate_limit(self) -> float:
+        return self.config.get('ticktick_requests_per_second', 5)
+
+    def get_ticktick_full_sync_interval(self) -> timedelta:
+        interval_hours = self.config.get('ticktick_full_sync_hours', 24)
+        return timedelta(hours=interval_hours)
+
+    def get_max_request_retries(self) -> int:
+        return self.config.get('max_request_retries', 5)
+
+    def get_http_cache_max_bytes(self) -> int:
+        return int(self.config.get('http_cache_max_mb', 50) * 1024 * 1024)
+
+    def get_http_cache_ttl(self) -> timedelta:
+        ttl_hours = self.config.get('http_cache_ttl_hours', 72)
+        return timedelta(hours=ttl_hours)
+
+    def get_html_render_workers(self) -> int:
+        return max(0, int(self.config.get('html_render_workers', 0) or 0))
+
+    def get_watch_intervals(self):
+        """
+        Returns the (min, max) polling interval of --watch mode in seconds.
+        """
+        min_interval = max(1.0, float(self.config.get('watch_min_interval_minutes', 5)) * 60)
+        max_interval = max(min_interval, float(self.config.get('watch_max_interval_minutes', 120)) * 60)
+        return min_interval, max_interval
+
+    def get_watch_due_soon_window(self) -> timedelta:
+        return timedelta(hours=self.config.get('watch_due_soon_hours', 48))
+
+    def get_orphaned_task_policy(self) -> str:
+        policy = str(self.config.get('orphaned_task_policy', 'tag')).lower()
+        if policy not in ORPHANED_TASK_POLICIES:
+            logger.warning(f"Unknown orphaned_task_policy '{policy}', keeping orphaned tasks.")
+            return 'keep'
+        return policy
+
+    def get_orphaned_task_tag(self) -> str:
+        return self.config.get('orphaned_task_tag', 'Removed from Canvas')
+
     def get_target_list(self) -> str:
         return self.config.get('ticktick_target_list', 'Coursework')
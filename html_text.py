@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import multiprocessing
+from html.entities import html5
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Strings inside these tags are not part of the visible text
+HIDDEN_TAGS = {'script', 'style', 'template'}
+# Whitespace inside these tags is kept as-is
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+# Void elements never contain text and are closed as soon as they open
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+}
+
+# Below this many uncached descriptions, starting worker processes costs more than it saves
+PROCESS_POOL_THRESHOLD = 64
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Streaming HTML-to-text converter. Collects the text nodes of a document without building
+    a tree, following the same rules as BeautifulSoup's html.parser builder + get_text().
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self._data = []
+        # Open elements, so an end tag closes everything opened after its start tag
+        self._open_tags = []
+        # Void elements opened without a self-closing slash; a matching end tag is ignored
+        self._closed_void_tags = []
+        self._hidden_depth = 0
+        self._preserve_depth = 0
+
+    def _flush(self, always_visible: bool = False):
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if self._hidden_depth and not always_visible:
+            return
+        # Whitespace-only strings collapse to a single newline or space
+        if not self._preserve_depth and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        self.strings.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_TAGS:
+            self._closed_void_tags.append(tag)
+            return
+        self._open_tags.append(tag)
+        if tag in HIDDEN_TAGS:
+            self._hidden_depth += 1
+        elif tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+        # BeautifulSoup lets <br/> consume the pending end tag of an earlier <br>
+        if tag in self._closed_void_tags:
+            self._closed_void_tags.remove(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void_tags:
+            self._closed_void_tags.remove(tag)
+            return
+        self._flush()
+        if tag not in self._open_tags:
+            # Stray end tag: nothing to close
+            return
+        while self._open_tags:
+            closed = self._open_tags.pop()
+            if closed in HIDDEN_TAGS:
+                self._hidden_depth -= 1
+            elif closed in PRESERVE_WHITESPACE_TAGS:
+                self._preserve_depth -= 1
+            if closed == tag:
+                break
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        if name[:1] in ('x', 'X'):
+            codepoint = int(name[1:], 16)
+        else:
+            codepoint = int(name)
+        data = None
+        if codepoint < 256:
+            # Numeric references below 256 are often really Windows-1252 (e.g. &#147;)
+            try:
+                data = bytes([codepoint]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self._data.append(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        # Unknown entities are kept as the literal text "&name"
+        self._data.append(html5.get(name + ';', f"&{name}"))
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.upper().startswith('CDATA['):
+            # CDATA sections count as text even inside hidden elements
+            self._data.append(data[len('CDATA['):])
+            self._flush(always_visible=True)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def html_to_text(html: str) -> str:
+    """
+    Converts an HTML assignment description to plain text, one text node per line.
+    Equivalent to BeautifulSoup(html, "html.parser").get_text(separator="\\n").strip().
+    """
+    if not html:
+        return ''
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return '\n'.join(extractor.strings).strip()
+
+
+def description_digest(html: str) -> str:
+    return hashlib.sha1(html.encode('utf-8')).hexdigest()
+
+
+def new_render_pool(max_workers: int):
+    """
+    Process pool for render_descriptions(), or None when max_workers is 0. Meant to be created
+    once per sync. The workers are spawned rather than forked, because the sync's pipeline
+    threads are running by then and a forked child could inherit a lock one of them holds.
+    """
+    if not max_workers:
+        return None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def render_descriptions(descriptions: list, cache=None, pool: ProcessPoolExecutor = None) -> list:
+    """
+    Renders a batch of HTML descriptions to text. Results are memoized by a hash of the HTML in
+    `cache` (an object with get_rendered_many/put_rendered_many, e.g. SyncIndex), so unchanged
+    descriptions are never parsed twice. With a pool (see new_render_pool()), large batches
+    of uncached descriptions are rendered in its worker processes.
+    """
+    digests = [description_digest(html) if html else None for html in descriptions]
+    rendered = cache.get_rendered_many([d for d in digests if d]) if cache is not None else {}
+
+    missing = {}
+    for html, digest in zip(descriptions, digests):
+        if digest and digest not in rendered and digest not in missing:
+            missing[digest] = html
+
+    if missing:
+        html_list = list(missing.values())
+        if pool is not None and len(html_list) >= PROCESS_POOL_THRESHOLD:
+            texts = list(pool.map(html_to_text, html_list, chunksize=16))
+        else:
+            texts = [html_to_text(html) for html in html_list]
+        new_entries = dict(zip(missing.keys(), texts))
+        rendered.update(new_entries)
+        if cache is not None:
+            cache.put_rendered_many(new_entries)
+
+    return [rendered[digest] if digest else '' for digest in digests]
@@ -1,12 +1,16 @@
 import os
 import sys
+import shutil
 import logging
+import tempfile
 from dotenv import load_dotenv
 
 from config_manager import ConfigManager
-from clients.canvas_client import CanvasClient
-from clients.ticktick_client import TickTickClient
-from sync_manager import SyncManager
+from clients.request_scheduler import RequestScheduler, host_key
+from sync_index import SyncIndex
+from metrics import Metrics
+# The Canvas/TickTick clients and SyncManager are imported inside main(), after the
+# --precheck fast path, so a run that finds nothing to do never loads them
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -27,7 +31,13 @@ def main():
     ticktick_client_id = os.getenv('TICKTICK_CLIENT_ID')
     ticktick_client_secret = os.getenv('TICKTICK_CLIENT_SECRET')
 
+    config_path = "config.yaml"
     state_file_path = "canvas_state.json"
+    sync_index_path = "sync_index.db"
+    sync_journal_path = "sync_journal.jsonl"
+    http_cache_path = "http_cache.db"
+    ticktick_session_path = "ticktick_session.json"
+    browser_profile_path = "canvas_browser_profile"
 
     if not all([canvas_url, ticktick_user, ticktick_pass]):
         logger.error("Missing required environment variables for TickTick or Canvas URL. Please check your .env file.")
@@ -37,42 +47,210 @@ def main():
     parser = argparse.ArgumentParser(description="Sync Canvas assignments to TickTick.")
     parser.add_argument('--dry-run', action='store_true', help="Run the sync without creating tasks in TickTick.")
     parser.add_argument('--login', action='store_true', help="Launch browser to log in to Canvas and save session state.")
+    parser.add_argument('--no-session-check', action='store_true', help="Use the saved Canvas session as is, without checking it or refreshing it when it expired.")
+    parser.add_argument('--incremental', action='store_true', help="Only fetch Canvas assignments that changed since the last sync (with a periodic full fetch).")
+    parser.add_argument('--full-fetch', action='store_true', help="Force an incremental run to re-fetch every course in full.")
+    parser.add_argument('--canvas-backend', choices=['rest', 'async', 'graphql'], default='rest', help="Canvas fetch backend: 'rest' (canvasapi, one course at a time), 'async' (all courses concurrently) or 'graphql' (one query with only the fields the sync needs).")
+    parser.add_argument('--ticktick-full-sync', action='store_true', help="Ignore the cached TickTick session and state snapshot: log in and download the full state.")
+    parser.add_argument('--watch', action='store_true', help="Keep running and poll each course adaptively (often when deadlines are near or it just changed), reloading config.yaml when it changes.")
+    parser.add_argument('--plan', metavar='PATH', help="Compute the TickTick writes of a sync (lists, task creations, updates, completions) and save them to PATH without applying them.")
+    parser.add_argument('--apply', metavar='PATH', help="Apply a plan saved with --plan, without fetching Canvas. An interrupted apply resumes with the entries left in PATH.")
+    parser.add_argument('--precheck', action='store_true', help="Probe Canvas for changes first and exit without connecting to TickTick if nothing changed since the last clean sync.")
+    parser.add_argument('--no-http-cache', action='store_true', help="Disable the on-disk conditional-request cache for Canvas responses.")
+    parser.add_argument('--metrics', metavar='PATH', help="Write per-phase timings, request counts, latency histograms and bytes transferred to PATH.")
+    parser.add_argument('--metrics-format', choices=['prometheus', 'json'], help="Format of the --metrics file (default: json for *.json paths, Prometheus text otherwise).")
+    parser.add_argument('--profile', metavar='PATH', help="Run the sync under a sampling profiler and write the collapsed stacks to PATH.")
+    parser.add_argument('--record', metavar='PATH', help="Record the sync's Canvas and TickTick HTTP exchanges, with credentials redacted, and the local sync state it started from to a gzip cassette at PATH.")
+    parser.add_argument('--replay', metavar='PATH', help="Run the sync against a cassette saved with --record instead of the network, from a copy of the local state saved in it. Local files are left untouched.")
+    parser.add_argument('--replay-latency', action='store_true', help="With --replay, answer each request after the time it originally took, with the configured rate limits, instead of at full speed.")
     args = parser.parse_args()
 
     if args.login:
         from clients.canvas_auth import login_and_save_state
         logger.info("Running interactive Canvas login flow...")
-        login_and_save_state(canvas_url, canvas_username, canvas_password, state_file_path)
+        login_and_save_state(canvas_url, canvas_username, canvas_password, state_file_path, browser_profile_path)
         
     state_file_arg = state_file_path if os.path.exists(state_file_path) else None
-    
-    if not (canvas_token or canvas_session_cookie or state_file_arg):
+    if args.apply and (args.plan or args.watch or args.dry_run):
+        logger.error("--apply cannot be combined with --plan, --watch or --dry-run.")
+        sys.exit(1)
+    if (args.record or args.replay) and (args.watch or args.login or args.canvas_backend == 'async' or (args.record and args.replay)):
+        logger.error("--record and --replay need the rest or graphql backend and cannot be combined with each other, --watch or --login.")
+        sys.exit(1)
+
+    cassette = None
+    replay_transport = None
+    replay_dir = None
+    if args.replay:
+        from clients.cassette import Cassette, ReplayTransport
+        cassette = Cassette.load(args.replay)
+        replay_transport = ReplayTransport(cassette, latency_scale=1.0 if args.replay_latency else 0.0)
+        # Start from the state the recording started from, in a scratch directory
+        replay_dir = tempfile.mkdtemp(prefix='replay-')
+        replayed_files = cassette.restore_files(replay_dir)
+        config_path = replayed_files.get('config.yaml', config_path)
+        sync_index_path = os.path.join(replay_dir, 'sync_index.db')
+        sync_journal_path = os.path.join(replay_dir, 'sync_journal.jsonl')
+        ticktick_session_path = os.path.join(replay_dir, 'ticktick_session.json')
+        # The recorded requests carry no credentials, so none are needed
+        state_file_arg = None
+        args.no_session_check = True
+        args.no_http_cache = True
+    elif args.record:
+        from clients.cassette import Cassette, RecordingTransport
+        cassette = Cassette()
+        # Conditional requests would depend on the cache's contents, which are not recorded
+        args.no_http_cache = True
+
+    if not args.apply and not args.replay and not (canvas_token or canvas_session_cookie or state_file_arg):
         logger.error("No Canvas authentication method found. Please set CANVAS_API_TOKEN, CANVAS_SESSION_COOKIE, or run with --login to log in via browser.")
         sys.exit(1)
 
+    metrics = Metrics()
+    profiler = None
+    if args.profile:
+        from sampling_profiler import SamplingProfiler
+        profiler = SamplingProfiler().start()
+
     try:
         # Initialize Config Manager (will auto-generate config.yaml if it doesn't exist)
-        configManager = ConfigManager('config.yaml')
+        configManager = ConfigManager(config_path)
+        # A full-speed replay is not paced: the cassette has nothing to throttle
+        paced = not args.replay or args.replay_latency
+
+        # One scheduler paces and retries the requests of both clients, per host
+        scheduler = RequestScheduler(max_retries=configManager.get_max_request_retries(), default_max_concurrency=configManager.get_canvas_max_concurrency(),
+                                     transport=replay_transport)
+        scheduler.configure_host(host_key(canvas_url), rate=configManager.get_canvas_rate_limit() if paced else None, max_concurrency=configManager.get_canvas_max_concurrency())
+
+        if state_file_arg and not args.login and not args.no_session_check and not args.apply:
+            from clients.canvas_session import CanvasSession
+            canvasSession = CanvasSession(
+                canvas_url, state_file_arg, browser_profile_path,
+                username=canvas_username, password=canvas_password,
+                metrics=metrics, scheduler=scheduler
+            )
+            if not canvasSession.ensure():
+                if not (canvas_token or canvas_session_cookie):
+                    logger.error("The saved Canvas session is no longer valid. Run with --login to log in again.")
+                    sys.exit(1)
+                # The state file takes precedence over the other methods, so drop it
+                logger.warning("The saved Canvas session is no longer valid; falling back to CANVAS_API_TOKEN/CANVAS_SESSION_COOKIE.")
+                state_file_arg = None
+
+        if args.record:
+            # Snapshot the local state before the sync changes it, then record from here on
+            cassette.add_file('config.yaml', config_path)
+            cassette.add_file('sync_index.db', sync_index_path)
+            cassette.add_file('sync_journal.jsonl', sync_journal_path)
+            if not args.ticktick_full_sync:
+                cassette.add_file('ticktick_session.json', ticktick_session_path)
+            scheduler.transport = RecordingTransport(cassette)
+
+        syncIndex = SyncIndex(sync_index_path)
+        change_fingerprint = None
+        if args.precheck and not args.watch and not args.apply:
+            from clients.canvas_probe import CanvasChangeProbe
+            from sync_manager import is_canvas_unchanged
+            probe = CanvasChangeProbe(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file_arg, metrics=metrics, scheduler=scheduler)
+            change_fingerprint = probe.fingerprint(configManager.is_course_monitored, salt=configManager.get_fingerprint())
+            if is_canvas_unchanged(syncIndex, change_fingerprint):
+                logger.info("No Canvas changes since the last sync. Nothing to do.")
+                return
+
+        from clients.ticktick_client import TickTickClient, TICKTICK_API_HOST
+        from clients.ticktick_session import TickTickSessionStore
+        from sync_manager import SyncManager
+        from sync_journal import SyncJournal
+        scheduler.configure_host(TICKTICK_API_HOST, rate=configManager.get_ticktick_rate_limit() if paced else None, max_concurrency=2)
         
         # Initialize API Clients
-        logger.info("Connecting to Canvas...")
-        canvasClient = CanvasClient(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file_arg)
+        canvasClient = None
+        if not args.apply:
+            logger.info("Connecting to Canvas...")
+        if args.apply:
+            # The plan already holds everything fetched from Canvas
+            logger.info("Applying a saved plan; Canvas is not contacted.")
+        elif args.canvas_backend == 'async':
+            from clients.async_canvas_client import AsyncCanvasClient
+            canvasClient = AsyncCanvasClient(
+                canvas_url, canvas_token or "",
+                session_cookie=canvas_session_cookie,
+                state_file=state_file_arg,
+                max_concurrency=configManager.get_canvas_max_concurrency(),
+                metrics=metrics,
+                scheduler=scheduler
+            )
+        elif args.canvas_backend == 'graphql':
+            from clients.graphql_canvas_client import GraphQLCanvasClient
+            canvasClient = GraphQLCanvasClient(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file_arg, metrics=metrics, scheduler=scheduler)
+        else:
+            from clients.canvas_client import CanvasClient
+            from clients.http_cache import HTTPCache
+            httpCache = None
+            if not args.no_http_cache:
+                httpCache = HTTPCache(
+                    http_cache_path,
+                    max_bytes=configManager.get_http_cache_max_bytes(),
+                    ttl_seconds=configManager.get_http_cache_ttl().total_seconds()
+                )
+            canvasClient = CanvasClient(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file_arg, http_cache=httpCache, metrics=metrics, scheduler=scheduler)
         
         logger.info("Connecting to TickTick...")
+        ticktickSessionStore = TickTickSessionStore(ticktick_session_path)
+        if args.ticktick_full_sync:
+            ticktickSessionStore.clear()
         ticktickClient = TickTickClient(
             username=ticktick_user, 
             password=ticktick_pass,
             client_id=ticktick_client_id, 
-            client_secret=ticktick_client_secret
+            client_secret=ticktick_client_secret,
+            metrics=metrics,
+            scheduler=scheduler,
+            session_store=ticktickSessionStore,
+            full_sync_interval=configManager.get_ticktick_full_sync_interval().total_seconds()
         )
         
         # Initialize and Run Sync Manager
-        syncManager = SyncManager(canvasClient, ticktickClient, configManager)
-        syncManager.run_sync(dry_run=args.dry_run)
+        syncManager = SyncManager(canvasClient, ticktickClient, configManager, sync_index=syncIndex, metrics=metrics,
+                                  journal=SyncJournal(sync_journal_path))
+        if args.apply:
+            from sync_plan import SyncPlan
+            syncManager.apply_plan(SyncPlan.load(args.apply), plan_path=args.apply)
+            return
+        if args.plan:
+            plan = syncManager.plan_sync(incremental=args.incremental, full_fetch=args.full_fetch)
+            plan.save(args.plan)
+            logger.info(f"Saved sync plan to {args.plan}. Review it, then run with --apply {args.plan}.")
+            return
+        if args.watch:
+            from watcher import Watcher
+            watcher = Watcher(syncManager, configManager, ticktickClient)
+            watcher.install_signal_handlers()
+            watcher.run(
+                dry_run=args.dry_run, incremental=args.incremental, full_fetch=args.full_fetch,
+                # Keep the metrics file current for scrapers while the process runs
+                after_cycle=(lambda: metrics.write(args.metrics, args.metrics_format)) if args.metrics else None
+            )
+            return
+        syncManager.run_sync(dry_run=args.dry_run, incremental=args.incremental, full_fetch=args.full_fetch, change_fingerprint=change_fingerprint)
         
     except Exception as e:
         logger.error(f"Application error: {e}")
         sys.exit(1)
+    finally:
+        # Written even for failed runs, which are the ones most worth looking at
+        if profiler:
+            profiler.stop()
+            profiler.write(args.profile)
+        if args.metrics:
+            metrics.write(args.metrics, args.metrics_format)
+        if args.record and cassette is not None:
+            cassette.save(args.record)
+            logger.info(f"Recorded {len(cassette.exchanges)} HTTP exchanges to {args.record}.")
+        if replay_transport is not None:
+            replay_transport.close()
+            shutil.rmtree(replay_dir, ignore_errors=True)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,233 @@
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Prometheus' default latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Numeric IDs (Canvas) and 24-hex object IDs (TickTick) are replaced so requests group per endpoint
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{24})$')
+
+
+def normalize_endpoint(url: str) -> str:
+    """
+    Reduces a request URL to its endpoint path, e.g. /api/v1/courses/:id/assignments.
+    """
+    path = urlparse(url).path or '/'
+    return '/'.join(':id' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> list:
+        """
+        Returns (upper bound, observations <= bound) pairs, ending with +Inf.
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((bound, total))
+        pairs.append((float('inf'), self.count))
+        return pairs
+
+
+class Metrics:
+    """
+    Collects per-phase wall-clock timers, per-endpoint request counts, latency histograms and
+    bytes transferred during a sync, and exports them as JSON or Prometheus text format.
+    Thread-safe, so it can be shared with clients making concurrent requests.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.phases = {}
+        self.requests = Counter()
+        self.cache_hits = Counter()
+        self.latency = {}
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.retries = Counter()
+        self.sync_stats = {}
+
+    def add_phase_time(self, name: str, seconds: float, calls: int = 1):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += calls
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, name: str):
+        """
+        Yields from iterable, counting only the time spent producing each item towards the phase
+        (the consumer's work between items is not included). Does not count as a call of the phase.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_phase_time(name, time.perf_counter() - start, calls=0)
+                return
+            self.add_phase_time(name, time.perf_counter() - start, calls=0)
+            yield item
+
+    def record_request(self, service: str, method: str, url: str, status: int, seconds: float,
+                       bytes_sent: int = 0, bytes_received: int = 0, from_cache: bool = False):
+        endpoint = normalize_endpoint(url)
+        key = (service, endpoint)
+        with self._lock:
+            self.requests[(service, method, endpoint, str(status))] += 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            self.bytes_sent[key] += bytes_sent
+            self.bytes_received[key] += bytes_received
+            if from_cache:
+                self.cache_hits[key] += 1
+
+    def record_response(self, service: str, response):
+        """
+        Records a finished requests.Response. Bodies served from the HTTP cache count as
+        a cache hit and are not counted as bytes received.
+        """
+        request = response.request
+        body = request.body or b''
+        from_cache = getattr(response, 'from_cache', False)
+        received = 0
+        if not from_cache:
+            length = response.headers.get('Content-Length')
+            received = int(length) if length and length.isdigit() else len(response.content or b'')
+        self.record_request(
+            service, request.method, request.url, response.status_code, response.elapsed.total_seconds(),
+            bytes_sent=len(body), bytes_received=received, from_cache=from_cache
+        )
+
+    def record_retry(self, service: str, reason: str):
+        with self._lock:
+            self.retries[(service, reason)] += 1
+
+    def set_sync_stats(self, stats: dict):
+        self.sync_stats = dict(stats)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for (service, method, endpoint, status), count in sorted(self.requests.items()):
+                entry = endpoints.setdefault(f"{service} {endpoint}", {
+                    'service': service, 'endpoint': endpoint, 'requests': {}, 'cache_hits': self.cache_hits[(service, endpoint)],
+                    'bytes_sent': self.bytes_sent[(service, endpoint)], 'bytes_received': self.bytes_received[(service, endpoint)],
+                })
+                entry['requests'][f"{method} {status}"] = count
+            for (service, endpoint), histogram in self.latency.items():
+                entry = endpoints[f"{service} {endpoint}"]
+                entry['latency_seconds'] = {
+                    'sum': round(histogram.sum, 6),
+                    'count': histogram.count,
+                    'buckets': {('+Inf' if bound == float('inf') else str(bound)): count for bound, count in histogram.cumulative()},
+                }
+            return {
+                'started_at': self.started_at,
+                'phases': {name: {'seconds': round(seconds, 6), 'calls': calls} for name, (seconds, calls) in sorted(self.phases.items())},
+                'endpoints': list(endpoints.values()),
+                'retries': [{'service': service, 'reason': reason, 'count': count} for (service, reason), count in sorted(self.retries.items())],
+                'sync_stats': dict(self.sync_stats),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            metric('sync_phase_seconds', 'gauge', 'Wall-clock time spent in each sync phase.')
+            for name, (seconds, _) in sorted(self.phases.items()):
+                lines.append(f'sync_phase_seconds{{phase="{name}"}} {seconds:.6f}')
+            metric('sync_phase_calls', 'gauge', 'Number of times each sync phase ran.')
+            for name, (_, calls) in sorted(self.phases.items()):
+                lines.append(f'sync_phase_calls{{phase="{name}"}} {calls}')
+
+            metric('sync_http_requests_total', 'counter', 'HTTP requests per service, endpoint and status.')
+            for (service, method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'sync_http_requests_total{{service="{service}",method="{method}",endpoint="{endpoint}",status="{status}"}} {count}')
+
+            metric('sync_http_cache_hits_total', 'counter', 'Responses served from the local HTTP cache after a 304.')
+            for (service, endpoint), count in sorted(self.cache_hits.items()):
+                lines.append(f'sync_http_cache_hits_total{{service="{service}",endpoint="{endpoint}"}} {count}')
+
+            metric('sync_http_request_duration_seconds', 'histogram', 'HTTP request latency per service and endpoint.')
+            for (service, endpoint), histogram in sorted(self.latency.items()):
+                labels = f'service="{service}",endpoint="{endpoint}"'
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f'sync_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'sync_http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'sync_http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            metric('sync_http_request_bytes_total', 'counter', 'Request body bytes sent per service and endpoint.')
+            for (service, endpoint), count in sorted(self.bytes_sent.items()):
+                lines.append(f'sync_http_request_bytes_total{{service="{service}",endpoint="{endpoint}"}} {count}')
+            metric('sync_http_response_bytes_total', 'counter', 'Response body bytes received per service and endpoint.')
+            for (service, endpoint), count in sorted(self.bytes_received.items()):
+                lines.append(f'sync_http_response_bytes_total{{service="{service}",endpoint="{endpoint}"}} {count}')
+
+            metric('sync_http_retries_total', 'counter', 'Requests retried after throttling, server errors or connection failures.')
+            for (service, reason), count in sorted(self.retries.items()):
+                lines.append(f'sync_http_retries_total{{service="{service}",reason="{reason}"}} {count}')
+
+            metric('sync_assignments', 'gauge', 'Assignments per outcome in the last sync.')
+            for result, count in sorted(self.sync_stats.items()):
+                lines.append(f'sync_assignments{{result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str, fmt: str = None):
+        """
+        Writes the metrics to path, as JSON for .json files (or fmt='json') and Prometheus text otherwise.
+        """
+        fmt = fmt or ('json' if path.endswith('.json') else 'prometheus')
+        with open(path, 'w') as f:
+            f.write(self.to_json() if fmt == 'json' else self.to_prometheus())
+        logger.info(f"Wrote {fmt} metrics to {path}")
+
+
+def install_request_metrics(session, metrics: Metrics, service: str):
+    """
+    Records every response of a requests session under the given service name.
+    """
+    session.hooks['response'].append(lambda response, *args, **kwargs: metrics.record_response(service, response))
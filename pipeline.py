@@ -0,0 +1,139 @@
+import time
+import queue
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+# How long an item may wait in a partial batch before the writer sends the batch anyway
+DEFAULT_MAX_DELAY = 2.0
+
+
+class BoundedProducer:
+    """
+    Iterates `iterable` on a background thread, keeping at most `maxsize` items ready ahead
+    of the consumer. Iterating the producer yields the items in order and re-raises any
+    exception the source raised. The source blocks while the buffer is full (backpressure).
+    """
+    def __init__(self, iterable, maxsize: int = 2, name: str = 'producer'):
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self._closed = threading.Event()
+        # Run in a copy of the caller's context, so context variables (e.g. the service's tenant) carry over
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run, iterable), name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put((item, None)):
+                    return
+        except BaseException as e:
+            self._put((_DONE, e))
+            return
+        self._put((_DONE, None))
+
+    def __iter__(self):
+        while True:
+            item, error = self._queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    def close(self):
+        """
+        Stops the source early (e.g. when the consumer failed) and waits for the thread.
+        """
+        self._closed.set()
+        self._thread.join()
+
+
+class BatchWriter:
+    """
+    Collects items per kind on a background thread and hands them to `handler(kind, items)`
+    in batches of up to `batch_size`. A partial batch is sent once its oldest item waited
+    `max_delay` seconds, so writes start while the producers are still busy. submit()
+    blocks once `maxsize` items are waiting (backpressure). The handler returns one result per
+    item; finished batches are collected with drain() and close().
+    """
+    def __init__(self, handler, batch_size: int, maxsize: int = None, max_delay: float = DEFAULT_MAX_DELAY, name: str = 'writer'):
+        self.handler = handler
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=maxsize or self.batch_size * 2)
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, item):
+        self._queue.put((kind, item))
+
+    def _flush(self, kind: str, items: list):
+        try:
+            results = self.handler(kind, items)
+        except Exception as e:
+            logger.error(f"Error writing batch of {len(items)} ({kind}): {e}")
+            results = [None] * len(items)
+        self._results.put((kind, list(items), results))
+        items.clear()
+
+    def _run(self):
+        pending = {}
+        # kind -> when the oldest item of its partial batch arrived
+        started = {}
+        while True:
+            timeout = None
+            if started:
+                timeout = max(0.0, min(started.values()) + self.max_delay - time.monotonic())
+            try:
+                kind, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+            if kind is _DONE:
+                break
+            if kind is not None:
+                items = pending.setdefault(kind, [])
+                if not items:
+                    started[kind] = time.monotonic()
+                items.append(item)
+                if len(items) >= self.batch_size:
+                    self._flush(kind, items)
+                    del started[kind]
+            now = time.monotonic()
+            for kind in [kind for kind, since in started.items() if since + self.max_delay <= now]:
+                self._flush(kind, pending[kind])
+                del started[kind]
+        for kind, items in pending.items():
+            if items:
+                self._flush(kind, items)
+
+    def drain(self) -> list:
+        """
+        Returns the (kind, items, results) of every batch finished so far.
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def close(self) -> list:
+        """
+        Sends the remaining items, stops the thread and returns the batches not drained yet.
+        """
+        self._queue.put((_DONE, None))
+        self._thread.join()
+        return self.drain()
@@ -0,0 +1,188 @@
+import re
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('title', 'description', 'any')
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over lowercase keywords. Finds every keyword occurring in a text
+    in a single pass, so matching cost does not grow with the number of keywords.
+    """
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+
+    def add(self, keyword: str, value):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(set())
+            state = next_state
+        self.outputs[state].add(value)
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.outputs[next_state] |= self.outputs[self.fail[next_state]]
+
+    def find(self, text: str) -> set:
+        found = set()
+        state = 0
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+class Rule:
+    """
+    A single classification rule: a keyword or regex matched against the title and/or description,
+    optionally restricted to some courses, that sets a priority, adds tags and/or picks a list.
+    """
+    def __init__(self, pattern: str, regex: bool = False, field: str = 'title', courses: list = None,
+                 priority: int = None, tags: list = None, list_name: str = None):
+        if field not in FIELDS:
+            raise ValueError(f"Invalid rule field '{field}' -> Should be one of {FIELDS}")
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.IGNORECASE) if regex else None
+        self.field = field
+        self.courses = set(courses) if courses else None
+        self.priority = priority
+        self.tags = list(tags or [])
+        self.list_name = list_name
+
+    def applies_to(self, course_name: str) -> bool:
+        return self.courses is None or course_name in self.courses
+
+
+class Classification:
+    __slots__ = ('priority', 'tags', 'list_name')
+
+    def __init__(self, priority: int, tags: list, list_name: str = None):
+        self.priority = priority
+        self.tags = tags
+        self.list_name = list_name
+
+
+class RuleEngine:
+    """
+    Priority/tag/list rules compiled once into a keyword automaton (plus any regex rules).
+    A matching rule with the highest priority wins, tags of all matching rules are combined
+    in rule order, and the first matching rule with a list overrides the course list mapping.
+    """
+    def __init__(self, rules: list, default_priority: int = 3, default_tags: list = None):
+        self.rules = rules
+        self.default_priority = default_priority
+        self.default_tags = list(default_tags or [])
+        self.automaton = KeywordAutomaton()
+        self.regex_rules = []
+        for index, rule in enumerate(rules):
+            if rule.regex:
+                self.regex_rules.append(index)
+            else:
+                self.automaton.add(rule.pattern.lower(), index)
+        self.automaton.build()
+        # Descriptions can be long; only scan them when some rule looks at them
+        self.scan_description = any(rule.field != 'title' for rule in rules)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        Compiles the legacy keyword lists under `priorities` and `tags` plus the free-form `rules` list.
+        """
+        priorities = config.get('priorities', {}) or {}
+        tags_config = config.get('tags', {}) or {}
+        rules = []
+        for kw in priorities.get('high_keywords', []):
+            rules.append(Rule(kw, priority=5))
+        for kw in priorities.get('low_keywords', []):
+            rules.append(Rule(kw, priority=1))
+        for kw in tags_config.get('exam_keywords', []):
+            rules.append(Rule(kw, tags=['Exam']))
+        for kw in tags_config.get('homework_keywords', []):
+            rules.append(Rule(kw, tags=['Homework']))
+
+        for entry in config.get('rules', []) or []:
+            try:
+                rules.append(Rule(
+                    entry['match'],
+                    regex=entry.get('regex', False),
+                    field=entry.get('field', 'title'),
+                    courses=entry.get('courses'),
+                    priority=entry.get('priority'),
+                    tags=entry.get('tags'),
+                    list_name=entry.get('list'),
+                ))
+            except (KeyError, ValueError, re.error) as e:
+                logger.error(f"Ignoring invalid rule {entry}: {e}")
+
+        return cls(rules, priorities.get('default', 3), tags_config.get('default', []))
+
+    def _matching_rules(self, title: str, description: str, course_name: str) -> list:
+        title_lower = (title or '').lower()
+        description_lower = (description or '').lower() if self.scan_description else ''
+
+        matched = set()
+        title_hits = self.automaton.find(title_lower)
+        description_hits = self.automaton.find(description_lower) if self.scan_description and description_lower else set()
+        for index in title_hits:
+            if self.rules[index].field in ('title', 'any'):
+                matched.add(index)
+        for index in description_hits:
+            if self.rules[index].field in ('description', 'any'):
+                matched.add(index)
+
+        for index in self.regex_rules:
+            rule = self.rules[index]
+            if rule.field in ('title', 'any') and rule.regex.search(title or ''):
+                matched.add(index)
+            elif rule.field in ('description', 'any') and rule.regex.search(description or ''):
+                matched.add(index)
+
+        return [self.rules[index] for index in sorted(matched) if self.rules[index].applies_to(course_name)]
+
+    def classify(self, title: str, description: str = '', course_name: str = None) -> Classification:
+        priority = None
+        tags = []
+        list_name = None
+        for rule in self._matching_rules(title, description, course_name):
+            if rule.priority is not None and (priority is None or rule.priority > priority):
+                priority = rule.priority
+            for tag in rule.tags:
+                if tag not in tags:
+                    tags.append(tag)
+            if list_name is None and rule.list_name:
+                list_name = rule.list_name
+
+        return Classification(
+            self.default_priority if priority is None else priority,
+            tags or list(self.default_tags),
+            list_name
+        )
+
+    def classify_many(self, items) -> list:
+        """
+        Classifies a batch of (title, description, course_name) tuples.
+        """
+        return [self.classify(title, description, course_name) for title, description, course_name in items]
@@ -0,0 +1,79 @@
+import os
+import sys
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler: a background thread samples the stacks of all other
+    threads every `interval` seconds. The report is written in collapsed-stack format
+    ("outer;inner;leaf count" per line), which flamegraph.pl and speedscope read directly.
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def top_functions(self, limit: int = 15) -> list:
+        """
+        Returns (function, share of samples) for the functions most often on top of the stack.
+        """
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(name, count / total) for name, count in leaves.most_common(limit)]
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote profile with {self.sample_count} samples to {path}")
+        for name, share in self.top_functions(10):
+            logger.info(f"  {share:6.1%}  {name}")
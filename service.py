@@ -0,0 +1,298 @@
+import os
+import sys
+import math
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import dotenv_values
+
+from config_manager import ConfigManager
+from clients.request_scheduler import RequestScheduler, SharedTransport, host_key
+from sync_index import SyncIndex
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-profile files, named as main.py names them in its working directory
+ENV_FILE = '.env'
+CONFIG_FILE = 'config.yaml'
+STATE_FILE = 'canvas_state.json'
+SYNC_INDEX_FILE = 'sync_index.db'
+SYNC_JOURNAL_FILE = 'sync_journal.jsonl'
+HTTP_CACHE_FILE = 'http_cache.db'
+TICKTICK_SESSION_FILE = 'ticktick_session.json'
+OAUTH_TOKEN_FILE = '.token-oauth'
+BROWSER_PROFILE_DIR = 'canvas_browser_profile'
+
+DEFAULT_MAX_CONCURRENT_SYNCS = 8
+DEFAULT_MAX_REQUESTS_IN_FLIGHT = 32
+# After a failed sync, retry after 1, 2, 4, ... minutes, but never later than the regular interval
+FAILURE_BACKOFF_BASE = 60.0
+# How long the loop sleeps at most, to notice shutdown requests
+MAX_SLEEP = 30.0
+
+# Name of the tenant whose sync is running, added to every log record
+current_tenant = contextvars.ContextVar('current_tenant', default='-')
+
+
+class TenantLogFilter(logging.Filter):
+    def filter(self, record):
+        record.tenant = current_tenant.get()
+        return True
+
+
+class Tenant:
+    """
+    One student profile: a directory with its own .env (the variables main.py reads),
+    config.yaml, Canvas state file, sync index, TickTick session and HTTP cache. Running
+    `python main.py --login` inside the directory creates its Canvas state.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def sync(self, transport: SharedTransport, canvas_backend: str = 'rest', incremental: bool = False,
+             precheck: bool = False, http_cache: bool = True):
+        """
+        Runs one sync of this profile, as main.py does for a single user, with its requests going
+        out over the shared transport. Returns the sync stats, or None if the precheck found
+        nothing to do. Raises on any failure; the service keeps it to this tenant.
+        """
+        from clients.ticktick_client import TickTickClient, TICKTICK_API_HOST
+        from clients.ticktick_session import TickTickSessionStore
+        from sync_manager import SyncManager, is_canvas_unchanged
+        from sync_journal import SyncJournal
+
+        env = dotenv_values(self.file(ENV_FILE))
+        canvas_url = env.get('CANVAS_API_URL')
+        canvas_token = env.get('CANVAS_API_TOKEN')
+        canvas_session_cookie = env.get('CANVAS_SESSION_COOKIE')
+        ticktick_user = env.get('TICKTICK_USERNAME')
+        ticktick_pass = env.get('TICKTICK_PASSWORD')
+        if not all([canvas_url, ticktick_user, ticktick_pass]):
+            raise ValueError(f"{self.file(ENV_FILE)} lacks CANVAS_API_URL, TICKTICK_USERNAME or TICKTICK_PASSWORD")
+
+        config_manager = ConfigManager(self.file(CONFIG_FILE))
+        metrics = Metrics()
+        # Rate limits and adaptive concurrency stay per account, as Canvas and TickTick throttle per user
+        scheduler = RequestScheduler(
+            max_retries=config_manager.get_max_request_retries(),
+            default_max_concurrency=config_manager.get_canvas_max_concurrency(),
+            transport=transport, tenant=self.name
+        )
+        scheduler.configure_host(host_key(canvas_url), rate=config_manager.get_canvas_rate_limit(), max_concurrency=config_manager.get_canvas_max_concurrency())
+        scheduler.configure_host(TICKTICK_API_HOST, rate=config_manager.get_ticktick_rate_limit(), max_concurrency=2)
+
+        state_file = self.file(STATE_FILE) if os.path.exists(self.file(STATE_FILE)) else None
+        if state_file:
+            from clients.canvas_session import CanvasSession
+            canvas_session = CanvasSession(
+                canvas_url, state_file, self.file(BROWSER_PROFILE_DIR),
+                metrics=metrics, scheduler=scheduler, interactive=False
+            )
+            if not canvas_session.ensure():
+                if not (canvas_token or canvas_session_cookie):
+                    raise RuntimeError("the saved Canvas session is no longer valid; run main.py --login in the profile directory")
+                state_file = None
+        if not (canvas_token or canvas_session_cookie or state_file):
+            raise ValueError("no Canvas authentication method found")
+
+        sync_index = SyncIndex(self.file(SYNC_INDEX_FILE))
+        # Closed after every sync: a long-running service must not keep one per past run open
+        cache = None
+        journal = None
+        try:
+            change_fingerprint = None
+            if precheck:
+                from clients.canvas_probe import CanvasChangeProbe
+                probe = CanvasChangeProbe(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file, metrics=metrics, scheduler=scheduler)
+                change_fingerprint = probe.fingerprint(config_manager.is_course_monitored, salt=config_manager.get_fingerprint())
+                if is_canvas_unchanged(sync_index, change_fingerprint):
+                    logger.info("No Canvas changes since the last sync.")
+                    return None
+
+            if canvas_backend == 'graphql':
+                from clients.graphql_canvas_client import GraphQLCanvasClient
+                canvas_client = GraphQLCanvasClient(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file, metrics=metrics, scheduler=scheduler)
+            else:
+                from clients.canvas_client import CanvasClient
+                from clients.http_cache import HTTPCache
+                if http_cache:
+                    cache = HTTPCache(
+                        self.file(HTTP_CACHE_FILE),
+                        max_bytes=config_manager.get_http_cache_max_bytes(),
+                        ttl_seconds=config_manager.get_http_cache_ttl().total_seconds()
+                    )
+                canvas_client = CanvasClient(canvas_url, canvas_token or "", session_cookie=canvas_session_cookie, state_file=state_file, http_cache=cache, metrics=metrics, scheduler=scheduler)
+
+            ticktick_client = TickTickClient(
+                username=ticktick_user,
+                password=ticktick_pass,
+                client_id=env.get('TICKTICK_CLIENT_ID'),
+                client_secret=env.get('TICKTICK_CLIENT_SECRET'),
+                metrics=metrics,
+                scheduler=scheduler,
+                session_store=TickTickSessionStore(self.file(TICKTICK_SESSION_FILE)),
+                full_sync_interval=config_manager.get_ticktick_full_sync_interval().total_seconds(),
+                oauth_cache_path=self.file(OAUTH_TOKEN_FILE)
+            )
+            journal = SyncJournal(self.file(SYNC_JOURNAL_FILE))
+            sync_manager = SyncManager(canvas_client, ticktick_client, config_manager, sync_index=sync_index, metrics=metrics, journal=journal)
+            return sync_manager.run_sync(incremental=incremental, change_fingerprint=change_fingerprint)
+        finally:
+            if journal is not None:
+                journal.close()
+            if cache is not None:
+                cache.close()
+            sync_index.close()
+
+
+def discover_tenants(profiles_dir: str) -> list:
+    """
+    Every subdirectory of profiles_dir with a .env file is a tenant.
+    """
+    tenants = []
+    for name in sorted(os.listdir(profiles_dir)):
+        path = os.path.join(profiles_dir, name)
+        if os.path.isfile(os.path.join(path, ENV_FILE)):
+            tenants.append(Tenant(path))
+    return tenants
+
+
+class SyncService:
+    """
+    Syncs many tenants from one process. An asyncio loop decides which tenants are due and
+    runs their (blocking) syncs on a pool of max_concurrent_syncs threads, longest-waiting
+    tenant first. All tenants' requests share one SharedTransport: one keep-alive pool per
+    host and at most max_requests_in_flight requests at once, handed out round-robin between
+    tenants. A failing tenant is retried with backoff without affecting the others.
+    """
+    def __init__(self, tenants: list, max_concurrent_syncs: int = DEFAULT_MAX_CONCURRENT_SYNCS,
+                 max_requests_in_flight: int = DEFAULT_MAX_REQUESTS_IN_FLIGHT, interval: float = 1800.0, **sync_options):
+        self.tenants = tenants
+        self.max_concurrent_syncs = max(1, max_concurrent_syncs)
+        self.interval = interval
+        self.sync_options = sync_options
+        self.transport = SharedTransport(max_requests_in_flight)
+        # Monotonic time each tenant is due next; all are due at start
+        self.next_run = {tenant.name: 0.0 for tenant in tenants}
+        self.failures = {tenant.name: 0 for tenant in tenants}
+        self.results = {}
+        self._stop = None
+
+    def stop(self):
+        logger.info("Stopping the sync service after the running syncs...")
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _sync(self, tenant: Tenant, executor: ThreadPoolExecutor, once: bool):
+        current_tenant.set(tenant.name)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            # The executor doesn't carry the task's context over by itself
+            stats = await loop.run_in_executor(executor, contextvars.copy_context().run, tenant.sync, self.transport, *self._sync_args())
+        except Exception as e:
+            self.failures[tenant.name] += 1
+            delay = min(self.interval, FAILURE_BACKOFF_BASE * 2 ** (self.failures[tenant.name] - 1))
+            self.next_run[tenant.name] = math.inf if once else time.monotonic() + delay
+            self.results[tenant.name] = {'error': str(e), 'seconds': round(time.monotonic() - started, 3)}
+            logger.error(f"Sync failed ({self.failures[tenant.name]} in a row){'' if once else f', retrying in {delay:.0f}s'}: {e}")
+            return
+        self.failures[tenant.name] = 0
+        self.next_run[tenant.name] = math.inf if once else time.monotonic() + self.interval
+        self.results[tenant.name] = {'stats': stats, 'seconds': round(time.monotonic() - started, 3)}
+        logger.info(f"Sync finished in {time.monotonic() - started:.1f}s.")
+
+    def _sync_args(self):
+        options = self.sync_options
+        return (options.get('canvas_backend', 'rest'), options.get('incremental', False),
+                options.get('precheck', False), options.get('http_cache', True))
+
+    async def run(self, once: bool = False) -> dict:
+        """
+        Syncs every tenant every `interval` seconds until stop() (SIGINT/SIGTERM), or each
+        tenant once with once=True. Returns the last result per tenant.
+        """
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        logger.info(f"Serving {len(self.tenants)} tenant(s), {self.max_concurrent_syncs} sync(s) at a time.")
+
+        running = {}
+        stop_waiter = asyncio.ensure_future(self._stop.wait())
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_syncs, thread_name_prefix='tenant-sync') as executor:
+            try:
+                while not self._stop.is_set():
+                    now = time.monotonic()
+                    due = sorted(
+                        (tenant for tenant in self.tenants if tenant.name not in running and self.next_run[tenant.name] <= now),
+                        key=lambda tenant: self.next_run[tenant.name]
+                    )
+                    for tenant in due[:self.max_concurrent_syncs - len(running)]:
+                        running[tenant.name] = asyncio.ensure_future(self._sync(tenant, executor, once))
+                    if not running and all(next_run == math.inf for next_run in self.next_run.values()):
+                        break
+                    waiting = [self.next_run[tenant.name] for tenant in self.tenants if tenant.name not in running]
+                    timeout = min([MAX_SLEEP] + [max(0.0, next_run - now) for next_run in waiting if next_run != math.inf])
+                    await asyncio.wait(list(running.values()) + [stop_waiter], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    for name in [name for name, task in running.items() if task.done()]:
+                        del running[name]
+            finally:
+                stop_waiter.cancel()
+                if running:
+                    await asyncio.gather(*running.values(), return_exceptions=True)
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync many Canvas/TickTick profiles from one process.")
+    parser.add_argument('profiles', help="Directory with one subdirectory per student profile (.env, config.yaml, canvas_state.json, ...).")
+    parser.add_argument('--once', action='store_true', help="Sync every profile once and exit instead of running as a service.")
+    parser.add_argument('--interval-minutes', type=float, default=30, help="How often each profile is synced.")
+    parser.add_argument('--max-concurrent-syncs', type=int, default=DEFAULT_MAX_CONCURRENT_SYNCS, help="Profiles synced at the same time.")
+    parser.add_argument('--max-requests', type=int, default=DEFAULT_MAX_REQUESTS_IN_FLIGHT, help="HTTP requests in flight across all profiles.")
+    parser.add_argument('--canvas-backend', choices=['rest', 'graphql'], default='rest', help="Canvas fetch backend (both use the shared connection pools).")
+    parser.add_argument('--incremental', action='store_true', help="Only fetch Canvas assignments that changed since each profile's last sync.")
+    parser.add_argument('--precheck', action='store_true', help="Skip a profile's sync before TickTick login when Canvas did not change.")
+    parser.add_argument('--no-http-cache', action='store_true', help="Disable the per-profile conditional-request cache.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [%(tenant)s] %(name)s - %(levelname)s - %(message)s')
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TenantLogFilter())
+
+    tenants = discover_tenants(args.profiles)
+    if not tenants:
+        logger.error(f"No profiles (subdirectories with a {ENV_FILE}) found in {args.profiles}.")
+        sys.exit(1)
+    service = SyncService(
+        tenants,
+        max_concurrent_syncs=args.max_concurrent_syncs,
+        max_requests_in_flight=args.max_requests,
+        interval=args.interval_minutes * 60,
+        canvas_backend=args.canvas_backend,
+        incremental=args.incremental,
+        precheck=args.precheck,
+        http_cache=not args.no_http_cache,
+    )
+    results = asyncio.run(service.run(once=args.once))
+    failed = sorted(name for name, result in results.items() if 'error' in result)
+    if failed:
+        logger.error(f"Failed profiles: {', '.join(failed)}")
+        if args.once:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
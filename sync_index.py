@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+CANVAS_ID_MARKER = '[Canvas ID:'
+# Fingerprint of a task whose assignment disappeared from Canvas and was already reconciled;
+# it never matches a rendered fingerprint, so a reappearing assignment updates its task again
+ORPHANED_FINGERPRINT = 'orphaned'
+# Rendered descriptions not looked up for this long belong to edited or deleted assignments.
+# Full fetches (at least daily by default) touch every current one, so this only drops dead entries
+RENDERED_MAX_AGE = timedelta(days=14)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS synced_tasks (
+    canvas_id INTEGER PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    project_id TEXT,
+    fingerprint TEXT,
+    course_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS course_cursors (
+    course_id INTEGER PRIMARY KEY,
+    updated_at TEXT,
+    full_fetch_at TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS rendered_descriptions (
+    digest TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    used_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def parse_canvas_id(content: str):
+    """
+    Extracts the Canvas assignment ID from a task description containing a
+    [Canvas ID: 12345] marker. Returns None if there is no valid marker.
+    """
+    if not content or CANVAS_ID_MARKER not in content:
+        return None
+    start = content.find(CANVAS_ID_MARKER) + len(CANVAS_ID_MARKER)
+    end = content.find(']', start)
+    try:
+        return int(content[start:end].strip())
+    except ValueError:
+        return None
+
+
+def _due_epoch(due_date):
+    """
+    Normalizes a due date (datetime or TickTick date string) to epoch seconds
+    so fingerprints match regardless of how TickTick formats the date back.
+    """
+    if not due_date:
+        return None
+    if isinstance(due_date, datetime):
+        if due_date.tzinfo is None:
+            due_date = due_date.replace(tzinfo=timezone.utc)
+        return int(due_date.timestamp())
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z'):
+        try:
+            return int(datetime.strptime(due_date, fmt).timestamp())
+        except ValueError:
+            continue
+    return due_date
+
+
+def compute_fingerprint(title: str, description: str, due_date, priority: int, tags: list) -> str:
+    """
+    Hashes the rendered task fields so a synced task can be compared against
+    what the current Canvas data would produce.
+    """
+    payload = json.dumps([
+        title or '',
+        (description or '').strip(),
+        _due_epoch(due_date),
+        priority or 0,
+        sorted(tags or []),
+    ], separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def task_fingerprint(task: dict) -> str:
+    """
+    Computes the fingerprint of a task as returned by TickTick.
+    """
+    return compute_fingerprint(
+        task.get('title'),
+        task.get('content'),
+        task.get('dueDate'),
+        task.get('priority'),
+        task.get('tags'),
+    )
+
+
+class SyncIndex:
+    """
+    Local SQLite index mapping Canvas assignment IDs to the TickTick tasks they were synced to.
+    """
+    def __init__(self, db_path: str = 'sync_index.db'):
+        self.db_path = db_path
+        self.needs_rebuild = False
+        self.conn = self._open()
+
+    def _open(self):
+        is_new = self.db_path == ':memory:' or not os.path.exists(self.db_path)
+        try:
+            conn = sqlite3.connect(self.db_path)
+            result = conn.execute('PRAGMA integrity_check').fetchone()
+            if not result or result[0] != 'ok':
+                raise sqlite3.DatabaseError(f"integrity check returned {result}")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"Sync index {self.db_path} is corrupt ({e}). Recreating it.")
+            try:
+                conn.close()
+            except Exception:
+                pass
+            os.remove(self.db_path)
+            conn = sqlite3.connect(self.db_path)
+            conn.executescript(SCHEMA)
+            is_new = True
+
+        if is_new or self._get_meta(conn, 'rebuilt_at') is None:
+            self.needs_rebuild = True
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(rendered_descriptions)')}
+        if 'used_at' not in columns:
+            # Indexes from before pruning: their entries count as used now
+            with conn:
+                conn.execute('ALTER TABLE rendered_descriptions ADD COLUMN used_at REAL NOT NULL DEFAULT 0')
+                conn.execute('UPDATE rendered_descriptions SET used_at = ?', (time.time(),))
+
+    @staticmethod
+    def _get_meta(conn, key: str):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_meta(self, key: str):
+        return self._get_meta(self.conn, key)
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def rebuild_from_tasks(self, tasks: list) -> int:
+        """
+        Rebuilds the index from the [Canvas ID: ...] markers in existing TickTick tasks.
+        Only needed when the index is missing or was found corrupt.
+        """
+        rows = []
+        for task in tasks:
+            canvas_id = parse_canvas_id(task.get('content', ''))
+            if canvas_id is None or not task.get('id'):
+                continue
+            rows.append((canvas_id, task['id'], task.get('projectId'), task_fingerprint(task)))
+
+        with self.conn:
+            self.conn.execute('DELETE FROM synced_tasks')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO synced_tasks (canvas_id, task_id, project_id, fingerprint) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('rebuilt_at', datetime.now(timezone.utc).isoformat())
+            )
+        self.needs_rebuild = False
+        logger.info(f"Rebuilt sync index with {len(rows)} synced tasks.")
+        return len(rows)
+
+    def get(self, canvas_id: int):
+        """
+        Returns the synced task entry for a Canvas assignment ID, or None if it was never synced.
+        """
+        row = self.conn.execute(
+            'SELECT task_id, project_id, fingerprint, course_id FROM synced_tasks WHERE canvas_id = ?',
+            (canvas_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'task_id': row[0], 'project_id': row[1], 'fingerprint': row[2], 'course_id': row[3]}
+
+    def __contains__(self, canvas_id) -> bool:
+        return self.conn.execute(
+            'SELECT 1 FROM synced_tasks WHERE canvas_id = ?', (canvas_id,)
+        ).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM synced_tasks').fetchone()[0]
+
+    def record(self, canvas_id: int, task_id: str, project_id: str = None, fingerprint: str = None, course_id: int = None):
+        """
+        Records (or replaces) the TickTick task a Canvas assignment was synced to.
+        """
+        self.record_many([(canvas_id, task_id, project_id, fingerprint, course_id)])
+
+    def record_many(self, rows):
+        """
+        Records many (canvas_id, task_id, project_id, fingerprint, course_id) rows in one transaction.
+        """
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO synced_tasks (canvas_id, task_id, project_id, fingerprint, course_id) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def get_synced_by_course(self, course_ids) -> dict:
+        """
+        Returns {course ID: {Canvas ID: entry}} for the synced tasks of the given courses,
+        from a single scan of the index.
+        """
+        by_course = {course_id: {} for course_id in course_ids}
+        rows = self.conn.execute(
+            'SELECT canvas_id, task_id, project_id, fingerprint, course_id FROM synced_tasks WHERE course_id IS NOT NULL'
+        )
+        for canvas_id, task_id, project_id, fingerprint, course_id in rows:
+            entries = by_course.get(course_id)
+            if entries is not None:
+                entries[canvas_id] = {'task_id': task_id, 'project_id': project_id, 'fingerprint': fingerprint, 'course_id': course_id}
+        return by_course
+
+    def set_course_ids(self, course_ids: dict):
+        """
+        Fills in the course of entries recorded without one (e.g. by rebuild_from_tasks), from a
+        {Canvas ID: course ID} mapping.
+        """
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE synced_tasks SET course_id = ? WHERE canvas_id = ? AND course_id IS NULL',
+                [(course_id, canvas_id) for canvas_id, course_id in course_ids.items()]
+            )
+
+    def remove(self, canvas_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM synced_tasks WHERE canvas_id = ?', [(canvas_id,) for canvas_id in canvas_ids])
+
+    def get_cursor(self, course_id: int):
+        """
+        Returns the incremental fetch cursor for a course: the newest assignment
+        `updated_at` seen and when the course was last fetched in full.
+        """
+        row = self.conn.execute(
+            'SELECT updated_at, full_fetch_at FROM course_cursors WHERE course_id = ?', (course_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'updated_at': row[0], 'full_fetch_at': row[1]}
+
+    def set_cursor(self, course_id: int, updated_at: str, full_fetch_at: str):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO course_cursors (course_id, updated_at, full_fetch_at) VALUES (?, ?, ?)',
+                (course_id, updated_at, full_fetch_at)
+            )
+
+    def clear_cursors(self):
+        with self.conn:
+            self.conn.execute('DELETE FROM course_cursors')
+
+    def get_rendered_many(self, digests: list) -> dict:
+        """
+        Returns the cached plain-text renderings of assignment descriptions, keyed by HTML digest,
+        and marks them as used so prune_rendered() keeps them.
+        """
+        rendered = {}
+        digests = list(set(digests))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'SELECT digest, text FROM rendered_descriptions WHERE digest IN ({placeholders})', chunk
+            ).fetchall()
+            rendered.update(rows)
+        if rendered:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany('UPDATE rendered_descriptions SET used_at = ? WHERE digest = ?', [(now, digest) for digest in rendered])
+        return rendered
+
+    def put_rendered_many(self, entries: dict):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO rendered_descriptions (digest, text, used_at) VALUES (?, ?, ?)',
+                [(digest, text, now) for digest, text in entries.items()]
+            )
+
+    def prune_rendered(self, max_age: timedelta = RENDERED_MAX_AGE) -> int:
+        """
+        Drops the rendered descriptions not looked up within max_age. Returns how many were dropped.
+        """
+        with self.conn:
+            cursor = self.conn.execute('DELETE FROM rendered_descriptions WHERE used_at < ?', (time.time() - max_age.total_seconds(),))
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,145 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+
+from sync_plan import encode_entry, decode_entry
+
+logger = logging.getLogger(__name__)
+
+# States of a journaled write
+SENT = 'sent'          # intent logged, outcome unknown (interrupted while or right after sending)
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+RECORDED = 'recorded'  # outcome saved in the sync index; nothing left to do
+
+
+def journal_key(kind: str, item: dict) -> str:
+    """
+    Idempotency key of a write: one pending write per kind and Canvas assignment.
+    """
+    return f"{kind}:{item['canvas_id']}"
+
+
+class SyncJournal:
+    """
+    Append-only write-ahead journal (JSON lines) of the TickTick writes of a sync. Each batch
+    is logged with its full entries, including the client-generated IDs of tasks to create,
+    and flushed to disk before it is sent; its outcome is logged after the response, and a
+    marker once the sync index has it. After a crash, pending() tells the next run which
+    writes went through but were never recorded, and which may have to be sent again.
+    """
+    def __init__(self, path: str = 'sync_journal.jsonl'):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        # key -> {'kind', 'item', 'state', 'task'}, in the order the writes were logged
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            lines = f.readlines()
+        for number, line in enumerate(lines, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by the crash; the write it described never got its outcome
+                logger.warning(f"Ignoring unreadable line {number} of the sync journal {self.path}.")
+                continue
+            self._apply(record)
+
+    def _apply(self, record: dict):
+        op = record.get('op')
+        if op == 'write':
+            self._entries.pop(record['key'], None)
+            self._entries[record['key']] = {'kind': record['kind'], 'item': decode_entry(record['item']), 'state': SENT, 'task': None}
+        elif op == 'result' and record['key'] in self._entries:
+            entry = self._entries[record['key']]
+            entry['state'] = SUCCEEDED if record.get('task') else FAILED
+            entry['task'] = record.get('task')
+        elif op == 'recorded':
+            for key in record['keys']:
+                if key in self._entries:
+                    self._entries[key]['state'] = RECORDED
+
+    def _append(self, records: list, sync: bool = False):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a+')
+                # Start on a fresh line after a line cut short by a crash
+                if self._file.tell():
+                    self._file.seek(self._file.tell() - 1)
+                    if self._file.read(1) != '\n':
+                        self._file.write('\n')
+            for record in records:
+                self._apply(record)
+                self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def log_writes(self, kind: str, items: list):
+        """
+        Logs a batch about to be sent. Synced to disk, so no write can reach TickTick unjournaled.
+        """
+        self._append([{'op': 'write', 'key': journal_key(kind, item), 'kind': kind, 'item': encode_entry(item)} for item in items], sync=True)
+
+    def log_results(self, kind: str, items: list, results: list):
+        # Not synced: a lost outcome only makes the next run look the write up again
+        self._append([
+            {'op': 'result', 'key': journal_key(kind, item), 'task': {'id': task.get('id'), 'projectId': task.get('projectId')} if task else None}
+            for item, task in zip(items, results)
+        ])
+
+    def log_recorded(self, kind: str, items: list):
+        self._append([{'op': 'recorded', 'keys': [journal_key(kind, item) for item in items]}])
+
+    def pending(self) -> list:
+        """
+        The writes whose outcome is not in the sync index yet, as dicts with the kind, the
+        entry, the state (SENT, SUCCEEDED or FAILED) and, if it succeeded, the task.
+        """
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values() if entry['state'] != RECORDED]
+
+    def finish(self):
+        """
+        Ends a sync: compacts the journal down to the creates that failed or were cut off,
+        whose client-generated IDs the next run still checks for in TickTick (a timed-out
+        request may have created the task after all). Removes the file when nothing is left.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            keep = [(key, entry) for key, entry in self._entries.items() if entry['kind'] == 'create' and entry['state'] in (SENT, FAILED)]
+            self._entries = dict(keep)
+            if not keep:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sync_journal.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    for key, entry in keep:
+                        f.write(json.dumps({'op': 'write', 'key': key, 'kind': entry['kind'], 'item': encode_entry(entry['item'])}, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,137 +1,790 @@
+import os
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from bs4 import BeautifulSoup
+
+from html_text import render_descriptions, new_render_pool
+from metrics import Metrics
+from pipeline import BoundedProducer, BatchWriter
+from sync_plan import SyncPlan
+from sync_journal import SyncJournal, SENT, SUCCEEDED
+from sync_index import ORPHANED_FINGERPRINT, SyncIndex, compute_fingerprint
+from clients.canvas_client import format_canvas_epoch
 
 logger = logging.getLogger(__name__)
 
+# Fetched courses the download stage may run ahead of the transform stage
+PIPELINE_COURSES_AHEAD = 2
+
+# Batches apply_plan() sends to TickTick at once (the request scheduler still caps the connections)
+PLAN_APPLY_WORKERS = 4
+
+# Past tense of each orphaned_task_policy (also the writer kind that carries it out), for the log
+ORPHAN_VERBS = {'tag': 'Tagged', 'complete': 'Completed', 'delete': 'Deleted'}
+
+# Sync index meta key of the Canvas change fingerprint of the last clean sync
+CHANGE_FINGERPRINT_KEY = 'canvas_change_fingerprint'
+# Sync index meta keys of the TickTick lists and target folder the sync uses, by name
+LIST_IDS_KEY = 'ticktick_list_ids'
+FOLDER_ID_KEY = 'ticktick_folder_id'
+
+
+def is_canvas_unchanged(sync_index: SyncIndex, change_fingerprint: str) -> bool:
+    """
+    True if the Canvas change fingerprint matches the one stored by the last clean sync,
+    i.e. a sync would find nothing to create or update.
+    """
+    return bool(change_fingerprint) and not sync_index.needs_rebuild and \
+        sync_index.get_meta(CHANGE_FINGERPRINT_KEY) == change_fingerprint
+
 class SyncManager:
-    def __init__(self, canvas_client, ticktick_client, config_manager):
+    def __init__(self, canvas_client, ticktick_client, config_manager, sync_index=None, metrics: Metrics = None,
+                 journal: SyncJournal = None):
         self.canvas_client = canvas_client
         self.ticktick_client = ticktick_client
         self.config_manager = config_manager
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Without a persistent index, fall back to an in-memory one rebuilt every run
+        self.sync_index = sync_index if sync_index is not None else SyncIndex(':memory:')
+        # Write-ahead journal of the TickTick writes; None runs without crash recovery
+        self.journal = journal
+        # Course ID -> writes submitted to the writer but not recorded yet
+        self._in_flight = {}
+        # Per course of the last run: assignments created or updated, and the earliest upcoming due date
+        self.course_activity = {}
         logger.info("Initialized SyncManager.")
 
-    def run_sync(self, dry_run: bool = False):
-        if dry_run:
-            logger.info("Running in DRY RUN mode. No tasks will be created.")
-        logger.info("Starting synchronization process...")
-        
-        # 1. Fetch available TickTick lists to get IDs
-        ticktick_lists = self.ticktick_client.get_lists()
-        list_name_to_id = {proj['name']: proj['id'] for proj in ticktick_lists if 'name' in proj and 'id' in proj}
+    def _get_updated_since(self, course, full_fetch: bool):
+        """
+        Returns the `updated_at` high-water mark to fetch a course incrementally from,
+        or None when the course has to be fetched in full.
+        """
+        if full_fetch:
+            return None
+        cursor = self.sync_index.get_cursor(course.id)
+        if not cursor or not cursor['updated_at'] or not cursor['full_fetch_at']:
+            return None
+        last_full_fetch = datetime.fromisoformat(cursor['full_fetch_at'])
+        if datetime.now(timezone.utc) - last_full_fetch >= self.config_manager.get_full_fetch_interval():
+            logger.info(f"Scheduled full fetch for course: {course.name}")
+            return None
+        return cursor['updated_at']
+
+    @staticmethod
+    def _newest_updated_at(assignments):
+        newest = max((assignment.updated_ts for assignment in assignments if assignment.updated_ts is not None), default=None)
+        return format_canvas_epoch(newest)
+
+    def _advance_cursor(self, course_id: int, newest: str, full_fetch: bool):
+        cursor = self.sync_index.get_cursor(course_id) or {}
+        newest = newest or cursor.get('updated_at')
+        full_fetch_at = datetime.now(timezone.utc).isoformat() if full_fetch else cursor.get('full_fetch_at')
+        self.sync_index.set_cursor(course_id, newest, full_fetch_at)
+
+    def _submit(self, writer, kind: str, item: dict):
+        self._in_flight[item['course_id']] = self._in_flight.get(item['course_id'], 0) + 1
+        writer.submit(kind, item)
+
+    def _write_batch(self, kind: str, items: list) -> list:
+        """
+        Submits a batch of queued task creations, updates or completions to TickTick. Runs on
+        the pipeline's writer thread; the results are recorded by _record_batch. With a
+        journal, the batch is logged before it is sent and its outcome after.
+        """
+        if kind == 'create':
+            from clients.ticktick_client import new_object_id
+            for item in items:
+                # Chosen (and journaled) before sending, so the task can be found again if the response is lost
+                item.setdefault('task_id', new_object_id())
+        if self.journal is not None:
+            self.journal.log_writes(kind, items)
+        results = self._send_batch(kind, items)
+        if self.journal is not None:
+            self.journal.log_results(kind, items, results)
+        return results
+
+    def _send_batch(self, kind: str, items: list) -> list:
+        if kind == 'create':
+            with self.metrics.phase('ticktick_create_tasks'):
+                return self.ticktick_client.create_tasks([dict(item['spec'], task_id=item['task_id']) for item in items])
+        if kind == 'complete':
+            with self.metrics.phase('ticktick_complete_tasks'):
+                return self.ticktick_client.complete_tasks([item['task_id'] for item in items])
+        if kind == 'tag':
+            with self.metrics.phase('ticktick_tag_tasks'):
+                return self.ticktick_client.tag_tasks([item['task_id'] for item in items], self.config_manager.get_orphaned_task_tag())
+        if kind == 'delete':
+            with self.metrics.phase('ticktick_delete_tasks'):
+                return self.ticktick_client.delete_tasks([item['task_id'] for item in items])
+        updates = [dict(item['spec'], task_id=item['task_id'], project_id=item['project_id']) for item in items]
+        with self.metrics.phase('ticktick_update_tasks'):
+            return self.ticktick_client.update_tasks(updates)
+
+    def _record_batch(self, kind: str, items: list, results: list, sync_stats: dict, course_errors: dict):
+        """
+        Records the outcome of a written batch in the sync index (in one transaction) and the sync statistics.
+        """
+        rows = []
+        removed = []
+        for item, task in zip(items, results):
+            if self._in_flight.get(item['course_id']):
+                self._in_flight[item['course_id']] -= 1
+            title = item['spec']['title']
+            if not task:
+                sync_stats['errors'] += 1
+                course_errors[item['course_id']] = course_errors.get(item['course_id'], 0) + 1
+                logger.error(f"Failed to {kind} task for {title}")
+            elif item.get('orphaned'):
+                sync_stats['orphaned'] += 1
+                if kind == 'delete':
+                    removed.append(item['canvas_id'])
+                else:
+                    rows.append((item['canvas_id'], item['task_id'], item['project_id'], ORPHANED_FINGERPRINT, item['course_id']))
+                logger.info(f"{ORPHAN_VERBS[kind]} task of an assignment removed from Canvas: {title}")
+            elif kind == 'complete':
+                sync_stats['completed'] += 1
+                logger.info(f"Completed submitted task: {title}")
+            elif kind == 'create':
+                sync_stats['created'] += 1
+                rows.append((
+                    item['canvas_id'],
+                    task.get('id'),
+                    task.get('projectId', item['spec']['project_id']),
+                    item['fingerprint'],
+                    item['course_id']
+                ))
+                logger.info(f"Created task: {title}")
+            else:
+                sync_stats['updated'] += 1
+                rows.append((item['canvas_id'], item['task_id'], item['project_id'], item['fingerprint'], item['course_id']))
+                logger.info(f"Updated task: {title}")
+        if rows:
+            self.sync_index.record_many(rows)
+        if removed:
+            self.sync_index.remove(removed)
+        if self.journal is not None:
+            self.journal.log_recorded(kind, [item for item, task in zip(items, results) if task])
+
+    def _advance_finished_cursors(self, course_cursors: list, course_errors: dict):
+        """
+        Advances the cursors of the processed courses whose writes have all been recorded, and
+        drops them from course_cursors, so a sync interrupted later refetches only the rest.
+        """
+        for cursor in [cursor for cursor in course_cursors if not self._in_flight.get(cursor[0])]:
+            course_cursors.remove(cursor)
+            if not course_errors.get(cursor[0]):
+                self._advance_cursor(*cursor)
+
+    def recover_journal(self, sync_stats: dict, course_errors: dict):
+        """
+        Finishes the writes of an interrupted sync from the journal, before anything is fetched:
+        - writes that went through are recorded in the sync index;
+        - creates that failed or were cut off are looked up in TickTick by their journaled
+          task ID, so a task created right before the crash is not created a second time;
+        - other writes cut off mid-flight are sent again if their task is still open.
+        Failed writes are left to the sync itself, which computes them afresh.
+        """
+        if self.journal is None:
+            return
+        pending = self.journal.pending()
+        if not pending:
+            return
+        logger.info(f"Recovering {len(pending)} journaled write(s) of an interrupted sync...")
+        with self.metrics.phase('journal_recovery'):
+            open_tasks = {task['id']: task for task in self.ticktick_client.get_all_tasks() if 'id' in task}
+            done, resend, dropped = {}, {}, {}
+            for entry in pending:
+                kind, item = entry['kind'], entry['item']
+                if entry['state'] == SUCCEEDED:
+                    done.setdefault(kind, []).append((item, entry['task']))
+                elif kind == 'create':
+                    task = open_tasks.get(item['task_id'])
+                    if task:
+                        done.setdefault(kind, []).append((item, task))
+                    else:
+                        dropped.setdefault(kind, []).append(item)
+                elif entry['state'] == SENT and item['task_id'] in open_tasks:
+                    resend.setdefault(kind, []).append(item)
+                elif entry['state'] == SENT:
+                    # Completed or deleted meanwhile (possibly by this very write); like a stale plan entry
+                    done.setdefault(kind, []).append((item, {'id': item['task_id'], 'projectId': item.get('project_id')}))
+                else:
+                    dropped.setdefault(kind, []).append(item)
+
+            for kind, pairs in done.items():
+                self._record_batch(kind, [item for item, _ in pairs], [task for _, task in pairs], sync_stats, course_errors)
+            batch_size = self.ticktick_client.BATCH_SIZE
+            for kind, items in resend.items():
+                for start in range(0, len(items), batch_size):
+                    batch = items[start:start + batch_size]
+                    self._record_batch(kind, batch, self._write_batch(kind, batch), sync_stats, course_errors)
+            for kind, items in dropped.items():
+                self.journal.log_recorded(kind, items)
+        logger.info(f"Recovered {sum(len(pairs) for pairs in done.values())} completed and resent "
+                    f"{sum(len(items) for items in resend.values())} interrupted write(s).")
+
+    def _known_lists(self) -> dict:
+        """
+        Maps list names to IDs from the TickTick state. Lists the sync resolved before keep
+        their cached ID as long as they exist, so a list renamed in TickTick is still used
+        instead of being created again.
+        """
+        list_name_to_id = {proj['name']: proj['id'] for proj in self.ticktick_client.get_lists() if 'name' in proj and 'id' in proj}
+        existing = set(list_name_to_id.values())
+        for name, list_id in json.loads(self.sync_index.get_meta(LIST_IDS_KEY) or '{}').items():
+            if list_id in existing:
+                list_name_to_id[name] = list_id
+        return list_name_to_id
+
+    def _remember_lists(self, names, list_name_to_id: dict):
+        cached = json.loads(self.sync_index.get_meta(LIST_IDS_KEY) or '{}')
+        updated = dict(cached, **{name: list_name_to_id[name] for name in names if list_name_to_id.get(name)})
+        if updated != cached:
+            self.sync_index.set_meta(LIST_IDS_KEY, json.dumps(updated, sort_keys=True))
+
+    def _target_folder_id(self):
+        """
+        Returns the ID of the ticktick_target_list folder new lists go into, creating the folder
+        if needed, or None (top level) if no target is configured or it can't be created.
+        """
+        name = self.config_manager.get_target_list()
+        if not name:
+            return None
+        folders = {folder.get('id'): folder.get('name') for folder in self.ticktick_client.get_folders()}
+        cached_id = self.sync_index.get_meta(FOLDER_ID_KEY)
+        if cached_id in folders:
+            return cached_id
+        folder_id = next((folder_id for folder_id, folder_name in folders.items() if folder_name == name), None)
+        if folder_id is None:
+            folder = self.ticktick_client.create_folder(name)
+            folder_id = folder.get('id') if folder else None
+        if folder_id:
+            self.sync_index.set_meta(FOLDER_ID_KEY, folder_id)
+        return folder_id
+
+    def _create_lists(self, names, list_name_to_id: dict):
+        """
+        Creates the given lists that don't exist yet inside the target folder, all in one request.
+        Lists that could not be created map to None, which places their tasks in the Inbox.
+        """
+        missing = [name for name in dict.fromkeys(names) if name and not list_name_to_id.get(name)]
+        if not missing:
+            return
+        logger.info(f"Creating TickTick list(s): {', '.join(missing)}")
+        with self.metrics.phase('ticktick_create_lists'):
+            created = self.ticktick_client.create_lists(missing, self._target_folder_id())
+        for name in missing:
+            list_name_to_id[name] = created[name]['id'] if name in created else None
+        self._remember_lists(missing, list_name_to_id)
+
+    def _prepare_lists(self, courses, dry_run: bool, plan: SyncPlan = None) -> dict:
+        """
+        Resolves the lists of all monitored courses before any course is processed and creates
+        the missing ones in one batch, so the course loop never waits on a list creation.
+        While planning, the missing lists are added to the plan instead.
+        """
+        with self.metrics.phase('ticktick_lists'):
+            list_name_to_id = self._known_lists()
+            needed = list(dict.fromkeys(self.config_manager.get_list_mapping(course.name) for course in courses))
+            missing = [name for name in needed if name and name not in list_name_to_id]
+            if missing and dry_run:
+                logger.info(f"[DRY-RUN] Would create TickTick list(s): {', '.join(missing)}")
+            elif missing and plan is not None:
+                for name in missing:
+                    plan.add_list(name)
+            elif missing:
+                self._create_lists(missing, list_name_to_id)
+            self._remember_lists(needed, list_name_to_id)
+        return list_name_to_id
+
+    def _resolve_list_id(self, list_name: str, list_name_to_id: dict, plan: SyncPlan = None, dry_run: bool = False):
+        """
+        Looks up a TickTick list by name. Course lists come from _prepare_lists(); lists named
+        only by a rule are created when first matched. While planning, the creation is added
+        to the plan and a placeholder ID is returned instead.
+        """
+        if list_name in list_name_to_id:
+            return list_name_to_id[list_name]
+        if not list_name or dry_run:
+            return None
+        if plan is not None:
+            return plan.add_list(list_name)
+        logger.warning(f"List '{list_name}' not found in TickTick. Attempting to create it.")
+        self._create_lists([list_name], list_name_to_id)
+        return list_name_to_id.get(list_name)
+
+    def _render_assignment(self, course, assignment, clean_description: str = ''):
+        """
+        Renders the task title, adjusted due date and description of an assignment from its
+        already converted plain-text description. Returns None for assignments without a due date.
+        """
+        # Skip if past due
+        if assignment.due_ts is None:
+            return None
         
-        target_parent_list = self.config_manager.get_target_list()
+        due_date_dt = datetime.fromtimestamp(assignment.due_ts, timezone.utc)
         
-        # 2. Fetch existing TickTick tasks for deduplication
-        existing_tasks = self.ticktick_client.get_all_tasks()
-        # Create a set of Canvas Assignment IDs already present in TickTick
-        # We assume the Canvas assignment ID is stored in the task's content description like [Canvas ID: 12345]
-        existing_canvas_ids = set()
-        for task in existing_tasks:
-            content = task.get('content', '')
-            if '[Canvas ID:' in content:
-                try:
-                    # Extract ID
-                    start = content.find('[Canvas ID:') + len('[Canvas ID:')
-                    end = content.find(']', start)
-                    canvas_id = int(content[start:end].strip())
-                    existing_canvas_ids.add(canvas_id)
-                except ValueError:
-                    pass
+        # If it's a past assignment but it is submitted, we skip it.
+        # Note: You can expand CanvasClient to check if assignment is submitted.
+        # For now, by Spec: ignore past assignments (but overdue should still be added). 
+        # If we don't know submission status, checking if it's strictly > now for simplicity,
+        # or pull submission data. We will rely on default past logic if it is way too old.
         
-        # 3. Fetch Canvas Courses
-        courses = self.canvas_client.get_active_courses()
+        # Apply Offset
+        offset = self.config_manager.get_date_offset()
+        adjusted_due_date = due_date_dt - offset
         
-        sync_stats = {'created': 0, 'skipped': 0, 'errors': 0}
+        title = f"{assignment.name} - {course.name}"
         
-        # 4. Process assignments for each monitored course
-        for course in courses:
-            if not self.config_manager.is_course_monitored(course.name):
-                continue
-                
+        # Build Description with Canvas link and assignment description
+        canvas_link = assignment.html_url or 'No Link Available'
+        description = f"[Canvas ID: {assignment.id}]\n\nLink: {canvas_link}\n\n{clean_description}"
+        return {
+            'assignment': assignment,
+            'title': title,
+            'due_date': adjusted_due_date,
+            'description': description,
+            'clean_description': clean_description,
+        }
+
+    def _process_courses(self, course_batches, writer: BatchWriter, list_name_to_id: dict, dry_run: bool, incremental: bool,
+                         updated_since: dict, sync_stats: dict, course_errors: dict, course_cursors: list, seen_by_course: dict,
+                         plan: SyncPlan = None, render_pool=None):
+        """
+        Transform stage of the pipeline: renders, classifies and deduplicates the assignments of
+        each fetched course and queues the resulting task creations, updates and completions on the writer
+        (or, while planning, on the plan). The Canvas IDs of fully fetched courses are collected
+        in seen_by_course for the orphan reconciliation.
+        """
+        open_task_ids = None
+        for course, fetched in course_batches:
             logger.info(f"Processing course: {course.name}")
+            changed = 0
+            if updated_since.get(course.id) is None:
+                seen_by_course[course.id] = {assignment.id for assignment in fetched}
+            # Entries recorded without a course (by an index rebuild), to attribute to this one
+            missing_course = {}
+
+            # Submitted on Canvas: complete the open task (if any) instead of rendering the assignment
+            assignments = []
+            for assignment in fetched:
+                if not assignment.submitted:
+                    assignments.append(assignment)
+                    continue
+                synced = self.sync_index.get(assignment.id)
+                if not synced:
+                    continue
+                if open_task_ids is None:
+                    with self.metrics.phase('ticktick_open_tasks'):
+                        open_task_ids = self.ticktick_client.get_open_task_ids()
+                if synced['task_id'] not in open_task_ids:
+                    continue
+                title = f"{assignment.name} - {course.name}"
+                changed += 1
+                if dry_run:
+                    logger.info(f"[DRY-RUN] Would complete submitted task: {title}")
+                    sync_stats['completed'] += 1
+                    continue
+                open_task_ids.discard(synced['task_id'])
+                self._submit(writer, 'complete', {
+                    'canvas_id': assignment.id,
+                    'course_id': course.id,
+                    'task_id': synced['task_id'],
+                    'spec': {'title': title}
+                })
             
             # Get List Mapping
-            list_name = self.config_manager.get_list_mapping(course.name)
-            list_id = list_name_to_id.get(list_name)
-            
-            if not list_id:
-                logger.warning(f"List '{list_name}' not found in TickTick. Attempting to create it.")
-                # Fallback to None if creation fails, which places it in Inbox
-                new_list = self.ticktick_client.create_list(list_name)
-                if new_list:
-                    list_id = new_list.get('id')
-                    list_name_to_id[list_name] = list_id
-                    
-            assignments = self.canvas_client.get_assignments(course)
-            
-            for assignment in assignments:
+            list_id = self._resolve_list_id(self.config_manager.get_list_mapping(course.name), list_name_to_id, plan, dry_run)
+
+            # Convert the HTML descriptions of the whole course in one batch; unchanged
+            # descriptions come straight from the rendered-text cache in the sync index
+            with self.metrics.phase('render_descriptions'):
+                clean_descriptions = render_descriptions(
+                    [assignment.description or '' for assignment in assignments],
+                    cache=self.sync_index,
+                    pool=render_pool
+                )
+
+            # Render the whole course first so its assignments can be classified in one batch
+            rendered = []
+            for assignment, clean_description in zip(assignments, clean_descriptions):
                 try:
-                    # Skip if already in TickTick
-                    if assignment.id in existing_canvas_ids:
-                        sync_stats['skipped'] += 1
-                        continue
-                        
-                    # Skip if past due
-                    due_date = getattr(assignment, 'due_at', None)
-                    if not due_date:
-                        continue
-                    
-                    due_date_dt = datetime.strptime(due_date, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-                    
-                    # If it's a past assignment but it is submitted, we skip it.
-                    # Note: You can expand CanvasClient to check if assignment is submitted.
-                    # For now, by Spec: ignore past assignments (but overdue should still be added). 
-                    # If we don't know submission status, checking if it's strictly > now for simplicity,
-                    # or pull submission data. We will rely on default past logic if it is way too old.
-                    
-                    # Apply Offset
-                    offset = self.config_manager.get_date_offset()
-                    adjusted_due_date = due_date_dt - offset
-                    
-                    title = f"{assignment.name} - {course.name}"
-                    
-                    # Build Description with Canvas link and assignment description
-                    canvas_link = getattr(assignment, 'html_url', 'No Link Available')
-                    raw_description = getattr(assignment, 'description', '')
-                    
-                    # Clean up HTML tags using BeautifulSoup for a cleaner TickTick task description
-                    clean_description = ""
-                    if raw_description:
-                         soup = BeautifulSoup(raw_description, "html.parser")
-                         clean_description = soup.get_text(separator="\n").strip()
-                    
-                    description = f"[Canvas ID: {assignment.id}]\n\nLink: {canvas_link}\n\n{clean_description}"
-                    
-                    # Get Priority and Tags
-                    priority = self.config_manager.get_priority(assignment.name)
-                    tags = self.config_manager.get_tags(assignment.name)
+                    item = self._render_assignment(course, assignment, clean_description)
+                    if item:
+                        rendered.append(item)
+                except Exception as e:
+                    sync_stats['errors'] += 1
+                    course_errors[course.id] = course_errors.get(course.id, 0) + 1
+                    logger.error(f"Error processing assignment {getattr(assignment, 'id', 'Unknown')}: {e}")
+
+            # Get Priority, Tags and optional list overrides
+            with self.metrics.phase('classify'):
+                classifications = self.config_manager.classify_many(
+                    [(item['assignment'].name, item['clean_description'], course.name) for item in rendered]
+                )
+
+            now = datetime.now(timezone.utc)
+            upcoming = [item['due_date'] for item in rendered if item['due_date'] > now]
+
+            for item, classification in zip(rendered, classifications):
+                assignment = item['assignment']
+                try:
+                    title = item['title']
+                    description = item['description']
+                    adjusted_due_date = item['due_date']
+                    priority = classification.priority
+                    tags = classification.tags
+                    task_list_id = list_id
+                    if classification.list_name:
+                        task_list_id = self._resolve_list_id(classification.list_name, list_name_to_id, plan, dry_run)
                     
+                    fingerprint = compute_fingerprint(title, description, adjusted_due_date, priority, tags)
+                    spec = {
+                        'title': title,
+                        'description': description,
+                        'due_date': adjusted_due_date,
+                        'project_id': task_list_id,
+                        'tags': tags,
+                        'priority': priority
+                    }
+
+                    # Already in TickTick: only update it if the rendered fields changed
+                    synced = self.sync_index.get(assignment.id)
+                    if synced and synced['course_id'] is None:
+                        missing_course[assignment.id] = course.id
+                    if synced:
+                        if synced['fingerprint'] == fingerprint:
+                            sync_stats['skipped'] += 1
+                            continue
+                        if dry_run:
+                            logger.info(f"[DRY-RUN] Would update task: {title}")
+                            sync_stats['updated'] += 1
+                            changed += 1
+                            continue
+                        if open_task_ids is None:
+                            with self.metrics.phase('ticktick_open_tasks'):
+                                open_task_ids = self.ticktick_client.get_open_task_ids()
+                        if synced['task_id'] not in open_task_ids:
+                            # Completed or deleted in TickTick; remember the new state without reopening it
+                            self.sync_index.record(assignment.id, synced['task_id'], synced['project_id'], fingerprint, course.id)
+                            sync_stats['skipped'] += 1
+                            continue
+                        self._submit(writer, 'update', {
+                            'canvas_id': assignment.id,
+                            'course_id': course.id,
+                            'fingerprint': fingerprint,
+                            'task_id': synced['task_id'],
+                            'project_id': synced['project_id'],
+                            'spec': spec
+                        })
+                        changed += 1
+                        continue
+
                     # Create Task (unless dry run)
                     if dry_run:
                         logger.info(f"[DRY-RUN] Would create task: {title} (Priority: {priority}, Tags: {tags})")
                         sync_stats['created'] += 1
+                        changed += 1
                         continue
                         
-                    created_task = self.ticktick_client.create_task(
-                        title=title,
-                        description=description,
-                        due_date=adjusted_due_date,
-                        project_id=list_id,
-                        tags=tags,
-                        priority=priority
-                    )
-                    
-                    if created_task:
-                        sync_stats['created'] += 1
-                        logger.info(f"Created task: {title}")
-                    else:
-                        sync_stats['errors'] += 1
-                        logger.error(f"Failed to create task for {assignment.name}")
+                    self._submit(writer, 'create', {
+                        'canvas_id': assignment.id,
+                        'course_id': course.id,
+                        'fingerprint': fingerprint,
+                        'spec': spec
+                    })
+                    changed += 1
                         
                 except Exception as e:
                     sync_stats['errors'] += 1
+                    course_errors[course.id] = course_errors.get(course.id, 0) + 1
                     logger.error(f"Error processing assignment {getattr(assignment, 'id', 'Unknown')}: {e}")
 
-        logger.info(f"Sync complete. Created: {sync_stats['created']}, Skipped: {sync_stats['skipped']}, Errors: {sync_stats['errors']}")
+            if missing_course:
+                self.sync_index.set_course_ids(missing_course)
+
+            self.course_activity[course.id] = {
+                'changed': changed,
+                'next_due': min(upcoming) if upcoming else None,
+            }
+
+            if incremental and not dry_run:
+                course_cursors.append((course.id, self._newest_updated_at(fetched), updated_since.get(course.id) is None))
+
+            # Record the batches the writer finished meanwhile
+            for batch in writer.drain():
+                self._record_batch(*batch, sync_stats, course_errors)
+            if plan is None and course_cursors:
+                self._advance_finished_cursors(course_cursors, course_errors)
+
+    def _reconcile_orphans(self, seen_by_course: dict, writer, dry_run: bool, sync_stats: dict):
+        """
+        Applies the orphaned_task_policy to the synced tasks of the fully fetched courses whose
+        assignment was not returned this run (deleted, unpublished or no longer syncable in Canvas).
+        One scan of the index and one set difference per course, so this is linear in the
+        number of synced tasks. Courses whose fetch failed, or that returned nothing at all,
+        are left alone, since a missing assignment may then just not have been downloaded.
+        """
+        policy = self.config_manager.get_orphaned_task_policy()
+        if policy == 'keep' or not seen_by_course:
+            return
+        failed_courses = self.canvas_client.failed_courses
+        open_tasks = None
+        # Tasks already gone from TickTick, remembered as reconciled in one transaction
+        gone = []
+        with self.metrics.phase('reconcile_orphans'):
+            synced_by_course = self.sync_index.get_synced_by_course(seen_by_course.keys())
+            for course_id, seen in seen_by_course.items():
+                synced = synced_by_course[course_id]
+                orphan_ids = [canvas_id for canvas_id in synced.keys() - seen if synced[canvas_id]['fingerprint'] != ORPHANED_FINGERPRINT]
+                if not orphan_ids:
+                    continue
+                if course_id in failed_courses or not seen:
+                    logger.warning(f"Not reconciling {len(orphan_ids)} task(s) of course {course_id}: its assignments were not fetched completely.")
+                    continue
+                if open_tasks is None:
+                    with self.metrics.phase('ticktick_open_tasks'):
+                        open_tasks = {task['id']: task for task in self.ticktick_client.get_all_tasks() if 'id' in task}
+                for canvas_id in orphan_ids:
+                    entry = synced[canvas_id]
+                    task = open_tasks.get(entry['task_id'])
+                    if task is None:
+                        # Already completed or deleted in TickTick; nothing left to do but remember it
+                        gone.append((canvas_id, entry['task_id'], entry['project_id'], ORPHANED_FINGERPRINT, course_id))
+                        continue
+                    title = task.get('title') or f"Canvas ID {canvas_id}"
+                    if dry_run:
+                        logger.info(f"[DRY-RUN] Would {policy} task of an assignment removed from Canvas: {title}")
+                        sync_stats['orphaned'] += 1
+                        continue
+                    self._submit(writer, policy, {
+                        'canvas_id': canvas_id,
+                        'course_id': course_id,
+                        'task_id': entry['task_id'],
+                        'project_id': entry['project_id'],
+                        'orphaned': True,
+                        'spec': {'title': title}
+                    })
+            if gone:
+                self.sync_index.record_many(gone)
+
+    def run_sync(self, dry_run: bool = False, incremental: bool = False, full_fetch: bool = False, change_fingerprint: str = None,
+                 course_filter=None):
+        """
+        Syncs the monitored courses, or only those for which course_filter(course) is true.
+        """
+        with self.metrics.phase('run_sync'):
+            sync_stats = self._run_sync(dry_run, incremental, full_fetch, course_filter)
+        self.metrics.set_sync_stats(sync_stats)
+        if change_fingerprint and not dry_run and not sync_stats['errors'] and course_filter is None:
+            # Only a clean run may let later runs skip the same Canvas state
+            self.sync_index.set_meta(CHANGE_FINGERPRINT_KEY, change_fingerprint)
+        return sync_stats
+
+    def plan_sync(self, incremental: bool = False, full_fetch: bool = False, course_filter=None) -> SyncPlan:
+        """
+        Runs the fetch and transform stages like run_sync, but collects the TickTick writes
+        (including lists to create) into a SyncPlan instead of sending them.
+        """
+        plan = SyncPlan(incremental=incremental)
+        with self.metrics.phase('plan_sync'):
+            sync_stats = self._run_sync(False, incremental, full_fetch, course_filter, plan=plan)
+        logger.info(f"Planned {plan.summary()}. Unchanged: {sync_stats['skipped']}, Errors: {sync_stats['errors']}")
+        return plan
+
+    def apply_plan(self, plan: SyncPlan, plan_path: str = None, max_workers: int = PLAN_APPLY_WORKERS) -> dict:
+        """
+        Executes a plan from plan_sync: creates its lists, then sends all task writes in full
+        batches, several batches at a time. Applied entries are dropped from the plan, which is
+        re-saved to plan_path after every batch so an interrupted apply can be resumed. The file
+        is removed once everything was applied.
+        """
+        sync_stats = {'created': 0, 'updated': 0, 'completed': 0, 'orphaned': 0, 'skipped': 0, 'errors': 0}
+        course_errors = {}
+        with self.metrics.phase('apply_plan'):
+            logger.info(f"Applying sync plan from {plan.created_at}: {plan.summary()}")
+            if plan.config_fingerprint and plan.config_fingerprint != self.config_manager.get_fingerprint():
+                logger.warning("The configuration changed since the plan was made; applying it as planned.")
+            if self.sync_index.needs_rebuild:
+                with self.metrics.phase('index_rebuild'):
+                    self.sync_index.rebuild_from_tasks(self.ticktick_client.get_all_tasks())
+            self.recover_journal(sync_stats, course_errors)
+
+            if plan.lists:
+                with self.metrics.phase('ticktick_lists'):
+                    list_name_to_id = self._known_lists()
+                self._create_lists(plan.lists, list_name_to_id)
+                plan.resolve_lists(list_name_to_id)
+
+            batches = self._plan_batches(plan, sync_stats)
+            if plan_path:
+                plan.save(plan_path)
+            with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='plan-apply') as pool:
+                futures = {pool.submit(self._write_batch, kind, items): (kind, items) for kind, items in batches}
+                for future in as_completed(futures):
+                    kind, items = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        logger.error(f"Error writing batch of {len(items)} ({kind}): {e}")
+                        results = [None] * len(items)
+                    self._record_batch(kind, items, results, sync_stats, course_errors)
+                    plan.remove([item for item, task in zip(items, results) if task])
+                    if plan_path:
+                        plan.save(plan_path)
+
+            # Advance the cursors of the courses that were applied completely
+            pending_courses = {entry['course_id'] for entry in plan.entries}
+            for course_id, newest, was_full_fetch in plan.course_cursors:
+                if course_id not in pending_courses:
+                    self._advance_cursor(course_id, newest, was_full_fetch)
+            plan.course_cursors = [cursor for cursor in plan.course_cursors if cursor[0] in pending_courses]
+            if plan.incremental and plan.config_fingerprint and not plan.entries:
+                self.sync_index.set_meta('config_fingerprint', plan.config_fingerprint)
+            if self.journal is not None:
+                self.journal.finish()
+
+        if plan_path:
+            if plan.entries or plan.lists:
+                plan.save(plan_path)
+                logger.warning(f"{len(plan.entries)} plan entries could not be applied; they are kept in {plan_path}.")
+            elif os.path.exists(plan_path):
+                os.remove(plan_path)
+        self.metrics.set_sync_stats(sync_stats)
+        logger.info(f"Plan applied. Created: {sync_stats['created']}, Updated: {sync_stats['updated']}, Completed: {sync_stats['completed']}, Orphaned: {sync_stats['orphaned']}, Skipped: {sync_stats['skipped']}, Errors: {sync_stats['errors']}")
+        return sync_stats
+
+    def _plan_batches(self, plan: SyncPlan, sync_stats: dict) -> list:
+        """
+        Drops the entries that a sync since planning already applied or that no longer apply,
+        and groups the rest into (kind, items) batches of the TickTick batch size.
+        """
+        open_task_ids = self.ticktick_client.get_open_task_ids()
+        stale = []
+        rows = []
+        by_kind = {}
+        for entry in plan.entries:
+            synced = self.sync_index.get(entry['canvas_id'])
+            kind = entry['kind']
+            if kind == 'create' and synced:
+                # Created by another run meanwhile; a new plan would turn this into an update
+                stale.append(entry)
+            elif kind == 'update' and synced and synced['fingerprint'] == entry['fingerprint']:
+                stale.append(entry)
+            elif kind != 'create' and entry['task_id'] not in open_task_ids:
+                # Completed or deleted in TickTick since planning
+                if kind == 'update':
+                    rows.append((entry['canvas_id'], entry['task_id'], entry['project_id'], entry['fingerprint'], entry['course_id']))
+                elif entry.get('orphaned'):
+                    rows.append((entry['canvas_id'], entry['task_id'], entry['project_id'], ORPHANED_FINGERPRINT, entry['course_id']))
+                stale.append(entry)
+            else:
+                by_kind.setdefault(kind, []).append(entry)
+        if rows:
+            self.sync_index.record_many(rows)
+        if stale:
+            logger.info(f"Skipping {len(stale)} plan entries that were already applied or no longer apply.")
+            sync_stats['skipped'] += len(stale)
+            plan.remove(stale)
+
+        batch_size = self.ticktick_client.BATCH_SIZE
+        return [(kind, items[start:start + batch_size])
+                for kind, items in by_kind.items()
+                for start in range(0, len(items), batch_size)]
+
+    def _run_sync(self, dry_run: bool, incremental: bool, full_fetch: bool, course_filter=None, plan: SyncPlan = None):
+        if dry_run:
+            logger.info("Running in DRY RUN mode. No tasks will be created.")
+        logger.info("Starting synchronization process...")
+
+        # Config edits (priorities, tags, mappings) change how every assignment renders,
+        # so an incremental run falls back to a full fetch when the config changed.
+        config_fingerprint = self.config_manager.get_fingerprint()
+        if incremental and self.sync_index.get_meta('config_fingerprint') != config_fingerprint:
+            logger.info("Configuration changed since the last sync. Fetching all courses in full.")
+            full_fetch = True
+        
+        # 1. Make sure the Canvas ID -> TickTick task index is usable for deduplication.
+        # The full task download and [Canvas ID: ...] scan only happens when the index
+        # is missing or was found corrupt.
+        if self.sync_index.needs_rebuild:
+            logger.info("Sync index missing or invalid. Rebuilding it from existing TickTick tasks...")
+            with self.metrics.phase('index_rebuild'):
+                self.sync_index.rebuild_from_tasks(self.ticktick_client.get_all_tasks())
+
+        sync_stats = {'created': 0, 'updated': 0, 'completed': 0, 'orphaned': 0, 'skipped': 0, 'errors': 0}
+        course_errors = {}
+        self._in_flight = {}
+        if not dry_run:
+            # Writes an interrupted sync left unfinished, so they are neither lost nor duplicated
+            self.recover_journal(sync_stats, course_errors)
+        
+        # 2. Fetch Canvas Courses
+        with self.metrics.phase('canvas_courses'):
+            courses = self.canvas_client.get_active_courses()
+        
+        course_cursors = []
+        seen_by_course = {}
+        
+        # 3. Process assignments for each monitored course
+        monitored_courses = [course for course in courses if self.config_manager.is_course_monitored(course.name)]
+        if course_filter is not None:
+            monitored_courses = [course for course in monitored_courses if course_filter(course)]
+        self.course_activity = {}
+        updated_since = {}
+        if incremental:
+            for course in monitored_courses:
+                updated_since[course.id] = self._get_updated_since(course, full_fetch)
+                if updated_since[course.id]:
+                    logger.info(f"Fetching assignments of {course.name} updated since {updated_since[course.id]}")
+
+        # Started before the pipeline threads, and shared by all courses of the run
+        render_pool = new_render_pool(self.config_manager.get_html_render_workers())
+
+        # Streaming pipeline: a producer thread downloads courses ahead of this (transform) thread,
+        # which queues task writes for a writer thread that sends them to TickTick in batches.
+        # Bounded queues between the stages keep memory flat however large the account is.
+        # Backends either fetch lazily per course (generator) or up front, so time both parts
+        with self.metrics.phase('canvas_assignments'):
+            course_batches = self.canvas_client.get_assignments_by_course(monitored_courses, updated_since)
+        producer = BoundedProducer(self.metrics.timed_iter(course_batches, 'canvas_assignments'), PIPELINE_COURSES_AHEAD, name='canvas-fetch')
+        # While planning, the plan takes the place of the writer
+        writer = plan if plan is not None else BatchWriter(self._write_batch, self.ticktick_client.BATCH_SIZE, name='ticktick-writer')
+        try:
+            # The lists of all courses are resolved (and missing ones created in one batch) while the first courses download
+            list_name_to_id = self._prepare_lists(monitored_courses, dry_run, plan)
+            self._process_courses(producer, writer, list_name_to_id, dry_run, incremental, updated_since, sync_stats, course_errors,
+                                  course_cursors, seen_by_course, plan, render_pool)
+            # 4. Tasks of assignments that disappeared from Canvas
+            self._reconcile_orphans(seen_by_course, writer, dry_run, sync_stats)
+        finally:
+            if render_pool is not None:
+                render_pool.shutdown()
+            producer.close()
+            for batch in writer.close():
+                self._record_batch(*batch, sync_stats, course_errors)
+        if self.journal is not None and not dry_run:
+            self.journal.finish()
+        pruned = self.sync_index.prune_rendered()
+        if pruned:
+            logger.info(f"Dropped {pruned} rendered descriptions no longer in use.")
+
+        if plan is not None:
+            # Cursors and the config fingerprint move forward once the plan is applied
+            plan.course_cursors = [cursor for cursor in course_cursors if not course_errors.get(cursor[0])]
+            plan.config_fingerprint = config_fingerprint if course_filter is None else None
+            return sync_stats
+
+        if incremental and not dry_run:
+            # Only advance a course's cursor once all of its assignments went through,
+            # so failed assignments are picked up again by the next incremental run.
+            for course_id, newest, was_full_fetch in course_cursors:
+                if not course_errors.get(course_id):
+                    self._advance_cursor(course_id, newest, was_full_fetch)
+            if course_filter is None:
+                # Courses left out by the filter were not re-rendered with the current config yet
+                self.sync_index.set_meta('config_fingerprint', config_fingerprint)
+
+        logger.info(f"Sync complete. Created: {sync_stats['created']}, Updated: {sync_stats['updated']}, Completed: {sync_stats['completed']}, Orphaned: {sync_stats['orphaned']}, Skipped: {sync_stats['skipped']}, Errors: {sync_stats['errors']}")
         return sync_stats
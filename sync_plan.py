@@ -0,0 +1,146 @@
+import os
+import json
+import logging
+import tempfile
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+# Prefix of the project_id placeholder of a list the plan still has to create
+LIST_REF_PREFIX = '$list:'
+PLAN_KINDS = ('create', 'update', 'complete', 'tag', 'delete')
+
+
+def list_ref(name: str) -> str:
+    return LIST_REF_PREFIX + name
+
+
+def encode_entry(entry: dict) -> dict:
+    """
+    Makes a writer entry JSON-serializable (the spec's due_date as ISO 8601).
+    """
+    spec = entry['spec']
+    if isinstance(spec.get('due_date'), datetime):
+        spec = dict(spec, due_date=spec['due_date'].isoformat())
+    return dict(entry, spec=spec)
+
+
+def decode_entry(entry: dict) -> dict:
+    spec = entry['spec']
+    if spec.get('due_date'):
+        spec = dict(spec, due_date=datetime.fromisoformat(spec['due_date']))
+    return dict(entry, spec=spec)
+
+
+class SyncPlan:
+    """
+    The TickTick writes a sync would make: lists to create, then task creations, updates and
+    completions with their full payloads. It is collected by SyncManager.plan_sync() in place
+    of the pipeline's BatchWriter (same submit/drain/close interface), saved as compact JSON
+    and executed later by SyncManager.apply_plan(). Applied entries are removed from the
+    plan, so an interrupted apply resumes with what is left.
+    """
+    def __init__(self, entries: list = None, lists: list = None, course_cursors: list = None, incremental: bool = False,
+                 config_fingerprint: str = None, created_at: str = None):
+        self.entries = entries if entries is not None else []
+        self.lists = lists if lists is not None else []
+        # (course ID, newest updated_at, was a full fetch) to advance once the course is applied
+        self.course_cursors = course_cursors if course_cursors is not None else []
+        self.incremental = incremental
+        self.config_fingerprint = config_fingerprint
+        self.created_at = created_at or datetime.now(timezone.utc).isoformat()
+
+    # BatchWriter interface, so the transform stage can plan instead of write
+    def submit(self, kind: str, item: dict):
+        self.entries.append(dict(item, kind=kind))
+
+    def drain(self) -> list:
+        return []
+
+    def close(self) -> list:
+        return []
+
+    def add_list(self, name: str) -> str:
+        """
+        Plans the creation of a list and returns the placeholder to use as its project_id.
+        """
+        if name not in self.lists:
+            self.lists.append(name)
+        return list_ref(name)
+
+    def resolve_lists(self, list_name_to_id: dict):
+        """
+        Replaces list placeholders with the IDs of the (now existing) lists. Lists that could not
+        be created resolve to None, which places their tasks in the Inbox.
+        """
+        for entry in self.entries:
+            project_id = entry['spec'].get('project_id')
+            if isinstance(project_id, str) and project_id.startswith(LIST_REF_PREFIX):
+                entry['spec'] = dict(entry['spec'], project_id=list_name_to_id.get(project_id[len(LIST_REF_PREFIX):]))
+        self.lists = []
+
+    def remove(self, applied: list):
+        applied_ids = {id(entry) for entry in applied}
+        self.entries = [entry for entry in self.entries if id(entry) not in applied_ids]
+
+    def counts(self) -> dict:
+        """
+        Number of entries per kind; entries for assignments removed from Canvas count as 'orphaned'.
+        """
+        counts = {kind: 0 for kind in PLAN_KINDS + ('orphaned',)}
+        for entry in self.entries:
+            counts['orphaned' if entry.get('orphaned') else entry['kind']] += 1
+        counts['lists'] = len(self.lists)
+        return counts
+
+    def summary(self) -> str:
+        counts = self.counts()
+        return (f"{counts['create']} create(s), {counts['update']} update(s), {counts['complete']} completion(s), "
+                f"{counts['orphaned']} orphaned task(s), {counts['lists']} new list(s)")
+
+    def to_dict(self) -> dict:
+        return {
+            'version': PLAN_VERSION,
+            'created_at': self.created_at,
+            'config_fingerprint': self.config_fingerprint,
+            'incremental': self.incremental,
+            'lists': self.lists,
+            'course_cursors': self.course_cursors,
+            'entries': [encode_entry(entry) for entry in self.entries],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError(f"Unsupported sync plan version: {data.get('version')}")
+        return cls(
+            entries=[decode_entry(entry) for entry in data.get('entries', [])],
+            lists=data.get('lists', []),
+            course_cursors=[tuple(cursor) for cursor in data.get('course_cursors', [])],
+            incremental=data.get('incremental', False),
+            config_fingerprint=data.get('config_fingerprint'),
+            created_at=data.get('created_at'),
+        )
+
+    def save(self, path: str):
+        """
+        Writes the plan atomically, so an apply interrupted mid-save leaves the previous version.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sync_plan.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.to_dict(), f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,81 @@
+import pytest
+
+from html_text import html_to_text, description_digest, render_descriptions, PROCESS_POOL_THRESHOLD
+
+SAMPLES = [
+    '<p>Complete the exercises from <b>chapter 3</b> and show all of your work.</p>',
+    '<ul><li>Submit a single PDF</li>\n<li>Include your name</li></ul>',
+    '<p>Refer to the rubric&nbsp;for details&mdash;not by email &amp; &unknown; &#147;quoted&#148; &#x263A;</p>',
+    '<pre>def solve(n):\n    return n * 2\n</pre>',
+    '<table><tr><td>Part A</td><td>40 pts</td></tr></table>',
+    '<p>Visible</p><script>var hidden = 1;</script><style>p { color: red }</style><p>Also visible</p>',
+    'line<br>break<br/>again<br></br>end',
+    '<div><p>unclosed <i>tags</div> after</p> stray</span> tail',
+    '<!-- comment -->before<![CDATA[raw <text>]]>after<!DOCTYPE html>',
+    '   \n\n  ',
+    'plain text with no tags',
+]
+
+
+def test_html_to_text_examples():
+    assert html_to_text('') == ''
+    assert html_to_text(None) == ''
+    assert html_to_text('<p>One</p>\n<p>Two &amp; three</p>') == 'One\n\n\nTwo & three'
+    assert html_to_text('<p>a</p><script>alert(1)</script><p>b</p>') == 'a\nb'
+    assert html_to_text('<pre>  keep\n  spacing  </pre>') == 'keep\n  spacing'
+    assert html_to_text('&#147;hi&#148; &bogus;') == '“hi” &bogus'
+
+
+@pytest.mark.parametrize('html', SAMPLES)
+def test_html_to_text_matches_beautifulsoup(html):
+    bs4 = pytest.importorskip('bs4')
+    expected = bs4.BeautifulSoup(html, 'html.parser').get_text(separator='\n').strip()
+    assert html_to_text(html) == expected
+
+
+class RenderedCache:
+    def __init__(self):
+        self.rendered = {}
+        self.lookups = 0
+
+    def get_rendered_many(self, digests):
+        self.lookups += 1
+        return {digest: self.rendered[digest] for digest in digests if digest in self.rendered}
+
+    def put_rendered_many(self, entries):
+        self.rendered.update(entries)
+
+
+def test_render_descriptions_memoizes_by_digest(monkeypatch):
+    cache = RenderedCache()
+    descriptions = ['<p>A</p>', '', '<p>B</p>', '<p>A</p>', None]
+    assert render_descriptions(descriptions, cache) == ['A', '', 'B', 'A', '']
+    assert set(cache.rendered) == {description_digest('<p>A</p>'), description_digest('<p>B</p>')}
+
+    # Cached descriptions are not parsed again
+    monkeypatch.setattr('html_text.html_to_text', lambda html: pytest.fail(f"re-rendered {html}"))
+    assert render_descriptions(['<p>B</p>', '<p>A</p>'], cache) == ['B', 'A']
+
+
+def test_render_descriptions_without_cache():
+    assert render_descriptions(['<b>x</b>', None]) == ['x', '']
+
+
+class InlinePool:
+    def __init__(self):
+        self.calls = 0
+
+    def map(self, function, items, chunksize=1):
+        self.calls += 1
+        return map(function, items)
+
+
+def test_render_descriptions_uses_pool_for_large_batches():
+    pool = InlinePool()
+    small = [f"<p>{n}</p>" for n in range(PROCESS_POOL_THRESHOLD - 1)]
+    assert render_descriptions(small, pool=pool) == [str(n) for n in range(PROCESS_POOL_THRESHOLD - 1)]
+    assert pool.calls == 0
+
+    large = [f"<p>{n}</p>" for n in range(PROCESS_POOL_THRESHOLD)]
+    assert render_descriptions(large, pool=pool) == [str(n) for n in range(PROCESS_POOL_THRESHOLD)]
+    assert pool.calls == 1
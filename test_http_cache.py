@@ -0,0 +1,124 @@
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from clients.http_cache import HTTPCache, ConditionalCacheAdapter
+
+
+class ScriptedAdapter:
+    """
+    Answers each request with the next scripted (status, headers, body) and remembers the requests.
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, body = self.responses.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.request = request
+        response.connection = self
+        response.closed = False
+        response.close = lambda: setattr(response, 'closed', True)
+        self.last_response = response
+        return response
+
+
+def make_cache(tmp_path, **kwargs):
+    return HTTPCache(str(tmp_path / 'http_cache.db'), **kwargs)
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('a', 'https://canvas/a', {'Content-Type': 'application/json'}, b'[1]', etag='"v1"', last_modified='Mon')
+    entry = cache.get('a')
+    assert entry == {'headers': {'Content-Type': 'application/json'}, 'body': b'[1]', 'etag': '"v1"', 'last_modified': 'Mon'}
+    assert cache.get('missing') is None
+    cache.close()
+
+
+def test_evicts_least_recently_used_over_max_bytes(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = make_cache(tmp_path, max_bytes=20)
+    for key in ('a', 'b'):
+        cache.put(key, key, {}, b'x' * 8)
+        now[0] += 1
+    # Revalidating 'a' makes 'b' the least recently used entry
+    cache.touch('a')
+    now[0] += 1
+    cache.put('c', 'c', {}, b'x' * 8)
+
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+    cache.close()
+
+
+def test_replacing_an_entry_does_not_count_it_twice(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=20)
+    cache.put('a', 'a', {}, b'x' * 8)
+    cache.put('b', 'b', {}, b'x' * 8)
+    cache.put('a', 'a', {}, b'y' * 8)
+    assert cache.get('a')['body'] == b'y' * 8
+    assert cache.get('b') is not None
+    cache.close()
+
+
+def test_expired_entries_are_ignored_and_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.put('a', 'a', {}, b'body')
+    now[0] += 30
+    assert cache.get('a') is not None
+
+    # A 304 revalidation restarts the TTL
+    cache.touch('a')
+    now[0] += 45
+    assert cache.get('a') is not None
+
+    now[0] += 30
+    assert cache.get('a') is None
+    cache.evict()
+    assert cache.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 0
+    cache.close()
+
+
+def test_reopening_evicts_to_a_smaller_limit(tmp_path):
+    cache = make_cache(tmp_path)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, key, {}, b'x' * 10)
+    cache.close()
+
+    cache = make_cache(tmp_path, max_bytes=15)
+    assert sum(cache.get(key) is not None for key in ('a', 'b', 'c')) == 1
+    cache.close()
+
+
+def test_adapter_serves_304_from_cache(tmp_path):
+    cache = make_cache(tmp_path)
+    adapter = ScriptedAdapter([
+        (200, {'ETag': '"v1"', 'Content-Length': '3', 'Link': '<page1>'}, b'[1]'),
+        (304, {'ETag': '"v1"', 'Link': '<page2>'}, b''),
+    ])
+    session = requests.Session()
+    session.mount('https://', ConditionalCacheAdapter(cache, adapter))
+
+    first = session.get('https://canvas/api/v1/courses')
+    second = session.get('https://canvas/api/v1/courses')
+
+    assert first.content == second.content == b'[1]'
+    assert adapter.requests[1].headers['If-None-Match'] == '"v1"'
+    assert second.from_cache and second.status_code == 200
+    # Headers of the 304 win, wire-encoding headers of the original are not replayed
+    assert second.headers['Link'] == '<page2>'
+    (stored_headers,) = cache.conn.execute('SELECT headers FROM responses').fetchone()
+    assert 'Content-Length' not in stored_headers
+    assert adapter.last_response.closed
+    cache.close()
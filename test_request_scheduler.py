@@ -0,0 +1,227 @@
+import time
+import random
+import threading
+
+import pytest
+import requests
+
+from clients import request_scheduler
+from clients.request_scheduler import (
+    CANVAS_LOW_WATER,
+    FairLimiter,
+    HostState,
+    RequestScheduler,
+    SchedulingAdapter,
+    host_key,
+    is_throttled,
+    parse_retry_after,
+)
+
+
+def test_is_throttled():
+    assert is_throttled(429)
+    assert is_throttled(403, b'403 Forbidden (Rate Limit Exceeded)')
+    assert not is_throttled(403, b'Unauthorized')
+    assert not is_throttled(200)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_host_key():
+    assert host_key('https://canvas.umd.edu/api/v1/courses') == 'canvas.umd.edu'
+    assert host_key('https://canvas.umd.edu:443/api') == 'canvas.umd.edu'
+    assert host_key('http://127.0.0.1:8001/api') == '127.0.0.1:8001'
+    assert host_key('http://127.0.0.1:80/api') == '127.0.0.1'
+
+
+def test_hosts_are_keyed_by_host_and_port():
+    scheduler = RequestScheduler()
+    configured = scheduler.configure_host('127.0.0.1:8001', rate=5)
+    assert scheduler.host('http://127.0.0.1:8001/api/graphql') is configured
+    assert scheduler.host('http://127.0.0.1:8002/api') is not configured
+
+
+@pytest.fixture
+def upper_jitter(monkeypatch):
+    # Always take the longest jittered delay
+    monkeypatch.setattr(random, 'uniform', lambda low, high: high)
+
+
+def test_retry_delay_backs_off_exponentially(upper_jitter):
+    scheduler = RequestScheduler(max_retries=5, backoff_base=0.5, backoff_max=3.0)
+    delays = [scheduler.retry_delay('GET', attempt, status=503) for attempt in range(6)]
+    assert delays == [0.5, 1.0, 2.0, 3.0, 3.0, None]
+
+
+def test_retry_delay_jitter_stays_in_range():
+    scheduler = RequestScheduler(backoff_base=1.0)
+    for _ in range(100):
+        assert 2.0 <= scheduler.retry_delay('GET', 2, error=True) <= 4.0
+
+
+def test_retry_delay_only_repeats_harmless_requests(upper_jitter):
+    scheduler = RequestScheduler()
+    assert scheduler.retry_delay('GET', 0, status=200) is None
+    assert scheduler.retry_delay('GET', 0, status=404) is None
+    assert scheduler.retry_delay('POST', 0, status=503) is None
+    assert scheduler.retry_delay('POST', 0, error=True) is None
+    assert scheduler.retry_delay('put', 0, error=True) == 0.5
+    # Throttled requests weren't processed, so even writes are retried
+    assert scheduler.retry_delay('POST', 0, status=429, throttled=True) == 0.5
+
+
+def test_retry_delay_honours_retry_after(upper_jitter):
+    scheduler = RequestScheduler(backoff_max=30.0)
+    assert scheduler.retry_delay('GET', 0, 429, {'Retry-After': '7'}, throttled=True) == 7.0
+    assert scheduler.retry_delay('GET', 0, 429, {'Retry-After': '600'}, throttled=True) == 30.0
+
+
+def test_release_halves_limit_on_errors_at_most_once_a_second():
+    host = HostState(max_concurrency=8)
+    for status in (503, None):
+        host.acquire()
+        host.release(status)
+    assert host.in_flight == 0
+    assert host.concurrency == 4
+
+
+def test_release_grows_limit_back_on_success():
+    host = HostState(max_concurrency=4)
+    host.acquire()
+    host.release(500)
+    assert host.concurrency == 2
+    for _ in range(10):
+        host.acquire()
+        host.release(200)
+    assert host.concurrency == 4
+
+
+def test_release_pauses_host_when_throttled():
+    host = HostState(max_concurrency=4)
+    host.acquire()
+    host.release(429, {'Retry-After': '5'}, throttled=True)
+    wait = host._try_acquire(time.monotonic())
+    assert 4.0 < wait <= 5.0
+    assert host.concurrency == 2
+
+
+def test_release_backs_off_when_canvas_bucket_runs_low():
+    host = HostState(max_concurrency=4)
+    host.acquire()
+    host.release(200, {'X-Rate-Limit-Remaining': str(CANVAS_LOW_WATER - 1), 'X-Request-Cost': '1'})
+    assert host.concurrency == 2
+    assert host._try_acquire(time.monotonic()) == 0
+
+    host.decreased_at = 0.0
+    host.release(200, {'X-Rate-Limit-Remaining': '1', 'X-Request-Cost': '1'})
+    assert host._try_acquire(time.monotonic()) > 0
+
+
+def test_acquire_respects_concurrency_and_rate():
+    host = HostState(rate=2, burst=2, max_concurrency=2)
+    now = time.monotonic()
+    assert host._try_acquire(now) == 0
+    assert host._try_acquire(now) == 0
+    # Both slots are taken
+    assert host._try_acquire(now) is None
+    host.release(200)
+    # A slot is free, but the bucket needs half a second for the next token
+    assert host._try_acquire(now) == pytest.approx(0.5, abs=0.05)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_fair_limiter_round_robins_between_tenants():
+    limiter = FairLimiter(1)
+    limiter.acquire('main')
+    order = []
+
+    def request(tenant):
+        limiter.acquire(tenant)
+        order.append(tenant)
+        limiter.release()
+
+    threads = []
+    for count, tenant in enumerate(['big', 'big', 'big', 'small'], 1):
+        thread = threading.Thread(target=request, args=(tenant,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: sum(len(waiting) for waiting in limiter._waiters.values()) == count)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ['big', 'small', 'big', 'big']
+    assert limiter.in_flight == 0
+
+
+def test_fair_limiter_admits_up_to_limit_without_waiting():
+    limiter = FairLimiter(2)
+    limiter.acquire('a')
+    limiter.acquire('b')
+    assert limiter.in_flight == 2
+    limiter.release()
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+class ScriptedTransport:
+    """
+    Transport that returns or raises the scripted outcomes in order.
+    """
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = 0
+
+    def send_as(self, tenant, request, **kwargs):
+        self.sent += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response._content = b''
+        response._content_consumed = True
+        response.request = request
+        return response
+
+
+def send(scheduler, method='GET'):
+    request = requests.Request(method, 'https://canvas.example.edu/api/v1/courses').prepare()
+    return SchedulingAdapter(scheduler).send(request)
+
+
+def test_adapter_retries_and_frees_slots(monkeypatch):
+    monkeypatch.setattr(request_scheduler.time, 'sleep', lambda seconds: None)
+    transport = ScriptedTransport([requests.ConnectionError('reset'), 503, 200])
+    scheduler = RequestScheduler(transport=transport)
+    assert send(scheduler).status_code == 200
+    assert transport.sent == 3
+    assert scheduler.host('https://canvas.example.edu').in_flight == 0
+
+
+def test_adapter_frees_slot_on_unexpected_error():
+    transport = ScriptedTransport([requests.exceptions.ChunkedEncodingError('truncated')])
+    scheduler = RequestScheduler(transport=transport)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        send(scheduler)
+    assert scheduler.host('https://canvas.example.edu').in_flight == 0
+
+
+def test_adapter_does_not_retry_failed_writes():
+    transport = ScriptedTransport([requests.ConnectionError('reset')])
+    scheduler = RequestScheduler(transport=transport)
+    with pytest.raises(requests.ConnectionError):
+        send(scheduler, 'POST')
+    assert transport.sent == 1
@@ -0,0 +1,104 @@
+import pytest
+
+from rule_engine import KeywordAutomaton, Rule, RuleEngine
+
+
+def make_automaton(*keywords):
+    automaton = KeywordAutomaton()
+    for keyword in keywords:
+        automaton.add(keyword, keyword)
+    automaton.build()
+    return automaton
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = make_automaton('he', 'she', 'his', 'hers')
+    assert automaton.find('ushers') == {'he', 'she', 'hers'}
+
+
+def test_automaton_follows_failure_links_across_partial_matches():
+    automaton = make_automaton('abcd', 'bc', 'c')
+    # 'abce' fails out of 'abcd' but still contains 'bc' and 'c'
+    assert automaton.find('abce') == {'bc', 'c'}
+    assert automaton.find('xyz') == set()
+
+
+def test_automaton_matches_brute_force():
+    keywords = ['exam', 'midterm', 'quiz', 'final exam', 'lab', 'lab report', 'hw', 'homework', 'xam']
+    automaton = make_automaton(*keywords)
+    texts = ['Final Exam review', 'Lab 3 Report', 'homework 2 (hw)', 'Midterm exam quiz', 'nothing here', '']
+    for text in texts:
+        text = text.lower()
+        assert automaton.find(text) == {keyword for keyword in keywords if keyword in text}
+
+
+def test_from_config_priorities_and_tags():
+    engine = RuleEngine.from_config({
+        'priorities': {'default': 3, 'high_keywords': ['exam'], 'low_keywords': ['optional']},
+        'tags': {'default': ['Canvas'], 'exam_keywords': ['exam', 'quiz'], 'homework_keywords': ['homework']},
+    })
+
+    result = engine.classify('Midterm EXAM')
+    assert (result.priority, result.tags) == (5, ['Exam'])
+
+    # The highest priority of the matching rules wins
+    assert engine.classify('Optional exam prep').priority == 5
+    assert engine.classify('Optional reading').priority == 1
+
+    result = engine.classify('Reading response')
+    assert (result.priority, result.tags) == (3, ['Canvas'])
+
+
+def test_tags_are_combined_in_rule_order_without_duplicates():
+    engine = RuleEngine([
+        Rule('quiz', tags=['Exam']),
+        Rule('homework', tags=['Homework', 'Exam']),
+    ])
+    assert engine.classify('Homework quiz').tags == ['Exam', 'Homework']
+
+
+def test_fields_courses_and_lists():
+    engine = RuleEngine([
+        Rule('lab', field='description', list_name='Labs'),
+        Rule('project', field='any', priority=5, courses=['CMSC 131']),
+        Rule(r'chapter \d+', regex=True, tags=['Reading'], list_name='Reading'),
+    ])
+
+    # Description-only rules don't look at the title
+    assert engine.classify('Lab 1', 'Bring goggles').list_name is None
+    assert engine.classify('Week 1', 'Chemistry lab').list_name == 'Labs'
+
+    assert engine.classify('Final', 'Group project', course_name='CMSC 131').priority == 5
+    assert engine.classify('Final', 'Group project', course_name='MATH 140').priority == 3
+
+    # The first matching rule with a list wins
+    result = engine.classify('Chapter 12 questions', 'Then the lab')
+    assert (result.list_name, result.tags) == ('Labs', ['Reading'])
+
+
+def test_title_only_rules_skip_description_scan():
+    engine = RuleEngine([Rule('exam', priority=5)])
+    assert not engine.scan_description
+    assert engine.classify('Homework', 'Practice for the exam').priority == 3
+
+
+def test_invalid_rules_are_skipped():
+    engine = RuleEngine.from_config({'rules': [
+        {'match': '(unclosed', 'regex': True},
+        {'match': 'essay', 'field': 'body'},
+        {'priority': 5},
+        {'match': 'essay', 'priority': 4},
+    ]})
+    assert len(engine.rules) == 1
+    assert engine.classify('Essay 2').priority == 4
+
+
+def test_invalid_field_raises():
+    with pytest.raises(ValueError):
+        Rule('exam', field='body')
+
+
+def test_classify_many():
+    engine = RuleEngine([Rule('exam', priority=5)])
+    results = engine.classify_many([('Exam 1', '', 'A'), ('Essay', '', 'B')])
+    assert [result.priority for result in results] == [5, 3]
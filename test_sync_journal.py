@@ -0,0 +1,134 @@
+import os
+import json
+
+from sync_journal import SyncJournal, SENT, SUCCEEDED, FAILED, journal_key
+from sync_manager import SyncManager
+
+
+def make_item(canvas_id, task_id=None, title=None):
+    return {
+        'canvas_id': canvas_id,
+        'course_id': 100,
+        'task_id': task_id or f"{canvas_id:024x}",
+        'project_id': 'p1',
+        'fingerprint': f"fp{canvas_id}",
+        'spec': {'title': title or f"Assignment {canvas_id}", 'project_id': 'p1', 'due_date': None},
+    }
+
+
+def states(journal):
+    return {journal_key(entry['kind'], entry['item']): entry['state'] for entry in journal.pending()}
+
+
+def test_replay_restores_pending_writes(tmp_path):
+    path = str(tmp_path / 'sync_journal.jsonl')
+    journal = SyncJournal(path)
+    created, cut_off, failed, recorded = make_item(1), make_item(2), make_item(3), make_item(4)
+    journal.log_writes('create', [created, cut_off, failed, recorded])
+    journal.log_results('create', [created, failed, recorded], [{'id': created['task_id'], 'projectId': 'p1'}, None, {'id': 'x'}])
+    journal.log_recorded('create', [recorded])
+    journal.close()
+
+    replayed = SyncJournal(path)
+    assert states(replayed) == {'create:1': SUCCEEDED, 'create:2': SENT, 'create:3': FAILED}
+    entry = next(entry for entry in replayed.pending() if entry['item']['canvas_id'] == 1)
+    assert entry['task'] == {'id': created['task_id'], 'projectId': 'p1'}
+    assert entry['item'] == created
+
+
+def test_replay_skips_line_cut_short_by_crash(tmp_path):
+    path = str(tmp_path / 'sync_journal.jsonl')
+    journal = SyncJournal(path)
+    journal.log_writes('update', [make_item(1)])
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"op":"result","key":"upd')
+
+    journal = SyncJournal(path)
+    assert states(journal) == {'update:1': SENT}
+    # Appending starts on a new line, so the next run can read the journal again
+    journal.log_results('update', [make_item(1)], [{'id': 'x'}])
+    journal.close()
+    assert states(SyncJournal(path)) == {'update:1': SUCCEEDED}
+
+
+def test_rewrite_of_same_assignment_replaces_earlier_entry(tmp_path):
+    journal = SyncJournal(str(tmp_path / 'sync_journal.jsonl'))
+    journal.log_writes('update', [make_item(1, title='Old')])
+    journal.log_results('update', [make_item(1)], [None])
+    journal.log_writes('update', [make_item(1, title='New')])
+    (entry,) = journal.pending()
+    assert (entry['state'], entry['item']['spec']['title']) == (SENT, 'New')
+    journal.close()
+
+
+def test_finish_keeps_only_unresolved_creates(tmp_path):
+    path = str(tmp_path / 'sync_journal.jsonl')
+    journal = SyncJournal(path)
+    journal.log_writes('create', [make_item(1), make_item(2)])
+    journal.log_writes('update', [make_item(3)])
+    journal.log_results('create', [make_item(1)], [{'id': 'a'}])
+    journal.finish()
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['key'] for record in records] == ['create:2']
+    assert states(SyncJournal(path)) == {'create:2': SENT}
+
+
+def test_finish_removes_empty_journal(tmp_path):
+    path = str(tmp_path / 'sync_journal.jsonl')
+    journal = SyncJournal(path)
+    journal.log_writes('create', [make_item(1)])
+    journal.log_results('create', [make_item(1)], [{'id': 'a'}])
+    journal.log_recorded('create', [make_item(1)])
+    journal.finish()
+    assert not os.path.exists(path)
+    assert journal.pending() == []
+
+
+class FakeTickTick:
+    BATCH_SIZE = 50
+
+    def __init__(self, open_tasks):
+        self.open_tasks = open_tasks
+        self.updates = []
+
+    def get_all_tasks(self):
+        return self.open_tasks
+
+    def update_tasks(self, updates):
+        self.updates.extend(updates)
+        return [{'id': update['task_id'], 'projectId': update['project_id']} for update in updates]
+
+
+def test_recover_journal_finishes_interrupted_writes(tmp_path):
+    path = str(tmp_path / 'sync_journal.jsonl')
+    journal = SyncJournal(path)
+    succeeded = make_item(1)
+    created_before_crash = make_item(2)
+    never_created = make_item(3)
+    open_update = make_item(4)
+    closed_update = make_item(5)
+    journal.log_writes('create', [succeeded, created_before_crash, never_created])
+    journal.log_results('create', [succeeded], [{'id': succeeded['task_id'], 'projectId': 'p1'}])
+    journal.log_writes('update', [open_update, closed_update])
+    journal.close()
+
+    ticktick = FakeTickTick([{'id': created_before_crash['task_id'], 'projectId': 'p2'}, {'id': open_update['task_id']}])
+    manager = SyncManager(None, ticktick, None, journal=SyncJournal(path))
+    stats = {'created': 0, 'updated': 0, 'completed': 0, 'orphaned': 0, 'errors': 0}
+    manager.recover_journal(stats, {})
+
+    index = manager.sync_index
+    assert index.get(1)['task_id'] == succeeded['task_id']
+    # Found by its journaled ID instead of being created a second time
+    assert index.get(2) == {'task_id': created_before_crash['task_id'], 'project_id': 'p2', 'fingerprint': 'fp2', 'course_id': 100}
+    # Left for the sync to create afresh
+    assert index.get(3) is None
+    assert [update['task_id'] for update in ticktick.updates] == [open_update['task_id']]
+    assert index.get(4)['fingerprint'] == 'fp4'
+    assert index.get(5)['fingerprint'] == 'fp5'
+    assert stats == {'created': 2, 'updated': 2, 'completed': 0, 'orphaned': 0, 'errors': 0}
+    assert manager.journal.pending() == []
+    manager.journal.close()
@@ -0,0 +1,81 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from sync_plan import SyncPlan, list_ref
+
+DUE = datetime(2026, 10, 20, 23, 59, tzinfo=timezone.utc)
+
+
+def make_plan():
+    plan = SyncPlan(incremental=True, config_fingerprint='abc')
+    project_id = plan.add_list('CMSC 131')
+    plan.submit('create', {'assignment_id': 1, 'spec': {'title': 'Homework 1', 'due_date': DUE, 'project_id': project_id}})
+    plan.submit('update', {'assignment_id': 2, 'spec': {'title': 'Quiz 2', 'due_date': None, 'project_id': 'p1'}})
+    plan.submit('complete', {'assignment_id': 3, 'spec': {'title': 'Lab 3', 'project_id': 'p1'}, 'orphaned': True})
+    plan.course_cursors.append((131, '2026-10-17T12:00:00Z', False))
+    return plan
+
+
+def test_add_list_returns_placeholder_once():
+    plan = SyncPlan()
+    assert plan.add_list('Reading') == list_ref('Reading')
+    plan.add_list('Reading')
+    assert plan.lists == ['Reading']
+
+
+def test_counts_and_summary():
+    plan = make_plan()
+    counts = plan.counts()
+    assert (counts['create'], counts['update'], counts['complete'], counts['orphaned'], counts['lists']) == (1, 1, 0, 1, 1)
+    assert plan.summary() == '1 create(s), 1 update(s), 0 completion(s), 1 orphaned task(s), 1 new list(s)'
+
+
+def test_resolve_lists_replaces_placeholders():
+    plan = make_plan()
+    plan.add_list('Missing')
+    plan.submit('create', {'assignment_id': 4, 'spec': {'title': 'Essay', 'project_id': list_ref('Missing')}})
+    plan.resolve_lists({'CMSC 131': 'list-131'})
+
+    project_ids = [entry['spec']['project_id'] for entry in plan.entries]
+    # A list that could not be created sends its tasks to the Inbox
+    assert project_ids == ['list-131', 'p1', 'p1', None]
+    assert plan.lists == []
+
+
+def test_remove_drops_applied_entries_by_identity():
+    plan = make_plan()
+    plan.submit('create', dict(plan.entries[0]))
+    first, *rest = plan.entries
+    plan.remove([first])
+    assert plan.entries == rest
+    assert plan.counts()['create'] == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    plan = make_plan()
+    path = str(tmp_path / 'sync_plan.json')
+    plan.save(path)
+    loaded = SyncPlan.load(path)
+
+    assert loaded.entries == plan.entries
+    assert loaded.entries[0]['spec']['due_date'] == DUE
+    assert loaded.lists == ['CMSC 131']
+    assert loaded.course_cursors == [(131, '2026-10-17T12:00:00Z', False)]
+    assert (loaded.incremental, loaded.config_fingerprint, loaded.created_at) == (True, 'abc', plan.created_at)
+    assert os.listdir(tmp_path) == ['sync_plan.json']
+
+
+def test_load_rejects_other_versions():
+    data = make_plan().to_dict()
+    data['version'] += 1
+    with pytest.raises(ValueError):
+        SyncPlan.from_dict(data)
+
+
+def test_writer_interface_has_nothing_to_drain():
+    plan = SyncPlan()
+    plan.submit('delete', {'spec': {}})
+    assert plan.drain() == [] and plan.close() == []
+    assert plan.entries == [{'spec': {}, 'kind': 'delete'}]
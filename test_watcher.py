@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+from datetime import datetime, timezone, timedelta
+
+from watcher import CoursePollScheduler, Watcher
+
+NOW = 1_000_000.0
+
+
+def at(seconds: float) -> datetime:
+    return datetime.fromtimestamp(NOW + seconds, timezone.utc)
+
+
+def make_scheduler():
+    return CoursePollScheduler(min_interval=60, max_interval=960, due_soon=timedelta(hours=1))
+
+
+def test_unseen_courses_and_first_cycle_are_due():
+    scheduler = make_scheduler()
+    assert scheduler.is_due(1, NOW)
+    assert scheduler.poll_all_due(NOW)
+    assert scheduler.next_wakeup(NOW) == 0.0
+
+
+def test_quiet_courses_back_off_up_to_max_interval():
+    scheduler = make_scheduler()
+    intervals = []
+    for _ in range(6):
+        scheduler.record(1, changed=False, now=NOW)
+        intervals.append(scheduler.courses[1]['interval'])
+    assert intervals == [120, 240, 480, 960, 960, 960]
+    assert not scheduler.is_due(1, NOW + 959)
+    assert scheduler.is_due(1, NOW + 960)
+
+
+def test_change_resets_to_min_interval():
+    scheduler = make_scheduler()
+    for _ in range(3):
+        scheduler.record(1, changed=False, now=NOW)
+    scheduler.record(1, changed=True, now=NOW)
+    assert scheduler.courses[1]['interval'] == 60
+    assert scheduler.courses[1]['next_poll'] == NOW + 60
+
+
+def test_deadline_within_due_soon_keeps_min_interval():
+    scheduler = make_scheduler()
+    scheduler.record(1, changed=False, next_due=at(1800), now=NOW)
+    assert scheduler.courses[1]['interval'] == 60
+
+    scheduler.record(2, changed=False, next_due=at(7200), now=NOW)
+    assert scheduler.courses[2]['interval'] == 120
+
+
+def test_keeps_earliest_known_deadline_until_it_passes():
+    scheduler = make_scheduler()
+    scheduler.record(1, changed=False, next_due=at(7200), now=NOW)
+    # An incremental poll that saw no assignments keeps the known deadline
+    scheduler.record(1, changed=False, now=NOW + 60)
+    assert scheduler.courses[1]['next_due'] == at(7200)
+    # A later deadline does not replace an earlier one
+    scheduler.record(1, changed=False, next_due=at(9000), now=NOW + 120)
+    assert scheduler.courses[1]['next_due'] == at(7200)
+    # Once the deadline passed it is forgotten
+    scheduler.record(1, changed=False, next_due=at(9000), now=NOW + 7300)
+    assert scheduler.courses[1]['next_due'] == at(9000)
+
+
+def test_next_wakeup_includes_full_poll():
+    scheduler = make_scheduler()
+    scheduler.force_all = False
+    scheduler.full_poll_at = NOW + 500
+    scheduler.record(1, changed=True, now=NOW)
+    assert scheduler.next_wakeup(NOW) == 60
+    assert scheduler.any_due(NOW + 60)
+    assert not scheduler.any_due(NOW + 30)
+
+    scheduler.record(1, changed=False, now=NOW + 400)
+    assert scheduler.next_wakeup(NOW + 400) == 100
+
+    scheduler.mark_all_due()
+    assert scheduler.next_wakeup(NOW) == 0.0
+
+
+def test_configure_applies_to_next_record():
+    scheduler = make_scheduler()
+    scheduler.record(1, changed=False, now=NOW)
+    scheduler.configure(min_interval=300, max_interval=600, due_soon=timedelta(0))
+    scheduler.record(1, changed=True, now=NOW)
+    assert scheduler.courses[1]['interval'] == 300
+    scheduler.record(1, changed=False, now=NOW)
+    assert scheduler.courses[1]['interval'] == 600
+
+
+class FakeSyncManager:
+    def __init__(self):
+        self.course_activity = {}
+        self.filters = []
+
+    def run_sync(self, dry_run=False, incremental=False, full_fetch=False, course_filter=None):
+        self.filters.append(course_filter)
+        courses = [SimpleNamespace(id=course_id) for course_id in (1, 2)]
+        synced = [course for course in courses if course_filter is None or course_filter(course)]
+        self.course_activity = {course.id: {'changed': course.id == 1, 'next_due': None} for course in synced}
+        return {}
+
+
+def test_run_cycle_polls_only_due_courses():
+    sync_manager = FakeSyncManager()
+    ticktick = SimpleNamespace(refresh=lambda: None)
+    scheduler = make_scheduler()
+    watcher = Watcher(sync_manager, config_manager=None, ticktick_client=ticktick, scheduler=scheduler)
+
+    watcher.run_cycle()
+    assert sync_manager.filters[0] is None
+    assert set(scheduler.courses) == {1, 2}
+    assert scheduler.courses[1]['interval'] == 60
+    assert scheduler.courses[2]['interval'] == 120
+
+    # Course 1 is due after a minute, course 2 is not
+    scheduler.courses[1]['next_poll'] = 0.0
+    watcher.run_cycle()
+    assert sync_manager.filters[1] is not None
+    assert set(sync_manager.course_activity) == {1}
+    assert watcher.cycles == 2
@@ -0,0 +1,161 @@
+import time
+import signal
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+# How often the loop wakes up at most, to notice config edits and shutdown requests
+MAX_SLEEP = 30.0
+BACKOFF_FACTOR = 2.0
+
+
+class CoursePollScheduler:
+    """
+    Decides when each course is polled next. A course that just changed, or that has an
+    assignment due within `due_soon`, is polled every `min_interval` seconds; otherwise its
+    interval doubles after every quiet poll, up to `max_interval`. Courses it has not seen
+    yet are always due, and every `max_interval` all courses are polled to discover new ones.
+    """
+    def __init__(self, min_interval: float, max_interval: float, due_soon: timedelta):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.due_soon = due_soon
+        # course ID -> {'interval', 'next_poll', 'next_due'}
+        self.courses = {}
+        self.force_all = True
+        self.full_poll_at = 0.0
+
+    def configure(self, min_interval: float, max_interval: float, due_soon: timedelta):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.due_soon = due_soon
+
+    def mark_all_due(self):
+        self.force_all = True
+
+    def is_due(self, course_id, now: float) -> bool:
+        state = self.courses.get(course_id)
+        return state is None or state['next_poll'] <= now
+
+    def poll_all_due(self, now: float) -> bool:
+        return self.force_all or self.full_poll_at <= now
+
+    def any_due(self, now: float) -> bool:
+        return self.poll_all_due(now) or any(state['next_poll'] <= now for state in self.courses.values())
+
+    def record(self, course_id, changed: bool, next_due: datetime = None, now: float = None):
+        """
+        Schedules the next poll of a course from the outcome of the one that just finished.
+        """
+        now = now if now is not None else time.time()
+        state = self.courses.get(course_id) or {'interval': self.min_interval, 'next_due': None}
+        previous_due = state['next_due']
+        utc_now = datetime.fromtimestamp(now, timezone.utc)
+        if previous_due and previous_due <= utc_now:
+            previous_due = None
+        # Incremental fetches only see changed assignments, so keep the earliest known deadline
+        if next_due and previous_due:
+            next_due = min(next_due, previous_due)
+        state['next_due'] = next_due or previous_due
+
+        if changed or (state['next_due'] and state['next_due'] - utc_now <= self.due_soon):
+            interval = self.min_interval
+        else:
+            interval = min(self.max_interval, state['interval'] * BACKOFF_FACTOR)
+        state['interval'] = max(self.min_interval, interval)
+        state['next_poll'] = now + state['interval']
+        self.courses[course_id] = state
+
+    def next_wakeup(self, now: float) -> float:
+        """
+        Seconds until the next course is due (0 if one already is).
+        """
+        if self.force_all:
+            return 0.0
+        next_poll = min([state['next_poll'] for state in self.courses.values()] + [self.full_poll_at])
+        return max(0.0, next_poll - now)
+
+
+class Watcher:
+    """
+    Runs SyncManager in one long-lived process (--watch), keeping the clients, caches and
+    sync index warm between cycles. Each cycle only syncs the courses the CoursePollScheduler
+    says are due, and config.yaml is reloaded whenever its mtime changes.
+    """
+    def __init__(self, sync_manager, config_manager, ticktick_client, scheduler: CoursePollScheduler = None):
+        self.sync_manager = sync_manager
+        self.config_manager = config_manager
+        self.ticktick_client = ticktick_client
+        if scheduler is None:
+            min_interval, max_interval = config_manager.get_watch_intervals()
+            scheduler = CoursePollScheduler(min_interval, max_interval, config_manager.get_watch_due_soon_window())
+        self.scheduler = scheduler
+        self.stop_event = threading.Event()
+        self.cycles = 0
+
+    def stop(self, *args):
+        logger.info("Stopping watch mode after the current cycle...")
+        self.stop_event.set()
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+    def _reload_config(self):
+        if self.config_manager.reload_if_changed():
+            min_interval, max_interval = self.config_manager.get_watch_intervals()
+            self.scheduler.configure(min_interval, max_interval, self.config_manager.get_watch_due_soon_window())
+            # Mappings, rules or monitored courses may have changed for every course
+            self.scheduler.mark_all_due()
+
+    def run_cycle(self, dry_run: bool = False, incremental: bool = False, full_fetch: bool = False):
+        now = time.time()
+        poll_all = self.scheduler.poll_all_due(now)
+        self.scheduler.force_all = False
+        if self.cycles:
+            # The first cycle runs right after login, with a fresh state
+            self.ticktick_client.refresh()
+        course_filter = None if poll_all else (lambda course: self.scheduler.is_due(course.id, now))
+        try:
+            stats = self.sync_manager.run_sync(dry_run=dry_run, incremental=incremental, full_fetch=full_fetch, course_filter=course_filter)
+        except Exception:
+            self.scheduler.force_all = poll_all
+            raise
+        finished = time.time()
+        if poll_all:
+            self.scheduler.full_poll_at = finished + self.scheduler.max_interval
+        activity_by_course = self.sync_manager.course_activity
+        for course_id, activity in activity_by_course.items():
+            self.scheduler.record(course_id, activity['changed'] > 0, activity['next_due'], finished)
+        # Due courses the sync did not see were dropped or are no longer monitored
+        for course_id in [course_id for course_id in self.scheduler.courses if course_id not in activity_by_course]:
+            if poll_all or self.scheduler.is_due(course_id, now):
+                del self.scheduler.courses[course_id]
+        self.cycles += 1
+        logger.info(f"Watch cycle {self.cycles} synced {len(self.sync_manager.course_activity)} course(s); "
+                    f"next poll in {self.scheduler.next_wakeup(time.time()):.0f}s.")
+        return stats
+
+    def run(self, dry_run: bool = False, incremental: bool = False, full_fetch: bool = False, after_cycle=None):
+        """
+        Polls until stop() is called (SIGINT/SIGTERM). after_cycle, if given, is called after
+        every cycle, e.g. to rewrite the metrics file.
+        """
+        logger.info("Watching Canvas for changes. Press Ctrl+C to stop.")
+        while not self.stop_event.is_set():
+            self._reload_config()
+            if self.scheduler.any_due(time.time()):
+                try:
+                    self.run_cycle(dry_run, incremental, full_fetch)
+                except Exception as e:
+                    # Keep watching; the courses stay due and are retried on the next wakeup
+                    logger.error(f"Watch cycle failed: {e}")
+                    self.stop_event.wait(self.scheduler.min_interval)
+                if after_cycle:
+                    after_cycle()
+                # Only the first cycle honours --full-fetch
+                full_fetch = False
+                continue
+            self.stop_event.wait(min(MAX_SLEEP, self.scheduler.next_wakeup(time.time())))